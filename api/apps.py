@@ -1,6 +1,20 @@
+import os
+import sys
+
 from django.apps import AppConfig
 
 
 class ApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "api"
+
+    def ready(self):
+        from django.conf import settings
+        if not getattr(settings, "WARMUP_ON_START", False):
+            return
+        # only in processes that serve requests: not migrate & co, not runserver's reloader parent
+        if os.path.basename(sys.argv[0]) == "manage.py":
+            if sys.argv[1:2] != ["runserver"] or os.environ.get("RUN_MAIN") != "true":
+                return
+        from .warmup import start_background_warmup
+        start_background_warmup([n.strip() for n in settings.WARMUP_MODELS.split(",") if n.strip()])
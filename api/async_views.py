@@ -0,0 +1,113 @@
+# api/async_views.py
+"""
+Native async versions of the search, upload and ask views for ASGI
+deployments (ASYNC_VIEWS=True, served by backend.asgi). Upstream calls
+(Vision, OpenAI, SerpAPI) are awaited so one worker can hold many requests
+that are waiting on them. CPU-bound NER runs in a thread.
+
+The DRF views in api/views.py remain the WSGI path.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views import View
+
+from .hf_nlp import keywords_from_text
+from .image_intake import ImageTooLarge, TooManyImages, use_upload_limits
+from .ocr import aextract_text_from_image
+from .openai_helper import aanalyze_symptoms_to_keywords
+from .persistence import persist_upload
+from .search_engine import asearch
+from .postprocess import postprocess
+from .serializers import ResultOptionsSerializer, SymptomAIResultSerializer, SymptomQuerySerializer
+from .utils import normalize_query
+
+DISCLAIMER = (
+    "Not medical advice. For persistent or severe symptoms, consult a licensed healthcare professional."
+)
+
+
+def _retailers(request, default: str) -> list:
+    return [r.strip().lower() for r in request.GET.get("retailers", default).split(",") if r.strip()]
+
+
+class AsyncSearchProductsView(View):
+    """GET /api/search/?query=ibuprofen&retailers=walmart,target,cvs"""
+
+    async def get(self, request):
+        raw = (request.GET.get("query") or "").strip()
+        if not raw:
+            return JsonResponse({"detail": "query is required"}, status=400)
+
+        opts = ResultOptionsSerializer(data=request.GET)
+        if not opts.is_valid():
+            return JsonResponse(opts.errors, status=400)
+
+        clean = normalize_query(raw)
+        retailers = _retailers(request, "walmart,target")
+        results, meta = await asearch(clean, retailers)
+        results = postprocess(results, **opts.validated_data)
+
+        return JsonResponse({
+            "keywords": [],
+            "query": clean,
+            "retailers": retailers,
+            "results": results,
+            "cache": meta["cache"],
+        }, status=200)
+
+
+class AsyncUploadImageView(View):
+    """POST /api/upload/  (form-data: image=<file>)"""
+
+    async def post(self, request, *args, **kwargs):
+        use_upload_limits(request)
+        try:
+            f = request.FILES.get("image")
+        except (ImageTooLarge, TooManyImages) as e:
+            return JsonResponse({"detail": e.detail}, status=e.status_code)
+        if not f:
+            return JsonResponse({"detail": "Provide image in form-data with key 'image'."}, status=400)
+        opts = ResultOptionsSerializer(data=request.GET)
+        if not opts.is_valid():
+            return JsonResponse(opts.errors, status=400)
+
+        ocr_text = await aextract_text_from_image(f) or ""
+        await sync_to_async(persist_upload, thread_sensitive=False)(f)  # hashes + writes the spool file
+        kws = await sync_to_async(keywords_from_text, thread_sensitive=False)(ocr_text)
+        query_text = normalize_query(" ".join(kws) if kws else ocr_text) or "ibuprofen"
+
+        retailers = _retailers(request, "walmart,target,cvs")
+        results, meta = await asearch(query_text, retailers)
+        results = postprocess(results, **opts.validated_data)
+
+        return JsonResponse({
+            "ocr_text": ocr_text,
+            "keywords": kws,
+            "query": query_text,
+            "retailers": retailers,
+            "results": results,
+            "cache": meta["cache"],
+        }, status=200)
+
+
+class AsyncSymptomSearchView(View):
+    """POST /api/ask/  Body: { "query": "I have acne and oily skin, what should I look for?" }"""
+
+    async def post(self, request, *args, **kwargs):
+        if request.content_type == "application/json":
+            try:
+                payload = json.loads(request.body or b"{}")
+            except ValueError:
+                return JsonResponse({"detail": "JSON parse error"}, status=400)
+        else:
+            payload = request.POST
+
+        input_ser = SymptomQuerySerializer(data=payload)
+        if not input_ser.is_valid():
+            return JsonResponse(input_ser.errors, status=400)
+
+        ai_data = await aanalyze_symptoms_to_keywords(input_ser.validated_data["query"])
+        data = SymptomAIResultSerializer(ai_data).data
+        return JsonResponse({"data": data, "disclaimer": DISCLAIMER}, status=200)
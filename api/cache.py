@@ -0,0 +1,235 @@
+# api/cache.py
+"""
+Small tiered cache: an in-process LRU in front of an optional shared backend
+(Django cache or a SQLite file) so every worker process benefits from a fill.
+Values must be JSON-serializable.
+"""
+from __future__ import annotations
+import json, os, sqlite3, threading, time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+MISSING = object()
+
+
+class LRUCache:
+    """Bounded in-process LRU with per-entry expiry."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Tuple[Any, float]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return MISSING, 0.0
+            expires, value = entry
+            if expires <= time.time():
+                del self._data[key]
+                return MISSING, 0.0
+            self._data.move_to_end(key)
+            return value, expires
+
+    def set(self, key: str, value: Any, expires: float) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteCache:
+    """Shared on-disk backend; WAL mode makes it safe across worker processes."""
+
+    _PRUNE_EVERY = 200  # writes between expiry/size sweeps
+
+    def __init__(self, path: str, table: str = "cache", max_entries: Optional[int] = None):
+        self.path = str(path)
+        self.table = table
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._conn().execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL, touched REAL NOT NULL)"
+        )
+        self._conn().execute(f"CREATE INDEX IF NOT EXISTS {self.table}_touched ON {self.table}(touched)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Tuple[Any, float]:
+        row = self._conn().execute(
+            f"SELECT value, expires FROM {self.table} WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return MISSING, 0.0
+        value, expires = row
+        now = time.time()
+        if expires <= now:
+            self._conn().execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            return MISSING, 0.0
+        self._conn().execute(f"UPDATE {self.table} SET touched = ? WHERE key = ?", (now, key))
+        return json.loads(value), expires
+
+    def set(self, key: str, value: Any, expires: float) -> None:
+        self._conn().execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, value, expires, touched) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value, separators=(",", ":")), expires, time.time()),
+        )
+        self._writes += 1
+        if self._writes % self._PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self) -> None:
+        conn = self._conn()
+        conn.execute(f"DELETE FROM {self.table} WHERE expires <= ?", (time.time(),))
+        if self.max_entries:
+            conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN ("
+                f"SELECT key FROM {self.table} ORDER BY touched DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def delete(self, key: str) -> None:
+        self._conn().execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        self._conn().execute(f"DELETE FROM {self.table}")
+
+
+class DjangoCache:
+    """
+    Shared backend on top of a configured Django cache alias (redis, memcached, db...).
+    Django can only clear a whole alias, so entries carry the prefix's generation
+    and `clear` bumps it; older entries then read as misses until they expire.
+    """
+
+    def __init__(self, alias: str = "default", prefix: str = ""):
+        self.alias = alias
+        self.prefix = prefix
+        self._gen_key = prefix + "__generation__"
+
+    def _cache(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    def get(self, key: str) -> Tuple[Any, float]:
+        found = self._cache().get_many([self.prefix + key, self._gen_key])
+        entry = found.get(self.prefix + key)
+        if not entry or len(entry) != 3:
+            return MISSING, 0.0
+        expires, value, gen = entry
+        if gen != found.get(self._gen_key, 0) or expires <= time.time():
+            return MISSING, 0.0
+        return value, expires
+
+    def set(self, key: str, value: Any, expires: float) -> None:
+        cache = self._cache()
+        timeout = max(1, int(expires - time.time()))
+        cache.set(self.prefix + key, (expires, value, cache.get(self._gen_key, 0)), timeout=timeout)
+
+    def delete(self, key: str) -> None:
+        self._cache().delete(self.prefix + key)
+
+    def clear(self) -> None:
+        cache = self._cache()
+        cache.add(self._gen_key, 0, timeout=None)
+        cache.incr(self._gen_key)
+
+
+def make_shared_backend(kind: str, name: str, path: Optional[str] = None,
+                        max_entries: Optional[int] = None):
+    """kind: '' / 'none' (process-local only), 'django' or 'sqlite'."""
+    kind = (kind or "").strip().lower()
+    if kind in ("", "none", "memory"):
+        return None
+    if kind == "django":
+        return DjangoCache(prefix=f"{name}:")
+    if kind == "sqlite":
+        return SQLiteCache(path or f"{name}_cache.sqlite3", table=name, max_entries=max_entries)
+    raise ValueError(f"unknown cache backend: {kind}")
+
+
+class TieredCache:
+    """
+    LRU (tier 'memory') in front of an optional shared backend (tier 'shared').
+    `get` returns (value, tier) with tier None on a miss.
+    """
+
+    def __init__(self, maxsize: int = 1024, shared=None):
+        self.memory = LRUCache(maxsize)
+        self.shared = shared
+        self._stats = {"hits_memory": 0, "hits_shared": 0, "misses": 0, "sets": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, field: str) -> None:
+        with self._lock:
+            self._stats[field] += 1
+
+    def get(self, key: str) -> Tuple[Any, Optional[str]]:
+        value, _ = self.memory.get(key)
+        if value is not MISSING:
+            self._count("hits_memory")
+            return value, "memory"
+        if self.shared is not None:
+            try:
+                value, expires = self.shared.get(key)
+            except Exception:
+                value = MISSING  # a broken shared tier must not fail the request
+            if value is not MISSING:
+                self.memory.set(key, value, expires)
+                self._count("hits_shared")
+                return value, "shared"
+        self._count("misses")
+        return None, None
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        if ttl <= 0:
+            return
+        expires = time.time() + ttl
+        self.memory.set(key, value, expires)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, value, expires)
+            except Exception:
+                pass
+        self._count("sets")
+
+    def delete(self, key: str) -> None:
+        self.memory.delete(key)
+        if self.shared is not None:
+            try:
+                self.shared.delete(key)
+            except Exception:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+        lookups = s["hits_memory"] + s["hits_shared"] + s["misses"]
+        s["hit_rate"] = round((s["hits_memory"] + s["hits_shared"]) / lookups, 4) if lookups else 0.0
+        s["memory_size"] = len(self.memory)
+        return s
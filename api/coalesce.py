@@ -0,0 +1,154 @@
+# api/coalesce.py
+"""
+Request coalescing helpers:
+
+- SingleFlight / AsyncSingleFlight: concurrent calls with the same key share
+  one execution of the underlying function.
+- MicroBatcher: gathers items submitted within a short window into one
+  batch call and hands each caller its own result.
+"""
+from __future__ import annotations
+import asyncio, logging, threading, time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, List, Sequence, Tuple
+
+log = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Tuple[Any, bool]:
+        """Returns (result, shared); shared is True when another caller did the work."""
+        with self._lock:
+            fut = self._calls.get(key)
+            leader = fut is None
+            if leader:
+                fut = self._calls[key] = Future()
+        if not leader:
+            return fut.result(), True
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        else:
+            fut.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+
+def _task_cancelled() -> bool:
+    task = asyncio.current_task()
+    return bool(task is not None and task.cancelling())
+
+
+class AsyncSingleFlight:
+    """
+    If the leader is cancelled (client went away), its followers are not:
+    the first one to wake up re-runs the call as the new leader.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Tuple[Any, bool]:
+        key = (id(asyncio.get_running_loop()), key)
+        while True:
+            fut = self._calls.get(key)
+            if fut is None:
+                break
+            try:
+                return await asyncio.shield(fut), True
+            except asyncio.CancelledError:
+                if not fut.cancelled() or _task_cancelled():
+                    raise  # we were cancelled ourselves
+        fut = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fn(*args, **kwargs)
+        except asyncio.CancelledError:
+            fut.cancel()  # hands the call to a waiting follower
+            raise
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()  # mark retrieved when nobody else was waiting
+            raise
+        else:
+            fut.set_result(result)
+            return result, False
+        finally:
+            if self._calls.get(key) is fut:
+                del self._calls[key]
+
+
+class MicroBatcher:
+    """
+    Collects submitted items for up to `max_wait` seconds (or until
+    `max_batch` are queued) and runs `batch_fn(items) -> results` on a
+    background thread. `results` must line up with `items`.
+    With `wait_alone=False` an item that finds nothing else queued is run at
+    once; items arriving meanwhile queue up behind it and form the next batch.
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Any]], Sequence[Any]], max_batch: int = 8,
+                 max_wait: float = 0.02, name: str = "batcher", wait_alone: bool = True):
+        self._batch_fn = batch_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.name = name
+        self.wait_alone = wait_alone
+        self._cond = threading.Condition()
+        self._queue: List[Tuple[Any, Future]] = []
+        self._thread = None
+        self.batches = 0
+        self.items = 0
+
+    def submit(self, item: Any) -> Future:
+        fut: Future = Future()
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._queue.append((item, fut))
+            self._cond.notify()
+        return fut
+
+    def _take(self) -> List[Tuple[Any, Future]]:
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            if len(self._queue) == 1 and not self.wait_alone:
+                return [self._queue.pop()]
+            deadline = time.monotonic() + self.max_wait
+            while len(self._queue) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch, self._queue = self._queue[:self.max_batch], self._queue[self.max_batch:]
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._take()
+            items = [item for item, _ in batch]
+            try:
+                results = self._batch_fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"{self.name}: {len(results)} results for {len(items)} items")
+            except BaseException as e:
+                log.warning("%s batch of %d failed: %s", self.name, len(items), e)
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(items)
+            for (_, fut), res in zip(batch, results):
+                fut.set_result(res)
@@ -0,0 +1,150 @@
+# api/driver_pool.py
+from __future__ import annotations
+import atexit, logging, queue, threading, time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional, Set
+from urllib.parse import urlparse
+
+log = logging.getLogger(__name__)
+
+
+class PoolExhausted(RuntimeError):
+    pass
+
+
+class _Slot:
+    __slots__ = ("driver", "pages", "created")
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+        self.created = time.monotonic()
+
+
+class DriverPool:
+    """
+    Long-lived pool of WebDriver instances shared across requests.
+
+    - at most `max_size` browsers exist at once; checkout blocks until one is free
+    - a browser is recycled after `max_pages` uses to cap Chrome's memory creep
+    - idle browsers are health-checked before being handed out
+    - cookies and storage are wiped on checkin so searches don't leak state
+    """
+
+    def __init__(self, factory: Callable[[], object], max_size: int = 4, max_pages: int = 50):
+        self._factory = factory
+        self.max_size = max_size
+        self.max_pages = max_pages
+        self._idle: "queue.LifoQueue[_Slot]" = queue.LifoQueue()  # LIFO keeps the warmest browser busy
+        self._permits = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._live: Set[_Slot] = set()
+        self._closed = False
+
+    # --- lifecycle -------------------------------------------------------
+    def _create(self) -> _Slot:
+        slot = _Slot(self._factory())
+        with self._lock:
+            self._live.add(slot)
+        return slot
+
+    def _discard(self, slot: _Slot) -> None:
+        with self._lock:
+            self._live.discard(slot)
+        try:
+            slot.driver.quit()
+        except Exception as e:
+            log.debug("driver quit failed: %s", e)
+
+    @staticmethod
+    def _healthy(slot: _Slot) -> bool:
+        try:
+            return slot.driver.execute_script("return 1") == 1
+        except Exception:
+            return False
+
+    @staticmethod
+    def _reset(slot: _Slot) -> None:
+        d = slot.driver
+        url = d.current_url or ""
+        d.delete_all_cookies()
+        d.execute_script("try { localStorage.clear(); sessionStorage.clear(); } catch (e) {}")
+        parsed = urlparse(url)
+        if parsed.scheme in ("http", "https"):
+            # IndexedDB, cache storage, service workers for the last origin
+            d.execute_cdp_cmd("Storage.clearDataForOrigin", {
+                "origin": f"{parsed.scheme}://{parsed.netloc}",
+                "storageTypes": "all",
+            })
+        d.get("about:blank")
+
+    # --- checkout / checkin ---------------------------------------------
+    def checkout(self, timeout: Optional[float] = None):
+        if self._closed:
+            raise PoolExhausted("driver pool is closed")
+        if not self._permits.acquire(timeout=timeout):
+            raise PoolExhausted(f"no browser free within {timeout}s")
+        try:
+            while True:
+                try:
+                    slot = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._create()
+                if self._healthy(slot):
+                    return slot
+                log.info("discarding unhealthy browser after %d pages", slot.pages)
+                self._discard(slot)
+        except BaseException:
+            self._permits.release()
+            raise
+
+    def checkin(self, slot: _Slot, broken: bool = False) -> None:
+        try:
+            slot.pages += 1
+            if broken or self._closed or slot.pages >= self.max_pages:
+                self._discard(slot)
+                return
+            try:
+                self._reset(slot)
+            except Exception as e:
+                log.info("browser reset failed, discarding: %s", e)
+                self._discard(slot)
+                return
+            self._idle.put(slot)
+        finally:
+            self._permits.release()
+
+    @contextmanager
+    def borrow(self, timeout: Optional[float] = None) -> Iterator[object]:
+        slot = self.checkout(timeout=timeout)
+        try:
+            yield slot.driver
+        finally:
+            # a failed search usually leaves a usable browser; reset/health checks catch the rest
+            self.checkin(slot)
+
+    def close(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+    def stats(self) -> dict:
+        with self._lock:
+            live = len(self._live)
+        return {"live": live, "idle": self._idle.qsize(), "max_size": self.max_size, "max_pages": self.max_pages}
+
+
+_pools: list[DriverPool] = []
+
+@atexit.register
+def _close_all() -> None:
+    for p in _pools:
+        p.close()
+
+def make_pool(factory: Callable[[], object], max_size: int, max_pages: int) -> DriverPool:
+    pool = DriverPool(factory, max_size=max_size, max_pages=max_pages)
+    _pools.append(pool)
+    return pool
@@ -0,0 +1,95 @@
+# api/hf_backend.py
+"""
+Builds Hugging Face pipelines on the configured inference backend.
+
+HF_BACKEND=torch   plain transformers pipeline (full-precision PyTorch)
+HF_BACKEND=onnx    model exported to ONNX, dynamically quantized to int8 and
+                   run by ONNX Runtime through optimum. The export happens
+                   once per model into HF_ONNX_DIR and is reused afterwards.
+
+Both return a regular transformers pipeline, so callers don't change.
+"""
+import logging, os, platform, shutil, tempfile, threading
+
+from django.conf import settings
+
+log = logging.getLogger(__name__)
+
+QUANTIZED_FILE = "model_quantized.onnx"
+_export_lock = threading.Lock()
+
+
+def _ort_model_class(task: str):
+    from optimum import onnxruntime as ort
+    if task == "token-classification":
+        return ort.ORTModelForTokenClassification
+    if task in ("text-classification", "sentiment-analysis"):
+        return ort.ORTModelForSequenceClassification
+    raise ValueError(f"no ONNX backend for task {task!r}")
+
+
+def _quantization_config():
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    target = settings.HF_ONNX_QUANT
+    if target == "auto":
+        target = "arm64" if platform.machine().lower() in ("arm64", "aarch64") else "avx2"
+    # is_static=False: int8 weights, activation ranges computed per call (no calibration set)
+    return getattr(AutoQuantizationConfig, target)(is_static=False, per_channel=False)
+
+
+def onnx_model_dir(model: str) -> str:
+    return os.path.join(settings.HF_ONNX_DIR, model.replace("/", "--"))
+
+
+def _export(task: str, model: str, out: str) -> None:
+    """Export + quantize into a temp dir, then move it into place (safe across workers)."""
+    from optimum.onnxruntime import ORTQuantizer
+    from transformers import AutoTokenizer
+
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=".export-", dir=os.path.dirname(out))
+    try:
+        log.info("exporting %s to ONNX (int8) in %s", model, out)
+        ort_model = _ort_model_class(task).from_pretrained(model, export=True)
+        ort_model.save_pretrained(tmp)
+        AutoTokenizer.from_pretrained(model).save_pretrained(tmp)
+        ORTQuantizer.from_pretrained(tmp).quantize(save_dir=tmp, quantization_config=_quantization_config())
+        _install(tmp, out)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _install(tmp: str, out: str) -> None:
+    """Move a finished export into place. A complete `out` from another worker wins;
+    a stale or partial one (no quantized model) is replaced."""
+    for _ in range(2):
+        try:
+            os.rename(tmp, out)
+            return
+        except OSError:
+            if os.path.exists(os.path.join(out, QUANTIZED_FILE)):
+                return  # another worker got there first
+            log.warning("replacing incomplete ONNX export in %s", out)
+            shutil.rmtree(out, ignore_errors=True)
+    raise RuntimeError(f"could not install ONNX export into {out}")
+
+
+def _onnx_pipeline(task: str, model: str, **kwargs):
+    from transformers import AutoTokenizer, pipeline
+
+    out = onnx_model_dir(model)
+    with _export_lock:
+        if not os.path.exists(os.path.join(out, QUANTIZED_FILE)):
+            _export(task, model, out)
+    ort_model = _ort_model_class(task).from_pretrained(out, file_name=QUANTIZED_FILE)
+    return pipeline(task, model=ort_model, tokenizer=AutoTokenizer.from_pretrained(out), **kwargs)
+
+
+def build_pipeline(task: str, model: str, backend: str = None, **kwargs):
+    backend = backend or settings.HF_BACKEND
+    if backend == "onnx":
+        return _onnx_pipeline(task, model, **kwargs)
+    if backend != "torch":
+        raise ValueError(f"unknown HF_BACKEND {backend!r} (expected torch or onnx)")
+    from transformers import pipeline
+    return pipeline(task, model=model, **kwargs)
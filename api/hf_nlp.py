@@ -1,7 +1,13 @@
 # api/hf_nlp.py
-from transformers import pipeline
 from django.conf import settings
 
+from .coalesce import MicroBatcher
+from .hf_backend import build_pipeline
+
+# transformers (and torch / onnxruntime) are imported on first use, not at Django start-up
+
+NER_MODEL = "dslim/bert-base-NER"
+
 _pipe = None
 _ner = None
 
@@ -9,15 +15,57 @@ def _get_cls():
     global _pipe
     if _pipe is None:
         model = getattr(settings, "HF_MODEL", "distilbert-base-uncased-finetuned-sst-2-english")
-        _pipe = pipeline("text-classification", model=model)
+        _pipe = build_pipeline("text-classification", model)
     return _pipe
 
 def _get_ner():
     global _ner
     # generic NER; replace with a biomedical NER model later if you like
-    _ner = _ner or pipeline("token-classification", model="dslim/bert-base-NER", aggregation_strategy="simple")
+    if _ner is None:
+        _ner = build_pipeline("token-classification", NER_MODEL, aggregation_strategy="simple")
     return _ner
 
+# --- batched NER ----------------------------------------------------------------
+# Concurrent requests are gathered by a MicroBatcher; a request that arrives
+# alone runs straight away. The pipeline pads each forward pass of
+# HF_NER_SUB_BATCH texts to its longest one, so texts are sorted by length
+# first and neighbours share a pass; results are put back in submission order.
+
+def _ner_batch(texts: list[str]) -> list[list[dict]]:
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    ents = _get_ner()([texts[i] for i in order],
+                      batch_size=max(1, min(len(texts), settings.HF_NER_SUB_BATCH)))
+    out: list = [None] * len(texts)
+    for i, e in zip(order, ents):
+        out[i] = e
+    return out
+
+_batcher = None
+
+def _get_batcher():
+    global _batcher
+    window = settings.HF_NER_BATCH_WINDOW_MS
+    if window <= 0:
+        return None
+    if _batcher is None:
+        _batcher = MicroBatcher(_ner_batch, max_batch=settings.HF_NER_BATCH_MAX,
+                                max_wait=window / 1000, name="ner-batcher", wait_alone=False)
+    return _batcher
+
+def _entities(text: str) -> list[dict]:
+    batcher = _get_batcher()
+    if batcher is None:
+        return _get_ner()(text)
+    return batcher.submit(text).result()
+
+def _tokens(text: str, ents: list[dict]) -> list[str]:
+    tokens = [e["word"] for e in ents if e["entity_group"] in {"ORG", "PRODUCT", "MISC", "PER"}]
+    # Add a crude fallback: return top words if NER is empty
+    if not tokens:
+        words = [w.strip(",.()").lower() for w in text.split() if len(w) > 3]
+        tokens = list(dict.fromkeys(words))[:5]
+    return tokens[:8]
+
 def keywords_from_text(text: str) -> list[str]:
     """
     Very simple keywording via NER. Later you can switch to a biomedical NER.
@@ -25,10 +73,14 @@ def keywords_from_text(text: str) -> list[str]:
     text = (text or "").strip()
     if not text:
         return []
-    ents = _get_ner()(text)  # [{'entity_group':'ORG','word':'...','score':...}, ...]
-    tokens = [e["word"] for e in ents if e["entity_group"] in {"ORG", "PRODUCT", "MISC", "PER"}]
-    # Add a crude fallback: return top words if NER is empty
-    if not tokens:
-        words = [w.strip(",.()").lower() for w in text.split() if len(w) > 3]
-        tokens = list(dict.fromkeys(words))[:5]
-    return tokens[:8]
+    return _tokens(text, _entities(text))  # ents: [{'entity_group':'ORG','word':'...','score':...}, ...]
+
+def keywords_from_texts(texts: list[str]) -> list[list[str]]:
+    """keywords_from_text for many texts, run as one NER batch."""
+    texts = [(t or "").strip() for t in texts]
+    todo = [i for i, t in enumerate(texts) if t]
+    out: list = [[] for _ in texts]
+    if todo:
+        for i, ents in zip(todo, _ner_batch([texts[i] for i in todo])):
+            out[i] = _tokens(texts[i], ents)
+    return out
@@ -1,26 +1,22 @@
-from transformers import pipeline
 from django.conf import settings
 
+from .hf_backend import build_pipeline
+from .symptom_rules import match_symptoms
+
 # small, fast sentiment to route: sleep vs pain vs acne vs hair (toy example)
-_nlp = pipeline("sentiment-analysis", model=settings.HF_MODEL)
+_nlp = None
 
-SYMPTOM_KB = {
-    "sleep": (["insomnia","sleep","awake","melatonin","gummies"], ["melatonin","valerian","sleep gummies"]),
-    "pain":  (["pain","ache","headache","back"], ["ibuprofen","acetaminophen","naproxen"]),
-    "acne":  (["acne","pimple","zit","oily"], ["benzoyl peroxide","salicylic acid","adapalene"]),
-    "hair":  (["hair","fall","loss","itchy scalp"], ["minoxidil","biotin","ketoconazole shampoo"]),
-}
+def _get_nlp():
+    global _nlp
+    if _nlp is None:
+        _nlp = build_pipeline("sentiment-analysis", settings.HF_MODEL)
+    return _nlp
 
+# trigger/keyword rules live in api/data/symptom_rules.json (shared with the OpenAI fallback)
 def hf_keywords(query: str):
-    q = query.lower()
-    cats = []
-    kws = []
-    for cat, (trigs, picks) in SYMPTOM_KB.items():
-        if any(t in q for t in trigs):
-            cats.append(cat)
-            kws.extend(picks)
+    cats, kws = match_symptoms(query)
     # sentiment is optional here—example how to use HF locally
-    _ = _nlp(query)  # warm-up / potential routing signal
+    _ = _get_nlp()(query)  # warm-up / potential routing signal
     return {
         "cleaned_symptoms": [],
         "candidate_keywords": sorted(set(kws)),
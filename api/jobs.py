@@ -0,0 +1,257 @@
+# api/jobs.py
+"""
+In-process job pipeline for uploads: image -> OCR -> keywords -> search.
+
+POST returns a job id at once; a bounded queue feeds a small worker pool
+that runs the stages, each under its own timeout. Job state (per-stage
+status and partial results) is written to the shared cache backend on every
+change, so any worker process can answer GET /api/jobs/<id>/ — no broker.
+When the queue is full, submit() raises QueueFull and the view answers 429.
+
+A stage that times out is abandoned, not killed: its thread may still be
+inside an upstream call. Each stage works on its own copy of the upload, and
+at most `max_abandoned` such threads may linger before new jobs get a 429.
+"""
+import copy, logging, math, os, queue, tempfile, threading, time, uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as StageTimeout
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from .cache import MISSING, make_shared_backend
+from .utils import normalize_query
+
+log = logging.getLogger(__name__)
+
+STAGES = ("ocr", "keywords", "search")
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("job queue is full")
+        self.retry_after = retry_after
+
+
+class JobRunner:
+    def __init__(self, workers: int = 4, queue_size: int = 32, ttl: float = 3600, shared=None,
+                 max_abandoned: int = None):
+        self.workers = workers
+        self.ttl = ttl
+        self.shared = shared
+        self.max_abandoned = workers if max_abandoned is None else max_abandoned
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._jobs: dict = {}          # snapshots of jobs run by this process, until they expire
+        self._lock = threading.Lock()
+        self._durations: list = []     # recent job run times, for Retry-After
+        self._abandoned = 0            # timed-out stages whose thread is still busy
+        # stages run here so a hung upstream call can be abandoned after its timeout;
+        # sized so live stages always find a thread while abandoned ones are within the cap
+        self._stages = ThreadPoolExecutor(max_workers=workers + self.max_abandoned, thread_name_prefix="job-stage")
+        for i in range(workers):
+            threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True).start()
+
+    # --- request side ---------------------------------------------------------------
+
+    def submit(self, file, retailers: list, options: dict = None) -> dict:
+        """`options` are postprocess() keyword arguments (sort, price range, dedupe)."""
+        with self._lock:
+            stuck = self._abandoned >= self.max_abandoned
+        if stuck or self._queue.full():
+            raise QueueFull(self.retry_after())
+        # the upload is gone when the request ends; keep a copy for the worker
+        fd, path = tempfile.mkstemp(prefix="job-", suffix=os.path.splitext(file.name or "")[1])
+        with os.fdopen(fd, "wb") as out:
+            file.seek(0)
+            for chunk in file.chunks():
+                out.write(chunk)
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": "queued",
+            "created": now,
+            "updated": now,
+            "stages": {s: {"status": "pending"} for s in STAGES},
+            "options": dict(options or {}),
+            "result": {"retailers": retailers, "results": []},
+            "error": None,
+        }
+        try:
+            self._queue.put_nowait((job, path, file.name))
+        except queue.Full:
+            os.unlink(path)
+            raise QueueFull(self.retry_after())
+        self._save(job)
+        return self.get(job["id"])
+
+    def get(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                if job["updated"] >= time.time() - self.ttl:
+                    return copy.deepcopy(job)
+                del self._jobs[job_id]
+        if self.shared is not None:
+            try:
+                value, _ = self.shared.get("job:" + job_id)
+                return None if value is MISSING else value
+            except Exception:
+                pass
+        return None
+
+    def retry_after(self) -> int:
+        with self._lock:
+            avg = sum(self._durations) / len(self._durations) if self._durations else 10.0
+        waiting = self._queue.qsize() + 1
+        return max(1, math.ceil(avg * waiting / max(1, self.workers)))
+
+    def stats(self) -> dict:
+        with self._lock:
+            running = sum(1 for j in self._jobs.values() if j["status"] == "running")
+            abandoned = self._abandoned
+        return {"queued": self._queue.qsize(), "capacity": self._queue.maxsize, "running": running,
+                "abandoned_stages": abandoned, "retry_after": self.retry_after()}
+
+    # --- worker side ----------------------------------------------------------------
+
+    def _save(self, job: dict) -> None:
+        """Publish the job's current state (call with changes already applied)."""
+        with self._lock:
+            job["updated"] = time.time()
+            snapshot = self._jobs[job["id"]] = copy.deepcopy(job)
+            cutoff = time.time() - self.ttl
+            for jid in [j for j, v in self._jobs.items() if v["updated"] < cutoff]:
+                del self._jobs[jid]
+        if self.shared is not None:
+            try:
+                self.shared.set("job:" + job["id"], snapshot, snapshot["updated"] + self.ttl)
+            except Exception as e:
+                log.warning("job %s: could not publish state: %s", job["id"], e)
+
+    def _run(self) -> None:
+        while True:
+            job, path, name = self._queue.get()
+            started = time.monotonic()
+            try:
+                # in memory from here on: an abandoned stage may outlive this loop iteration
+                with open(path, "rb") as fh:
+                    data = fh.read()
+                os.unlink(path)
+                self._process(job, data, name)
+            except Exception as e:
+                log.exception("job %s crashed", job["id"])
+                job.update(status="failed", error=str(e))
+                self._save(job)
+            finally:
+                if os.path.exists(path):
+                    os.unlink(path)
+                with self._lock:
+                    self._durations = (self._durations + [time.monotonic() - started])[-50:]
+                from django.db import close_old_connections
+                close_old_connections()
+
+    def _released(self, _fut) -> None:
+        with self._lock:
+            self._abandoned -= 1
+
+    def _stage(self, job: dict, name: str, fn, timeout: float, abandon: threading.Event = None,
+               partial=None):
+        """
+        Run `fn` under `timeout`. Returns (value, ok). On a timeout the job fails,
+        unless `partial()` says enough has arrived: then the stage is "partial" and ok is True.
+        """
+        stage = job["stages"][name]
+        stage["status"] = "running"
+        self._save(job)
+        t0 = time.monotonic()
+        fut = self._stages.submit(fn)
+        try:
+            value = fut.result(timeout=timeout)
+        except StageTimeout:
+            with self._lock:
+                if abandon is not None:
+                    abandon.set()  # the stage thread may still be running; stop it touching the job
+                self._abandoned += 1
+                kept = partial is not None and partial()
+                stage.update(status="partial" if kept else "timeout",
+                             elapsed_ms=int((time.monotonic() - t0) * 1000))
+                if not kept:
+                    job.update(status="failed", error=f"{name} timed out after {timeout:g}s")
+            fut.add_done_callback(self._released)
+            self._save(job)
+            return None, kept
+        except Exception as e:
+            stage.update(status="failed", elapsed_ms=int((time.monotonic() - t0) * 1000))
+            job.update(status="failed", error=f"{name}: {e}")
+            self._save(job)
+            return None, False
+        stage.update(status="done", elapsed_ms=int((time.monotonic() - t0) * 1000))
+        return value, True
+
+    def _process(self, job: dict, data: bytes, name: str) -> None:
+        from .hf_nlp import keywords_from_text
+        from .ocr import extract_text_from_image
+        from .persistence import persist_upload
+        from .postprocess import postprocess
+        from .search_engine import iter_search
+
+        job["status"] = "running"
+        result = job["result"]
+
+        def ocr():
+            file = ContentFile(data, name=name)  # the stage's own file object
+            text = extract_text_from_image(file) or ""
+            persist_upload(file)
+            return text
+        text, ok = self._stage(job, "ocr", ocr, settings.JOBS_OCR_TIMEOUT)
+        if not ok:
+            return
+        result["ocr_text"] = text
+
+        kws, ok = self._stage(job, "keywords", lambda: keywords_from_text(text), settings.JOBS_NER_TIMEOUT)
+        if not ok:
+            return
+        result["keywords"] = kws
+        result["query"] = normalize_query(" ".join(kws) if kws else text) or "ibuprofen"
+
+        # results are published per retailer as they land. The search has its own
+        # deadline; the stage timeout only catches a backend that ignores it, and
+        # even then the job finishes with whatever arrived. Every publish is
+        # post-processed (parsed prices, dedup, sort/filter) like the sync views.
+        meta = {}
+        raw = []
+        abandoned = threading.Event()
+        def search():
+            for _, items in iter_search(result["query"], result["retailers"], meta,
+                                        deadline=settings.JOBS_SEARCH_TIMEOUT):
+                raw.extend(items)
+                shaped = postprocess(raw, **job["options"])
+                with self._lock:
+                    if abandoned.is_set():
+                        break
+                    result["results"] = shaped
+                self._save(job)
+        _, ok = self._stage(job, "search", search, settings.JOBS_SEARCH_TIMEOUT + settings.JOBS_STAGE_GRACE,
+                            abandoned, partial=lambda: bool(result["results"]))
+        result["cache"] = meta.get("cache")
+        if ok:
+            if meta.get("pending"):
+                job["stages"]["search"]["status"] = "partial"  # a backend was cut off at the deadline
+            job["status"] = "done"
+        self._save(job)
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+def get_runner() -> JobRunner:
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = JobRunner(
+                workers=settings.JOBS_WORKERS,
+                queue_size=settings.JOBS_QUEUE_SIZE,
+                ttl=settings.JOBS_TTL,
+                shared=make_shared_backend(settings.JOBS_BACKEND, "jobs", path=settings.JOBS_PATH),
+                max_abandoned=settings.JOBS_MAX_ABANDONED,
+            )
+    return _runner
@@ -0,0 +1,69 @@
+import argparse, json, resource, statistics, subprocess, sys, time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.hf_nlp import NER_MODEL
+
+_TEXTS = [
+    "Advil Ibuprofen Tablets 200 mg pain reliever / fever reducer",
+    "Tylenol Extra Strength caplets made by Johnson & Johnson in New Jersey",
+    "CeraVe Acne Foaming Cream Cleanser with benzoyl peroxide, 5 oz",
+    "Natrol Melatonin 5mg fast dissolve sleep aid, strawberry flavor, 90 tablets",
+    "Claritin 24 hour non-drowsy allergy relief, Bayer HealthCare, 30 count",
+    "Directions: adults and children 12 years and over take 1 tablet every 4 to 6 hours "
+    "while symptoms persist. Do not exceed 6 tablets in 24 hours unless directed by a doctor.",
+]
+_TASKS = {
+    "ner": ("token-classification", NER_MODEL, {"aggregation_strategy": "simple"}),
+    "cls": ("text-classification", None, {}),
+}
+
+
+def _pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(p / 100 * len(xs)))]
+
+
+class Command(BaseCommand):
+    help = "Compare load time, latency and peak RSS of the torch and int8 ONNX pipelines."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--backends", default="torch,onnx")
+        parser.add_argument("--tasks", default="ner,cls")
+        parser.add_argument("--rounds", type=int, default=20)
+        parser.add_argument("--child", nargs=2, metavar=("BACKEND", "TASK"), help=argparse.SUPPRESS)
+
+    def _measure(self, backend, task, rounds):
+        from api.hf_backend import build_pipeline
+        name, model, kwargs = _TASKS[task]
+        t0 = time.perf_counter()  # includes the one-off ONNX export on a cold HF_ONNX_DIR
+        pipe = build_pipeline(name, model or settings.HF_MODEL, backend=backend, **kwargs)
+        pipe(_TEXTS[0])
+        load = time.perf_counter() - t0
+        lat = []
+        for _ in range(rounds):
+            for text in _TEXTS:
+                t0 = time.perf_counter()
+                pipe(text)
+                lat.append((time.perf_counter() - t0) * 1000)
+        return {"load_s": load, "p50_ms": statistics.median(lat), "p99_ms": _pct(lat, 99),
+                "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}  # KiB on Linux
+
+    def handle(self, *args, **opts):
+        if opts["child"]:
+            self.stdout.write(json.dumps(self._measure(*opts["child"], opts["rounds"])))
+            return
+
+        self.stdout.write(f"{'task':<5} {'backend':<7} {'load s':>7} {'p50 ms':>8} {'p99 ms':>8} {'peak RSS MB':>12}")
+        for task in opts["tasks"].split(","):
+            for backend in opts["backends"].split(","):
+                # fresh interpreter per run so RSS isn't shared between backends
+                out = subprocess.run([sys.executable, sys.argv[0], "bench_hf_backend", "--child", backend, task,
+                                      "--rounds", str(opts["rounds"])], capture_output=True, text=True)
+                if out.returncode:
+                    self.stderr.write(f"{task} {backend}: failed\n{out.stderr[-2000:]}")
+                    continue
+                r = json.loads(out.stdout.strip().splitlines()[-1])
+                self.stdout.write(f"{task:<5} {backend:<7} {r['load_s']:>7.1f} {r['p50_ms']:>8.1f} "
+                                  f"{r['p99_ms']:>8.1f} {r['rss_mb']:>12.0f}")
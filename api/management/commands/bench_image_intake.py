@@ -0,0 +1,56 @@
+import difflib, glob, os, re, time
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+
+from api.image_intake import prepare_for_ocr
+
+
+def _words(text: str) -> list:
+    return re.findall(r"[a-z0-9]+", (text or "").lower())
+
+
+class Command(BaseCommand):
+    help = ("Compare original uploads with the intake output on a folder of sample photos: "
+            "bytes, intake time and (with --ocr) Vision latency and OCR text similarity.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("samples", help="directory of sample images (jpg/png/webp)")
+        parser.add_argument("--ocr", action="store_true", help="call Vision on both versions (billable)")
+
+    def handle(self, *args, **opts):
+        paths = sorted(p for p in glob.glob(os.path.join(opts["samples"], "*"))
+                       if p.lower().endswith((".jpg", ".jpeg", ".png", ".webp")))
+        if not paths:
+            self.stderr.write("no images found")
+            return
+        if opts["ocr"]:
+            from api.ocr import _get_client, _text_from_response, _vision
+            vision = _vision()
+            def ocr(content):
+                t0 = time.perf_counter()
+                text = _text_from_response(_get_client().text_detection(image=vision.Image(content=content)))
+                return text, (time.perf_counter() - t0) * 1000
+
+        self.stdout.write(f"{'image':<28} {'orig KB':>8} {'new KB':>8} {'intake ms':>9}"
+                          + (f" {'orig ms':>8} {'new ms':>8} {'text sim':>8}" if opts["ocr"] else ""))
+        ratios, sims = [], []
+        for path in paths:
+            with open(path, "rb") as fh:
+                raw = fh.read()
+            t0 = time.perf_counter()
+            out = prepare_for_ocr(SimpleUploadedFile(os.path.basename(path), raw))
+            intake_ms = (time.perf_counter() - t0) * 1000
+            ratios.append(len(out) / len(raw))
+            line = f"{os.path.basename(path)[:28]:<28} {len(raw) / 1024:>8.0f} {len(out) / 1024:>8.0f} {intake_ms:>9.1f}"
+            if opts["ocr"]:
+                orig_text, orig_ms = ocr(raw)
+                new_text, new_ms = ocr(out)
+                # word-level similarity; 1.0 means the same words in the same order
+                sim = difflib.SequenceMatcher(None, _words(orig_text), _words(new_text)).ratio()
+                sims.append(sim)
+                line += f" {orig_ms:>8.0f} {new_ms:>8.0f} {sim:>8.3f}"
+            self.stdout.write(line)
+
+        self.stdout.write(f"\n{len(paths)} images, mean size ratio {sum(ratios) / len(ratios):.3f}"
+                          + (f", mean text similarity {sum(sims) / len(sims):.3f}, min {min(sims):.3f}" if sims else ""))
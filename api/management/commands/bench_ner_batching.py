@@ -0,0 +1,60 @@
+import random, statistics, time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from api.coalesce import MicroBatcher
+from api.hf_nlp import _get_ner, _ner_batch
+
+_WORDS = ("ibuprofen tablets 200mg advil pain reliever fever reducer acetaminophen tylenol "
+          "extra strength caplets loratadine claritin allergy relief melatonin sleep aid "
+          "benzoyl peroxide acne cream cerave moisturizing lotion directions warnings").split()
+
+
+def _pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(p / 100 * len(xs)))]
+
+
+class Command(BaseCommand):
+    help = "Throughput and latency of NER with and without micro-batching under concurrent load."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=256)
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument("--batch-sizes", default="4,8,16,32")
+        parser.add_argument("--windows-ms", default="0,5,10,20")
+        parser.add_argument("--seed", type=int, default=7)
+
+    def _run(self, call, texts, concurrency):
+        lat = []
+        def one(t):
+            t0 = time.perf_counter()
+            call(t)
+            lat.append((time.perf_counter() - t0) * 1000)
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(one, texts))
+        return len(texts) / (time.perf_counter() - t0), lat
+
+    def _row(self, label, rps, lat, avg_batch):
+        self.stdout.write(f"{label:<22} {rps:>8.1f} {statistics.median(lat):>8.1f} "
+                          f"{_pct(lat, 99):>8.1f} {avg_batch:>9.1f}")
+
+    def handle(self, *args, **opts):
+        rnd = random.Random(opts["seed"])
+        # OCR-like snippets of very different lengths, so padding matters
+        texts = [" ".join(rnd.choices(_WORDS, k=rnd.randint(3, 60))) for _ in range(opts["requests"])]
+        ner = _get_ner()
+        ner(texts[0])  # load weights outside the timings
+
+        self.stdout.write(f"{'config':<22} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'avg batch':>9}")
+        rps, lat = self._run(ner, texts, opts["concurrency"])
+        self._row("unbatched", rps, lat, 1)
+
+        for size in (int(x) for x in opts["batch_sizes"].split(",")):
+            for window in (int(x) for x in opts["windows_ms"].split(",")):
+                batcher = MicroBatcher(_ner_batch, max_batch=size, max_wait=window / 1000,
+                                       name=f"bench-{size}-{window}", wait_alone=False)
+                rps, lat = self._run(lambda t: batcher.submit(t).result(), texts, opts["concurrency"])
+                self._row(f"batch={size} wait={window}ms", rps, lat, batcher.items / max(batcher.batches, 1))
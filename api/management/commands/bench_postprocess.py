@@ -0,0 +1,68 @@
+import random, sys, time
+
+from django.core.management.base import BaseCommand
+
+from api.postprocess import Record, parse_price, postprocess
+
+_BRANDS = "advil tylenol motrin aleve claritin zyrtec benadryl natrol cerave neutrogena nizoral pepto".split()
+_FORMS = "tablets caplets capsules softgels gummies liquid gels cream cleanser shampoo".split()
+_WORDS = ("extra strength pain relief fever reducer non drowsy allergy sleep aid acne daily rapid release "
+          "coated easy swallow mini junior kids adult back muscle joint arthritis migraine sinus cold flu "
+          "nighttime daytime fragrance free sensitive skin oil control hydrating cherry berry mint").split()
+_PRICES = ("${d}.{c:02d}", "{q} for ${d}", "${d}.{c:02d}/ea", "${d}.{c:02d} - ${d2}.{c:02d}", "From ${d}.{c:02d}")
+
+
+class Command(BaseCommand):
+    help = "Time price parsing, near-duplicate collapsing and sorting on large synthetic result sets."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--items", default="1000,10000,100000", help="comma-separated result-set sizes")
+        parser.add_argument("--dup-rate", type=float, default=0.3, help="share of items that re-list a product")
+        parser.add_argument("--seed", type=int, default=7)
+
+    def _items(self, n, dup_rate, rnd):
+        products, items = [], []
+        for i in range(n):
+            if products and rnd.random() < dup_rate:
+                # same product from another retailer/pass: shuffled words, different punctuation
+                base = list(rnd.choice(products))
+                rnd.shuffle(base)
+                title = ", ".join(base)
+            else:
+                base = [rnd.choice(_BRANDS), *rnd.sample(_WORDS, 4), rnd.choice(_FORMS),
+                        f"{rnd.choice((200, 250, 325, 500))}mg", f"{rnd.choice((24, 50, 100, 200))} count"]
+                products.append(base)
+                title = " ".join(base)
+            price = rnd.choice(_PRICES).format(d=rnd.randint(1, 40), d2=rnd.randint(41, 60),
+                                               c=rnd.randint(0, 99), q=rnd.randint(2, 4))
+            items.append({"retailer": rnd.choice(("walmart", "target", "cvs", "walgreens")),
+                          "title": title, "price": price, "url": f"https://example.com/p/{i}"})
+        return items
+
+    def handle(self, *args, **opts):
+        rnd = random.Random(opts["seed"])
+        self.stdout.write(f"{'items':>8} {'parse ms':>9} {'dedupe ms':>10} {'+sort/filter ms':>16} {'out':>8} "
+                          f"{'dict KB':>8} {'slots KB':>9}")
+        for n in (int(x) for x in opts["items"].split(",")):
+            items = self._items(n, opts["dup_rate"], rnd)
+
+            t0 = time.perf_counter()
+            for it in items:
+                parse_price(it["price"])
+            parse_ms = (time.perf_counter() - t0) * 1000
+
+            t0 = time.perf_counter()
+            out = postprocess(items)
+            dedupe_ms = (time.perf_counter() - t0) * 1000
+            t0 = time.perf_counter()
+            postprocess(items, sort="price", max_price=20)
+            sorted_ms = (time.perf_counter() - t0) * 1000
+
+            # per-record container overhead: __slots__ objects vs dicts with the same fields
+            recs = [Record(i, it) for i, it in enumerate(items)]
+            slots_kb = sum(sys.getsizeof(r) for r in recs) / 1024
+            dict_kb = sum(sys.getsizeof({f: getattr(r, f) for f in Record.__slots__}) for r in recs) / 1024
+            del recs
+
+            self.stdout.write(f"{n:>8} {parse_ms:>9.1f} {dedupe_ms:>10.1f} {sorted_ms:>16.1f} {len(out):>8} "
+                              f"{dict_kb:>8.0f} {slots_kb:>9.0f}")
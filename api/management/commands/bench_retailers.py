@@ -0,0 +1,73 @@
+import random, time
+from urllib.parse import urlparse
+
+from django.core.management.base import BaseCommand
+
+from api.providers_serpapi import _filter_shopping
+from api.retailers import get_registry
+
+# the pre-registry approach, kept here for comparison
+_LEGACY = {
+    "walmart": ["walmart.com"], "target": ["target.com"], "cvs": ["cvs.com"],
+    "walgreens": ["walgreens.com"], "costco": ["costco.com"], "amazon": ["amazon.com"],
+}
+
+def _legacy_host_ok(hostname, want):
+    host = (hostname or "").lower().replace("www.", "")
+    allowed = []
+    for w in want:
+        allowed += _LEGACY.get(w, [])
+    return any(host.endswith(dom) or dom in host for dom in allowed)
+
+def _legacy_filter(data, retailers, num):
+    out = []
+    for it in data["shopping_results"]:
+        link = it["link"]
+        host = urlparse(link).hostname or ""
+        if _legacy_host_ok(host, retailers):
+            from_host = host.replace("www.", "")
+            retailer = from_host
+            for k, doms in _LEGACY.items():
+                if any(from_host.endswith(d) for d in doms):
+                    retailer = k
+                    break
+            out.append({"retailer": retailer, "title": it["title"], "price": it["price"], "url": link})
+        if len(out) >= num:
+            break
+    return out
+
+
+class Command(BaseCommand):
+    help = "Benchmark host filtering/labelling of large SerpAPI payloads: registry trie vs linear scans."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--items", default="100,10000,100000", help="comma-separated payload sizes")
+        parser.add_argument("--retailers", default="walmart,target,cvs,walgreens")
+        parser.add_argument("--seed", type=int, default=7)
+
+    def handle(self, *args, **opts):
+        rnd = random.Random(opts["seed"])
+        retailers = opts["retailers"].split(",")
+        hosts = ["www.walmart.com", "www.target.com", "www.cvs.com", "www.walgreens.com", "www.amazon.com",
+                 "www.costco.com", "grocery.walmart.com", "www.ebay.com", "www.etsy.com", "poshmark.com",
+                 # lookalikes the old substring check let through
+                 "walmart.com.deals-outlet.net", "cvs.com-pharmacy.shop", "shop-target.com", "notwalgreens.com"]
+        hosts += [f"store{i}.example{i % 50}.com" for i in range(200)]  # long tail of other sellers
+
+        self.stdout.write(f"{'items':>8} {'legacy ms':>10} {'registry ms':>12} {'speedup':>8} "
+                          f"{'legacy kept':>12} {'registry kept':>14}")
+        for n in (int(x) for x in opts["items"].split(",")):
+            data = {"shopping_results": [
+                {"link": f"https://{rnd.choice(hosts)}/ip/{i}", "title": f"item {i}", "price": "$1.00"}
+                for i in range(n)
+            ]}
+            get_registry().classify.cache_clear()
+
+            t0 = time.perf_counter()
+            legacy = _legacy_filter(data, retailers, n)
+            legacy_ms = (time.perf_counter() - t0) * 1000
+            t0 = time.perf_counter()
+            new = _filter_shopping(data, retailers, n)
+            new_ms = (time.perf_counter() - t0) * 1000
+            self.stdout.write(f"{n:>8} {legacy_ms:>10.1f} {new_ms:>12.1f} {legacy_ms / new_ms:>7.1f}x "
+                              f"{len(legacy):>12} {len(new):>14}")
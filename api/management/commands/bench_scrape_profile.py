@@ -0,0 +1,59 @@
+import json, statistics, time
+
+from django.core.management.base import BaseCommand
+
+from api.scrapers import _SPECS, _apply_profile, _extract_dom, _make_driver, _wait_for
+
+
+def _network_totals(driver):
+    """(bytes over the wire, finished requests) from the Chrome performance log."""
+    total = requests = 0
+    for entry in driver.get_log("performance"):
+        msg = json.loads(entry["message"])["message"]
+        if msg.get("method") == "Network.loadingFinished":
+            total += msg["params"].get("encodedDataLength", 0)
+            requests += 1
+    return total, requests
+
+
+class Command(BaseCommand):
+    help = "Compare the full and lean page-load profiles: bytes transferred, requests and time-to-selector per retailer."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--retailers", default="walmart,target,cvs,walgreens")
+        parser.add_argument("--query", default="ibuprofen")
+        parser.add_argument("--runs", type=int, default=3)
+
+    def handle(self, *args, **opts):
+        retailers = [r.strip() for r in opts["retailers"].split(",") if r.strip()]
+        self.stdout.write(f"{'retailer':<10} {'profile':<7} {'KB':>8} {'requests':>9} {'selector ms':>12} {'items':>6}")
+        for retailer in retailers:
+            spec = _SPECS[retailer]
+            url = spec["url"].format(q=opts["query"])
+            for profile in ("full", "lean"):
+                kb, reqs, ms, items = [], [], [], []
+                # a fresh browser per run so nothing is served from the HTTP cache
+                for _ in range(opts["runs"]):
+                    d = _make_driver(profile=profile, perf_log=True)
+                    try:
+                        _apply_profile(d, retailer, profile)
+                        d.get_log("performance")  # drop start-up noise
+                        t0 = time.perf_counter()
+                        try:
+                            d.get(url)
+                            _wait_for(d, spec["ready"])
+                        except Exception as e:
+                            self.stderr.write(f"{retailer}/{profile}: {e}")
+                            continue
+                        ms.append((time.perf_counter() - t0) * 1000)
+                        items.append(len(_extract_dom(d, spec)))
+                        total, n = _network_totals(d)
+                        kb.append(total / 1024)
+                        reqs.append(n)
+                    finally:
+                        d.quit()
+                if not ms:
+                    continue
+                self.stdout.write(f"{retailer:<10} {profile:<7} {statistics.median(kb):>8.0f} "
+                                  f"{statistics.median(reqs):>9.0f} {statistics.median(ms):>12.0f} "
+                                  f"{statistics.median(items):>6.0f}")
@@ -0,0 +1,57 @@
+import random, string, time
+
+from django.core.management.base import BaseCommand
+
+from api.symptom_rules import Rule, RuleMatcher
+
+
+def _naive(rules, text):
+    # the pre-automaton approach: nested substring scans per rule
+    ql = text.lower()
+    return [i for i, r in enumerate(rules) if any(t.rstrip("*") in ql for t in r.triggers)]
+
+
+class Command(BaseCommand):
+    help = "Benchmark the Aho-Corasick symptom matcher against nested substring scans."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rules", default="100,1000,5000", help="comma-separated rule counts")
+        parser.add_argument("--chars", default="10000,100000,1000000", help="comma-separated text sizes")
+        parser.add_argument("--triggers", type=int, default=3, help="triggers per rule")
+        parser.add_argument("--seed", type=int, default=7)
+
+    def handle(self, *args, **opts):
+        rnd = random.Random(opts["seed"])
+        word = lambda: "".join(rnd.choices(string.ascii_lowercase, k=rnd.randint(4, 10)))
+        rule_counts = [int(x) for x in opts["rules"].split(",")]
+        sizes = [int(x) for x in opts["chars"].split(",")]
+
+        self.stdout.write(f"{'rules':>7} {'chars':>9} {'build ms':>9} {'ac ms':>9} {'ns/char':>8} {'naive ms':>10} {'speedup':>8}")
+        for n_rules in rule_counts:
+            rules = [Rule(f"cat{i}", [word() for _ in range(opts["triggers"])], [f"kw{i}"]) for i in range(n_rules)]
+            t0 = time.perf_counter()
+            matcher = RuleMatcher(rules)
+            build_ms = (time.perf_counter() - t0) * 1000
+            triggers = [t for r in rules for t in r.triggers]
+
+            for size in sizes:
+                # OCR-ish text: mostly noise words with some real triggers sprinkled in
+                parts, length = [], 0
+                while length < size:
+                    w = rnd.choice(triggers) if rnd.random() < 0.02 else word()
+                    parts.append(w)
+                    length += len(w) + 1
+                text = " ".join(parts)[:size]
+
+                t0 = time.perf_counter()
+                ac = matcher.match(text)
+                ac_ms = (time.perf_counter() - t0) * 1000
+                t0 = time.perf_counter()
+                naive = _naive(rules, text)
+                naive_ms = (time.perf_counter() - t0) * 1000
+                # naive also fires inside words, so it can only find a superset
+                assert set(ac) <= set(naive)
+                self.stdout.write(
+                    f"{n_rules:>7} {size:>9} {build_ms:>9.1f} {ac_ms:>9.1f} {ac_ms * 1e6 / size:>8.0f} "
+                    f"{naive_ms:>10.1f} {naive_ms / ac_ms if ac_ms else 0:>7.1f}x"
+                )
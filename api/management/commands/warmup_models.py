@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from api.warmup import DEFAULT, WARMERS, warmup
+
+
+class Command(BaseCommand):
+    help = "Load NLP models and upstream clients now instead of on the first request."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--only", default=",".join(DEFAULT),
+                            help=f"comma-separated subset of: {', '.join(WARMERS)}")
+
+    def handle(self, *args, **opts):
+        names = [n.strip() for n in opts["only"].split(",") if n.strip()]
+        failed = False
+        for name, result in warmup(names).items():
+            if isinstance(result, float):
+                self.stdout.write(f"{name:<10} {result:>7.2f}s")
+            else:
+                failed = True
+                self.stderr.write(f"{name:<10} {result}")
+        if failed:
+            raise SystemExit(1)
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uploadedimage",
+            name="content_hash",
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -9,6 +9,8 @@ from django.db import models
 class UploadedImage(models.Model):
     image = models.ImageField(upload_to='uploads/')
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # SHA-256 of the bytes; identical uploads are stored once (see api/persistence.py)
+    content_hash = models.CharField(max_length=64, unique=True, null=True, blank=True)
     class Meta:
         app_label = 'api'
 
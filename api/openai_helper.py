@@ -1,11 +1,37 @@
 # api/openai_helper.py
-import json, time, logging
+import copy, json, time, asyncio, hashlib, itertools, logging, weakref
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, List
-from openai import OpenAI, APIConnectionError, RateLimitError, BadRequestError, AuthenticationError
 from django.conf import settings
 
+from .cache import TieredCache, make_shared_backend
+from .coalesce import AsyncSingleFlight, MicroBatcher, SingleFlight
+from .resilience import CircuitBreaker, CircuitOpen, RetryScheduler
+from .symptom_rules import match_symptoms
+from .utils import canonical_query
+
 log = logging.getLogger(__name__)
-client = OpenAI(api_key=settings.OPENAI_API_KEY)
+
+def _openai():
+    import openai  # deferred: the SDK is slow to import and most processes never call it
+    return openai
+
+_client = None
+_async_clients: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+def _get_client():
+    global _client
+    if _client is None:
+        _client = _openai().OpenAI(api_key=settings.OPENAI_API_KEY)
+    return _client
+
+def _get_async_client():
+    # httpx connections are bound to the loop that opened them
+    loop = asyncio.get_running_loop()
+    aclient = _async_clients.get(loop)
+    if aclient is None:
+        aclient = _async_clients[loop] = _openai().AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+    return aclient
 
 SYSTEM = """
 You are a pharmacy query normalizer. Given a user's free-text symptoms, return JSON:
@@ -13,6 +39,14 @@ You are a pharmacy query normalizer. Given a user's free-text symptoms, return J
 Return ONLY minified JSON (no prose).
 """
 
+# micro-batching mode: several distinct queries answered by one completion
+BATCH_SYSTEM = """
+You are a pharmacy query normalizer. The user message is JSON {"queries":[...]} holding several
+people's free-text symptoms. Return JSON {"results":[...]} with exactly one object per query, in order:
+{"cleaned_symptoms":[...],"candidate_keywords":[...],"categories":[...],"safety_flags":[...]}
+Return ONLY minified JSON (no prose).
+"""
+
 def _messages(user_query: str) -> List[Dict[str, str]]:
     return [
         {"role": "system", "content": SYSTEM},
@@ -20,63 +54,278 @@ def _messages(user_query: str) -> List[Dict[str, str]]:
     ]
 
 def _fallback_keywords(q: str) -> Dict[str, Any]:
-    ql = q.lower()
-    kw = []
-    cats = []
-    if any(w in ql for w in ["sleep", "insomnia", "melatonin", "awake"]):
-        kw += ["melatonin", "sleep gummies", "valerian"]
-        cats += ["sleep"]
-    if any(w in ql for w in ["stomach", "gas", "relief", "diarrhea"]):
-        kw += ["rolaids", "maalox", "mylanta"]
-        cats += ["stomachache"]
-    if any(w in ql for w in ["pain", "headache", "sore", "ache"]):
-        kw += ["ibuprofen", "acetaminophen", "naproxen"]
-        cats += ["pain relief"]
-    if any(w in ql for w in ["acne", "pimple"]):
-        kw += ["benzoyl peroxide", "salicylic acid", "adapalene"]
-        cats += ["acne"]
-    if any(w in ql for w in ["hair", "fall", "loss"]):
-        kw += ["biotin", "minoxidil", "ketoconazole shampoo"]
-        cats += ["hair care"]
+    cats, kw = match_symptoms(q)
     return {
         "cleaned_symptoms": [],
-        "candidate_keywords": list(dict.fromkeys(kw)),
-        "categories": list(dict.fromkeys(cats)),
+        "candidate_keywords": kw,
+        "categories": cats,
         "safety_flags": ["fallback_used"]
     }
 
+def _completion_kwargs(msgs: List[Dict[str, str]]) -> Dict[str, Any]:
+    return dict(
+        model=getattr(settings, "OPENAI_MODEL", "gpt-4o-mini"),
+        messages=msgs,
+        temperature=0.1,
+        max_tokens=200,
+        response_format={"type": "json_object"},
+        timeout=getattr(settings, "OPENAI_TIMEOUT", 20),
+    )
+
+def _normalized(data: Any) -> Dict[str, Any]:
+    data = data if isinstance(data, dict) else {}
+    for k in ["cleaned_symptoms", "candidate_keywords", "categories", "safety_flags"]:
+        data.setdefault(k, [])
+    return data
+
+def _parse(resp) -> Dict[str, Any]:
+    raw = resp.choices[0].message.content
+    return _normalized(json.loads(raw))
+
+# --- guarded upstream calls ------------------------------------------------------
+# The breaker short-circuits to _fallback_keywords while OpenAI is failing or slow.
+# Rate-limit retries wait on the scheduler's timer thread, never in the request
+# thread, and each request gives up at OPENAI_DEADLINE.
+_breaker = CircuitBreaker(
+    "openai",
+    window=settings.OPENAI_BREAKER_WINDOW,
+    min_calls=settings.OPENAI_BREAKER_MIN_CALLS,
+    failure_rate=settings.OPENAI_BREAKER_FAILURE_RATE,
+    slow_call=settings.OPENAI_BREAKER_SLOW_CALL,
+    open_seconds=settings.OPENAI_BREAKER_OPEN_SECONDS,
+    half_open_probes=settings.OPENAI_BREAKER_HALF_OPEN_PROBES,
+)
+_scheduler = RetryScheduler(workers=settings.OPENAI_MAX_CONCURRENCY, name="openai")
+
+def breaker_state() -> Dict[str, Any]:
+    return _breaker.snapshot()
+
+def _fallback_for(user_query: str, e: BaseException) -> Dict[str, Any]:
+    # deterministic fallback so UI keeps working
+    fb = _fallback_keywords(user_query)
+    if isinstance(e, CircuitOpen):
+        flag = "openai_circuit_open"
+    elif isinstance(e, TimeoutError):
+        log.warning("OpenAI deadline exceeded")
+        flag = "openai_deadline"
+    elif isinstance(e, _openai().RateLimitError):
+        log.warning("OpenAI rate limit: %s", e)
+        flag = "openai_rate_limited"
+    else:
+        log.error("OpenAI error: %s", e)
+        flag = f"openai_error:{type(e).__name__}"
+    fb["safety_flags"].append(flag)
+    return fb
+
+def _call(**kwargs):
+    if not _breaker.allow():
+        raise CircuitOpen("openai circuit is open")
+    t0 = time.monotonic()
+    try:
+        resp = _get_client().chat.completions.create(**kwargs)
+    except Exception as e:
+        # a bad request of ours says nothing about upstream health
+        _breaker.record(isinstance(e, _openai().BadRequestError), time.monotonic() - t0)
+        raise
+    _breaker.record(True, time.monotonic() - t0)
+    return resp
+
+async def _acall(**kwargs):
+    if not _breaker.allow():
+        raise CircuitOpen("openai circuit is open")
+    t0 = time.monotonic()
+    try:
+        resp = await _get_async_client().chat.completions.create(**kwargs)
+    except Exception as e:
+        _breaker.record(isinstance(e, _openai().BadRequestError), time.monotonic() - t0)
+        raise
+    _breaker.record(True, time.monotonic() - t0)
+    return resp
+
+def _retry_delay(e: BaseException, attempt: int, retries: int, backoff: float, deadline: float):
+    if not isinstance(e, _openai().RateLimitError) or attempt >= retries:
+        return None
+    log.warning("OpenAI rate limit, retry %d: %s", attempt + 1, e)
+    delay = backoff ** attempt
+    if time.monotonic() + delay >= deadline:
+        return None  # the caller would be gone before the retry lands
+    return delay
+
+def _analyze(user_query: str, retries: int, backoff: float) -> Dict[str, Any]:
+    if _breaker.rejecting():
+        return _fallback_for(user_query, CircuitOpen())
+
+    deadline = time.monotonic() + settings.OPENAI_DEADLINE
+    msgs = _messages(user_query)
+    fut = _scheduler.run(
+        lambda attempt: _parse(_call(**_completion_kwargs(msgs))),
+        lambda e, attempt: _retry_delay(e, attempt, retries, backoff, deadline),
+    )
+    try:
+        return fut.result(timeout=max(0.0, deadline - time.monotonic()))
+    except TimeoutError as e:
+        # let a late answer still warm the cache for the next asker
+        fut.add_done_callback(lambda f: _store_late(user_query, f))
+        return _fallback_for(user_query, e)
+    except Exception as e:
+        return _fallback_for(user_query, e)
+
+async def _aattempts(msgs: List[Dict[str, str]], retries: int, backoff: float, deadline: float) -> Dict[str, Any]:
+    for attempt in itertools.count():
+        try:
+            return _parse(await _acall(**_completion_kwargs(msgs)))
+        except Exception as e:
+            delay = _retry_delay(e, attempt, retries, backoff, deadline)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+
+async def _aanalyze(user_query: str, retries: int, backoff: float) -> Dict[str, Any]:
+    if _breaker.rejecting():
+        return _fallback_for(user_query, CircuitOpen())
+
+    deadline = time.monotonic() + settings.OPENAI_DEADLINE
+    try:
+        return await asyncio.wait_for(_aattempts(_messages(user_query), retries, backoff, deadline),
+                                      timeout=settings.OPENAI_DEADLINE)
+    except Exception as e:
+        return _fallback_for(user_query, e)
+
+_fanout = None
+
+def _analyze_each(queries: List[str]) -> List[Dict[str, Any]]:
+    # in parallel, so the batcher thread (and everyone queued behind it) waits
+    # for one deadline rather than one per query
+    global _fanout
+    if _fanout is None:
+        _fanout = ThreadPoolExecutor(max_workers=max(1, settings.OPENAI_BATCH_MAX), thread_name_prefix="openai-each")
+    return list(_fanout.map(lambda q: _analyze(q, 3, 1.25), queries))
+
+def _analyze_batch(queries: List[str]) -> List[Dict[str, Any]]:
+    """One completion for many distinct queries; answers come back in query order."""
+    if len(queries) == 1:
+        return [_analyze(queries[0], 3, 1.25)]
+    if _breaker.rejecting():
+        return [_fallback_for(q, CircuitOpen()) for q in queries]
+    msgs = [
+        {"role": "system", "content": BATCH_SYSTEM},
+        {"role": "user", "content": json.dumps({"queries": [q.strip() for q in queries]})},
+    ]
+    kwargs = _completion_kwargs(msgs)
+    kwargs["max_tokens"] = 200 * len(queries)
+    try:
+        resp = _call(**kwargs)
+        results = json.loads(resp.choices[0].message.content).get("results")
+        if not isinstance(results, list) or len(results) != len(queries):
+            raise ValueError("batch answer does not line up with the queries")
+    except (ValueError, AttributeError) as e:
+        log.warning("OpenAI batch answer unusable (%s); asking one by one", e)
+        return _analyze_each(queries)
+    except Exception as e:
+        return [_fallback_for(q, e) for q in queries]
+    return [_normalized(r) for r in results]
+
+_batcher = None
+
+def _get_batcher():
+    global _batcher
+    window = settings.OPENAI_BATCH_WINDOW_MS
+    if window <= 0:
+        return None
+    if _batcher is None:
+        _batcher = MicroBatcher(_analyze_batch, max_batch=settings.OPENAI_BATCH_MAX,
+                                max_wait=window / 1000, name="openai-batcher")
+    return _batcher
+
+# --- result cache ---------------------------------------------------------------
+# Keyed on the canonical query + model + prompt hash, so editing SYSTEM or
+# switching models invalidates old answers. Fallback answers are never stored.
+_cache = None
+
+def _get_cache() -> TieredCache:
+    global _cache
+    if _cache is None:
+        _cache = TieredCache(
+            maxsize=settings.OPENAI_CACHE_SIZE,
+            shared=make_shared_backend(settings.OPENAI_CACHE_BACKEND, "openai",
+                                       path=settings.OPENAI_CACHE_PATH,
+                                       max_entries=settings.OPENAI_CACHE_MAX_ENTRIES),
+        )
+    return _cache
+
+def _cache_key(user_query: str) -> str:
+    model = getattr(settings, "OPENAI_MODEL", "gpt-4o-mini")
+    prompt = hashlib.sha256((SYSTEM + BATCH_SYSTEM).encode()).hexdigest()[:16]
+    return "ai:" + hashlib.sha1(f"{model}|{prompt}|{canonical_query(user_query)}".encode()).hexdigest()
+
+def _cacheable(data: Dict[str, Any]) -> bool:
+    return "fallback_used" not in (data.get("safety_flags") or [])
+
+def cache_stats() -> dict:
+    return _get_cache().stats()
+
+# identical canonical queries in flight at the same time share one upstream call
+_flight = SingleFlight()
+_aflight = AsyncSingleFlight()
+
+def _store_late(user_query: str, fut) -> None:
+    if fut.cancelled() or fut.exception() is not None:
+        return
+    data = fut.result()
+    if _cacheable(data):
+        _get_cache().set(_cache_key(user_query), copy.deepcopy(data), settings.OPENAI_CACHE_TTL)
+
+def _fetch(user_query: str, key: str, retries: int, backoff: float) -> Dict[str, Any]:
+    batcher = _get_batcher()
+    if batcher is not None:
+        fut = batcher.submit(user_query)
+        try:
+            data = fut.result(timeout=settings.OPENAI_DEADLINE)
+        except TimeoutError as e:
+            fut.add_done_callback(lambda f: _store_late(user_query, f))
+            data = _fallback_for(user_query, e)
+    else:
+        data = _analyze(user_query, retries, backoff)
+    if _cacheable(data):
+        _get_cache().set(key, copy.deepcopy(data), settings.OPENAI_CACHE_TTL)
+    return data
+
+async def _afetch(user_query: str, key: str, retries: int, backoff: float) -> Dict[str, Any]:
+    batcher = _get_batcher()
+    if batcher is not None:
+        fut = batcher.submit(user_query)
+        try:
+            data = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(fut)), settings.OPENAI_DEADLINE)
+        except asyncio.TimeoutError as e:
+            fut.add_done_callback(lambda f: _store_late(user_query, f))
+            data = _fallback_for(user_query, e)
+    else:
+        data = await _aanalyze(user_query, retries, backoff)
+    if _cacheable(data):
+        await asyncio.to_thread(_get_cache().set, key, copy.deepcopy(data), settings.OPENAI_CACHE_TTL)
+    return data
+
 def analyze_symptoms_to_keywords(user_query: str, retries: int = 3, backoff: float = 1.25) -> Dict[str, Any]:
     if not settings.OPENAI_API_KEY:
         return _fallback_keywords(user_query)
 
-    msgs = _messages(user_query)
-    for attempt in range(retries + 1):
-        try:
-            resp = client.chat.completions.create(
-                model=getattr(settings, "OPENAI_MODEL", "gpt-4o-mini"),
-                messages=msgs,
-                temperature=0.1,
-                max_tokens=200,
-                response_format={"type": "json_object"},
-                timeout=getattr(settings, "OPENAI_TIMEOUT", 20),
-            )
-            raw = resp.choices[0].message.content
-            data = json.loads(raw)
-            for k in ["cleaned_symptoms", "candidate_keywords", "categories", "safety_flags"]:
-                data.setdefault(k, [])
-            return data
-        except RateLimitError as e:
-            log.warning("OpenAI rate limit: %s", e)
-            if attempt < retries:
-                time.sleep(backoff ** attempt)
-                continue
-            # final fallback
-            fb = _fallback_keywords(user_query)
-            fb["safety_flags"].append("openai_rate_limited")
-            return fb
-        except (APIConnectionError, BadRequestError, AuthenticationError, Exception) as e:
-            log.error("OpenAI error: %s", e)
-            # deterministic fallback so UI keeps working
-            fb = _fallback_keywords(user_query)
-            fb["safety_flags"].append(f"openai_error:{type(e).__name__}")
-            return fb
+    key = _cache_key(user_query)
+    hit, tier = _get_cache().get(key)
+    if tier is not None:
+        return copy.deepcopy(hit)
+
+    data, _ = _flight.do(key, _fetch, user_query, key, retries, backoff)
+    return copy.deepcopy(data)
+
+async def aanalyze_symptoms_to_keywords(user_query: str, retries: int = 3, backoff: float = 1.25) -> Dict[str, Any]:
+    """Async twin of analyze_symptoms_to_keywords; backoff sleeps don't hold a thread."""
+    if not settings.OPENAI_API_KEY:
+        return _fallback_keywords(user_query)
+
+    key = _cache_key(user_query)
+    hit, tier = await asyncio.to_thread(_get_cache().get, key)  # shared tier does blocking I/O
+    if tier is not None:
+        return copy.deepcopy(hit)
+
+    data, _ = await _aflight.do(key, _afetch, user_query, key, retries, backoff)
+    return copy.deepcopy(data)
@@ -0,0 +1,223 @@
+# api/persistence.py
+"""
+Background persistence of uploaded images (storage = S3 via STORAGES["default"]).
+
+The request thread only copies the upload into a local spool directory
+(named by its SHA-256) and queues the hash; worker threads push spooled
+files to storage and bulk-insert UploadedImage rows. The spool makes this
+crash safe: whatever is left there is picked up again on the next start
+and by a sweeper thread every `retry_seconds`, busy or not (failed writes).
+Identical images are stored once.
+"""
+import contextlib, logging, os, queue, tempfile, threading, time
+from collections import OrderedDict
+from hashlib import sha256
+
+from django.conf import settings
+
+log = logging.getLogger(__name__)
+
+_EXTENSIONS = {"image/jpeg": ".jpg", "image/png": ".png", "image/webp": ".webp", "image/heic": ".heic"}
+
+
+def _extension(file) -> str:
+    ext = os.path.splitext(getattr(file, "name", "") or "")[1].lower()
+    if ext in (".jpg", ".jpeg", ".png", ".webp", ".heic", ".gif", ".bmp", ".tif", ".tiff"):
+        return ".jpg" if ext == ".jpeg" else ext
+    return _EXTENSIONS.get(getattr(file, "content_type", ""), ".jpg")
+
+
+class ImageWriter:
+    def __init__(self, spool_dir: str, workers: int = 2, queue_size: int = 256,
+                 batch_size: int = 20, retry_seconds: float = 60.0, max_spooled: int = 5000):
+        self.spool_dir = spool_dir
+        self.batch_size = batch_size
+        self.retry_seconds = retry_seconds
+        self.max_spooled = max_spooled
+        self._queue: "queue.Queue[str]" = queue.Queue(maxsize=queue_size)
+        self._queued = set()                      # spool names waiting or being written
+        self._known: "OrderedDict[str, None]" = OrderedDict()  # hashes already stored (bounded)
+        self._lock = threading.Lock()
+        self._stats = {"spooled": 0, "duplicates": 0, "stored": 0, "failed": 0, "dropped": 0}
+        self._on_disk = 0                         # spooled files; recounted on every sweep
+        os.makedirs(spool_dir, exist_ok=True)
+        self._sweep()  # leftovers from a previous run
+        for i in range(workers):
+            threading.Thread(target=self._run, name=f"image-writer-{i}", daemon=True).start()
+        if workers:
+            threading.Thread(target=self._sweep_forever, name="image-writer-sweep", daemon=True).start()
+
+    # --- request side ---------------------------------------------------------------
+
+    def submit(self, file) -> bool:
+        """Spool `file` and queue it. Returns False for duplicates or when the spool is full."""
+        h = sha256()
+        fd, tmp = tempfile.mkstemp(dir=self.spool_dir, suffix=".part")
+        try:
+            file.seek(0)
+            with os.fdopen(fd, "wb") as out:
+                for chunk in file.chunks():
+                    h.update(chunk)
+                    out.write(chunk)
+            file.seek(0)
+            digest = h.hexdigest()
+            name = digest + _extension(file)
+            with self._lock:
+                duplicate = digest in self._known or os.path.exists(os.path.join(self.spool_dir, name))
+            if duplicate:
+                self._count("duplicates")
+                return False
+            if self._on_disk >= self.max_spooled:
+                self._count("dropped")
+                log.warning("image spool full (%d files); not persisting %s", self.max_spooled, name)
+                return False
+            os.replace(tmp, os.path.join(self.spool_dir, name))
+            tmp = None
+            with self._lock:
+                self._on_disk += 1
+        finally:
+            if tmp:
+                os.unlink(tmp)
+        self._count("spooled")
+        self._enqueue(name)
+        return True
+
+    def _enqueue(self, name: str) -> None:
+        with self._lock:
+            if name in self._queued:
+                return
+            self._queued.add(name)
+        try:
+            self._queue.put_nowait(name)
+        except queue.Full:
+            # stays on disk; the next sweep picks it up
+            with self._lock:
+                self._queued.discard(name)
+
+    # --- worker side ----------------------------------------------------------------
+
+    def _sweep(self) -> None:
+        # other processes may share the spool and remove files under us
+        cutoff = time.time() - 3600
+        spooled = 0
+        for n in os.listdir(self.spool_dir):
+            path = os.path.join(self.spool_dir, n)
+            if n.endswith(".part"):
+                with contextlib.suppress(FileNotFoundError):
+                    if os.path.getmtime(path) < cutoff:
+                        os.unlink(path)  # torn write from a crash
+            else:
+                spooled += 1
+                self._enqueue(n)
+        with self._lock:
+            self._on_disk = spooled
+
+    def _sweep_forever(self) -> None:
+        # on its own timer: under steady traffic the queue is never idle
+        while True:
+            time.sleep(self.retry_seconds)
+            try:
+                self._sweep()
+            except Exception as e:
+                log.warning("spool sweep failed: %s", e)
+
+    def _take(self) -> list:
+        try:
+            batch = [self._queue.get(timeout=self.retry_seconds)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._take()
+            if not batch:
+                continue
+            try:
+                self._write(batch)
+            except Exception as e:
+                self._count("failed", len(batch))
+                log.warning("persisting %d uploads failed (kept in spool): %s", len(batch), e)
+            finally:
+                with self._lock:
+                    self._queued.difference_update(batch)
+                from django.db import close_old_connections
+                close_old_connections()
+
+    def _write(self, names: list) -> None:
+        from django.core.files import File
+        from django.core.files.storage import default_storage
+        from .models import UploadedImage
+
+        by_hash = {os.path.splitext(n)[0]: n for n in names}
+        existing = set(UploadedImage.objects.filter(content_hash__in=list(by_hash))
+                       .values_list("content_hash", flat=True))
+        rows, done = [], []
+        for digest, name in by_hash.items():
+            path = os.path.join(self.spool_dir, name)
+            if digest not in existing:
+                try:
+                    fh = open(path, "rb")
+                except FileNotFoundError:
+                    continue  # another process sharing the spool stored it
+                with fh:
+                    # content-addressed name: a retry after a crash overwrites the same object
+                    stored = default_storage.save(f"uploads/{name}", File(fh, name=name))
+                rows.append(UploadedImage(image=stored, content_hash=digest))
+            done.append((digest, path))
+        UploadedImage.objects.bulk_create(rows, ignore_conflicts=True)
+        with self._lock:
+            for digest, _ in done:
+                self._known[digest] = None
+            while len(self._known) > 10000:
+                self._known.popitem(last=False)
+        removed = 0
+        for _, path in done:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(path)
+                removed += 1
+        with self._lock:
+            self._on_disk = max(0, self._on_disk - removed)
+        self._count("stored", len(rows))
+        self._count("duplicates", len(done) - len(rows))
+
+    def _count(self, field: str, n: int = 1) -> None:
+        with self._lock:
+            self._stats[field] += n
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+            s["on_disk"] = self._on_disk
+        s["queued"] = self._queue.qsize()
+        return s
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_writer() -> ImageWriter:
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ImageWriter(settings.PERSIST_SPOOL_DIR, workers=settings.PERSIST_WORKERS,
+                                  queue_size=settings.PERSIST_QUEUE_SIZE, batch_size=settings.PERSIST_BATCH,
+                                  max_spooled=settings.PERSIST_SPOOL_MAX_FILES)
+    return _writer
+
+def persist_upload(file) -> None:
+    """Hand an upload to the background writer; never raises into the request."""
+    if not settings.PERSIST_UPLOADS:
+        return
+    try:
+        get_writer().submit(file)
+    except Exception as e:
+        log.warning("could not spool upload %s: %s", getattr(file, "name", "?"), e)
+
+def persistence_stats() -> dict:
+    return get_writer().stats() if settings.PERSIST_UPLOADS else {"enabled": False}
@@ -0,0 +1,245 @@
+# api/postprocess.py
+"""
+Result post-processing, applied to merged search results before they go out:
+
+- parse_price(): "$7.99", "2 for $10", "$10 for 2", "$4.97/ea", "$1,299.00",
+  "99¢", "Was $8.99 Now $6.99" -> integer cents, quantity, unit price and unit.
+- near-duplicate collapsing: the same product listed by several retailers or
+  passes (shopping / web) becomes one entry with an `offers` list. Titles are
+  compared on word sets via MinHash + LSH banding, then confirmed by exact
+  Jaccard; sizes/strengths (numbers in the title) must match exactly.
+- price filtering and sorting on `best_price_cents` / `best_unit_price_cents`,
+  the cheapest offer of a collapsed product (the top-level price stays that of
+  the best-ranked listing).
+
+Records are __slots__ objects while processing; output is plain dicts.
+
+Cost is dominated by dedup: about 40-55 µs per item up to 10k items and ~90 µs
+at 100k (9 s; bench_postprocess, whose synthetic titles share a small vocabulary
+and so crowd the LSH buckets). Fine for search responses, which are at most a
+few thousand items; not meant for offline catalogue-sized runs.
+"""
+from __future__ import annotations
+import random, re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# --- prices ---------------------------------------------------------------------
+_AMOUNT = r"(\d{1,3}(?:,\d{3})+|\d+)(?:\.(\d{1,2}))?"
+_MULTI_RE = re.compile(r"(\d+)\s*(?:for|/)\s*\$\s*" + _AMOUNT)          # 2 for $10, 2/$10
+_FOR_QTY_RE = re.compile(r"\$\s*" + _AMOUNT + r"\s*for\s*(\d+)\b")        # $10 for 2
+_DOLLAR_RE = re.compile(r"\$\s*" + _AMOUNT + r"(?:\s*/\s*([a-z]+))?")
+_BARE_RE = re.compile(r"^\s*(?:usd\s*)?" + _AMOUNT + r"(?:\s*/\s*([a-z]+))?")
+_CENTS_RE = re.compile(r"(\d+)\s*(?:¢|cents?\b)")
+# a label just before an amount that makes it the old price ("Was $8.99 Now $6.99")
+_OLD_LABEL_RE = re.compile(r"\b(?:was|reg(?:ular)?|list(?:\s+price)?|orig(?:inal)?|msrp|compare\s+at)\W*$")
+
+
+def _cents(whole: str, frac: Optional[str]) -> int:
+    return int(whole.replace(",", "")) * 100 + (int(frac.ljust(2, "0")) if frac else 0)
+
+
+def _current_amount(s: str):
+    """First $ amount not labelled as the old price; the first one if all are."""
+    first = None
+    for m in _DOLLAR_RE.finditer(s):
+        if not _OLD_LABEL_RE.search(s, max(0, m.start() - 24), m.start()):
+            return m
+        first = first or m
+    return first
+
+
+def parse_price(raw) -> Tuple[Optional[int], int, Optional[int], Optional[str]]:
+    """(price_cents, quantity, unit_price_cents, unit); (None, 1, None, None) if unparseable."""
+    if raw is None:
+        return None, 1, None, None
+    if isinstance(raw, (int, float)):
+        cents = int(round(raw * 100))
+        return cents, 1, cents, None
+    s = raw.lower()
+    m = _MULTI_RE.search(s)
+    if m:
+        qty = int(m.group(1)) or 1
+        cents = _cents(m.group(2), m.group(3))
+        return cents, qty, round(cents / qty), "ea"
+    m = _FOR_QTY_RE.search(s)
+    if m:
+        qty = int(m.group(3)) or 1
+        cents = _cents(m.group(1), m.group(2))
+        return cents, qty, round(cents / qty), "ea"
+    m = _current_amount(s)
+    if m is None:
+        c = _CENTS_RE.search(s)
+        if c:
+            cents = int(c.group(1))
+            return cents, 1, cents, None
+        m = _BARE_RE.match(s)
+    if m:
+        cents = _cents(m.group(1), m.group(2))
+        unit = m.group(3)
+        return cents, 1, cents, ("ea" if unit in ("each", "ea", "unit", "ct") else unit)
+    return None, 1, None, None
+
+
+# --- records --------------------------------------------------------------------
+_WORD_RE = re.compile(r"[a-z]+|\d+(?:\.\d+)?")
+_NOISE = frozenset("the a an and or with for of in by to pack count ct".split())
+
+
+class Record:
+    __slots__ = ("pos", "item", "cents", "qty", "unit_cents", "unit", "words", "numbers")
+
+    def __init__(self, pos: int, item: Dict):
+        self.pos = pos
+        self.item = item
+        self.cents, self.qty, self.unit_cents, self.unit = parse_price(item.get("price"))
+        tokens = _WORD_RE.findall((item.get("title") or "").lower())
+        self.words = frozenset(t for t in tokens if t not in _NOISE)
+        self.numbers = frozenset(t for t in tokens if t[0].isdigit())
+
+    def to_dict(self) -> Dict:
+        out = dict(self.item)
+        out.update(price_cents=self.cents, quantity=self.qty, unit_price_cents=self.unit_cents, unit=self.unit)
+        return out
+
+    def offer(self) -> Dict:
+        return {"retailer": self.item.get("retailer"), "price": self.item.get("price"),
+                "price_cents": self.cents, "url": self.item.get("url")}
+
+
+# --- near-duplicates ------------------------------------------------------------
+# 16 MinHash functions (a*h + b mod 2^61-1 over Python's per-process string hash),
+# banded 8 x 2: a pair at Jaccard 0.7 shares a band with probability ~0.995.
+# Per-word hash columns are computed once per call; a title's signature is the
+# column-wise min over its words.
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601)
+_COEFS = tuple((_rng.randrange(1, _PRIME), _rng.randrange(_PRIME)) for _ in range(16))
+del _rng
+_BANDS, _ROWS = 8, 2
+DUP_THRESHOLD = 0.7
+_BUCKET_PROBES = 4
+
+
+def _word_hashes(word: str) -> Tuple[int, ...]:
+    h = hash(word) & _PRIME
+    return tuple((a * h + b) % _PRIME for a, b in _COEFS)
+
+
+def _signature(words: Iterable[str], cache: Optional[Dict[str, Tuple[int, ...]]] = None) -> Tuple[int, ...]:
+    cache = {} if cache is None else cache
+    cols = [cache[w] if w in cache else cache.setdefault(w, _word_hashes(w)) for w in words]
+    return tuple(map(min, *cols)) if len(cols) > 1 else cols[0]
+
+
+def _same_product(a: Record, b: Record) -> bool:
+    if a.numbers != b.numbers:  # 100ct vs 200ct, 200mg vs 400mg: different products
+        return False
+    inter = len(a.words & b.words)
+    return inter / (len(a.words) + len(b.words) - inter) >= DUP_THRESHOLD
+
+
+def _groups(recs: List[Record]) -> List[List[Record]]:
+    parent = list(range(len(recs)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i: int, j: int) -> None:
+        ri, rj = find(i), find(j)
+        if ri != rj:
+            parent[max(ri, rj)] = min(ri, rj)  # lowest position (best ranked) stays the root
+
+    # identical word sets are merged without hashing; one representative each goes through LSH
+    exact: Dict[frozenset, int] = {}
+    reps: List[int] = []
+    for i, r in enumerate(recs):
+        if not r.words:
+            continue
+        j = exact.setdefault(r.words, i)
+        if j == i:
+            reps.append(i)
+        elif r.numbers == recs[j].numbers:
+            union(j, i)
+
+    # numbers are part of the bucket key (they must match anyway), and each new
+    # item is only checked against the most recent members of a crowded bucket
+    buckets: Dict[Tuple, List[int]] = {}
+    hashes: Dict[str, Tuple[int, ...]] = {}
+    for i in reps:
+        words = recs[i].words
+        size = len(words)
+        sig = _signature(words, hashes)
+        nums = recs[i].numbers
+        ri = find(i)
+        checked = set()  # a pair can share several bands; compare it once
+        for b in range(_BANDS):
+            members = buckets.setdefault((b, nums) + sig[b * _ROWS:(b + 1) * _ROWS], [])
+            for j in members[-_BUCKET_PROBES:]:
+                rj = find(j)
+                if rj == ri or rj in checked:
+                    continue
+                checked.add(rj)
+                # _same_product inlined (numbers already match through the bucket key)
+                other = recs[j].words
+                inter = len(words & other)
+                if inter >= DUP_THRESHOLD * (size + len(other) - inter):
+                    union(i, j)
+                    ri = find(i)
+            members.append(i)
+
+    groups: Dict[int, List[Record]] = {}
+    for i, r in enumerate(recs):
+        groups.setdefault(find(i), []).append(r)
+    return [groups[k] for k in sorted(groups)]
+
+
+# --- entry point ----------------------------------------------------------------
+SORTS = ("relevance", "price", "-price", "unit_price")
+
+
+def _best(group: List[Record], field: str) -> Optional[int]:
+    return min((getattr(r, field) for r in group if getattr(r, field) is not None), default=None)
+
+
+def postprocess(items: List[Dict], sort: str = "relevance", min_price: Optional[float] = None,
+                max_price: Optional[float] = None, dedupe: bool = True) -> List[Dict]:
+    """
+    Parsed prices on every item, near-duplicates collapsed into the best-ranked
+    listing (with `offers` from all retailers), then filtered and sorted.
+    Filters and the price sorts use `best_price_cents`, the cheapest offer,
+    which is also emitted on each item. Error entries are passed through at the end.
+    """
+    errors = [it for it in items if "error" in it or "debug" in it]
+    recs = [Record(i, it) for i, it in enumerate(items) if "error" not in it and "debug" not in it]
+
+    groups = _groups(recs) if dedupe else [[r] for r in recs]
+    lo = None if min_price is None else int(round(min_price * 100))
+    hi = None if max_price is None else int(round(max_price * 100))
+
+    picked: List[Tuple[Record, List[Record], Optional[int], Optional[int]]] = []
+    for group in groups:
+        best = _best(group, "cents")
+        if lo is not None or hi is not None:
+            if best is None or (lo is not None and best < lo) or (hi is not None and best > hi):
+                continue
+        picked.append((group[0], group, best, _best(group, "unit_cents")))
+
+    inf = float("inf")
+    if sort == "price":
+        picked.sort(key=lambda p: inf if p[2] is None else p[2])
+    elif sort == "-price":
+        picked.sort(key=lambda p: -inf if p[2] is None else p[2], reverse=True)
+    elif sort == "unit_price":
+        picked.sort(key=lambda p: inf if p[3] is None else p[3])
+
+    out = []
+    for head, group, best, best_unit in picked:
+        d = head.to_dict()
+        d.update(best_price_cents=best, best_unit_price_cents=best_unit)
+        if len(group) > 1:
+            d["offers"] = [r.offer() for r in sorted(group, key=lambda r: (r.cents is None, r.cents or 0))]
+        out.append(d)
+    return out + errors
@@ -1,37 +1,22 @@
 # api/providers_serpapi.py
-import os, requests
-from urllib.parse import urlparse
+import os, json, time, random, asyncio, hashlib, itertools, threading, weakref, requests
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+
+from .cache import TieredCache, make_shared_backend
+from .retailers import get_registry, host_of
+from .utils import normalize_query
 
 SERPAPI_KEY = os.getenv("SERPAPI_KEY")
 GL = os.getenv("SERPAPI_GL", "us")
 HL = os.getenv("SERPAPI_HL", "en")
 LOCATION = os.getenv("SERPAPI_LOCATION", "United States")
 
-_ALLOWED = {
-    "walmart":   ["walmart.com"],
-    "target":    ["target.com"],
-    "cvs":       ["cvs.com"],
-    "walgreens": ["walgreens.com"],
-    "costco":    ["costco.com"],
-    "amazon":    ["amazon.com"],
-}
+# which retailer a host belongs to is decided by api/retailers.py (suffix trie over labels)
 
-def _host_ok(hostname: str, want: list[str]) -> bool:
-    host = (hostname or "").lower().replace("www.", "")
-    # collapse all allowed domains for requested retailers
-    allowed = []
-    for w in want:
-        allowed += _ALLOWED.get(w, [])
-    # accept exact end or obvious contain (some results include subpaths/cdn)
-    return any(host.endswith(dom) or dom in host for dom in allowed)
-
-def _map_item(link: str, title: str | None, price) -> dict:
-    from_host = (urlparse(link).hostname or "").replace("www.", "")
-    retailer = from_host
-    for k, doms in _ALLOWED.items():
-        if any(from_host.endswith(d) for d in doms):
-            retailer = k
-            break
+def _map_item(link: str, title: str | None, price, retailer: str) -> dict:
     return {
         "retailer": retailer,
         "title": (title or "").strip(),
@@ -39,35 +24,173 @@ def _map_item(link: str, title: str | None, price) -> dict:
         "url": link,
     }
 
-def _serpapi_get(params: dict):
-    params = {
+def _mapped(link: str, title: str | None, price, want: set):
+    """The mapped item when `link` is on one of the wanted retailers' domains, else None."""
+    retailer = get_registry().classify(host_of(link))
+    return _map_item(link, title, price, retailer) if retailer in want else None
+
+# --- HTTP client ---------------------------------------------------------------
+SERPAPI_URL = "https://serpapi.com/search.json"
+SERPAPI_CONNECT_TIMEOUT = float(os.getenv("SERPAPI_CONNECT_TIMEOUT", "3.05"))
+SERPAPI_READ_TIMEOUT = float(os.getenv("SERPAPI_READ_TIMEOUT", "25"))
+SERPAPI_POOL_SIZE = int(os.getenv("SERPAPI_POOL_SIZE", "20"))
+SERPAPI_RETRIES = int(os.getenv("SERPAPI_RETRIES", "2"))
+SERPAPI_BACKOFF_BASE = float(os.getenv("SERPAPI_BACKOFF_BASE", "0.5"))
+SERPAPI_BACKOFF_CAP = float(os.getenv("SERPAPI_BACKOFF_CAP", "8"))
+SERPAPI_RETRY_RATIO = float(os.getenv("SERPAPI_RETRY_RATIO", "0.1"))          # retries per request
+SERPAPI_RETRY_MIN_PER_SEC = float(os.getenv("SERPAPI_RETRY_MIN_PER_SEC", "0.2"))
+
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+class TokenBudget:
+    """
+    Process-wide token bucket. Each request deposits `ratio` tokens and each
+    extra call (retry) withdraws one, so extra load stays a bounded fraction
+    of real traffic. A small trickle keeps quiet processes able to spend.
+    """
+
+    def __init__(self, ratio: float, min_per_sec: float, cap: float = 10.0):
+        self.ratio = ratio
+        self.min_per_sec = min_per_sec
+        self.cap = cap
+        self._tokens = cap
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.cap, self._tokens + (now - self._last) * self.min_per_sec)
+        self._last = now
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.cap, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+_retry_budget = TokenBudget(SERPAPI_RETRY_RATIO, SERPAPI_RETRY_MIN_PER_SEC)
+
+_session = None
+_session_lock = threading.Lock()
+
+def _get_session() -> requests.Session:
+    """Keep-alive session shared by both passes; reuses TCP+TLS connections."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                s = requests.Session()
+                s.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=SERPAPI_POOL_SIZE, max_retries=0))
+                _session = s
+    return _session
+
+def _retry_after(headers):
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def _retry_delay(attempt: int, retry_after=None):
+    """Seconds to wait before the next attempt, or None to give up."""
+    if attempt >= SERPAPI_RETRIES:
+        return None
+    if retry_after is not None and retry_after > SERPAPI_BACKOFF_CAP:
+        return None  # not worth holding the request that long
+    if not _retry_budget.withdraw():
+        return None
+    # full jitter, but never earlier than the server asked for
+    delay = random.uniform(0, min(SERPAPI_BACKOFF_CAP, SERPAPI_BACKOFF_BASE * 2 ** attempt))
+    return max(delay, retry_after or 0.0)
+
+def _with_defaults(params: dict) -> dict:
+    return {
         **params,
         "gl": GL,
         "hl": HL,
         "location": LOCATION,
         "api_key": SERPAPI_KEY,
     }
-    r = requests.get("https://serpapi.com/search.json", params=params, timeout=25)
-    r.raise_for_status()
-    return r.json()
 
-def google_shopping_search(query: str, retailers: list[str], num: int = 24, debug: bool = False):
-    if not SERPAPI_KEY:
-        return [{"retailer":"serpapi", "error":"SERPAPI_KEY missing"}]
+def _serpapi_get(params: dict):
+    params = _with_defaults(params)
+    _retry_budget.deposit()
+    for attempt in itertools.count():
+        try:
+            r = _get_session().get(SERPAPI_URL, params=params,
+                                   timeout=(SERPAPI_CONNECT_TIMEOUT, SERPAPI_READ_TIMEOUT))
+        except (requests.ConnectionError, requests.Timeout):
+            delay = _retry_delay(attempt)
+            if delay is None:
+                raise
+        else:
+            if r.status_code not in _RETRY_STATUS:
+                r.raise_for_status()
+                return r.json()
+            delay = _retry_delay(attempt, _retry_after(r.headers))
+            if delay is None:
+                r.raise_for_status()
+            r.close()
+        time.sleep(delay)
 
-    out = []
+# async twin for the ASGI views; one client per event loop
+SERPAPI_ASYNC_MAX_CONNECTIONS = int(os.getenv("SERPAPI_ASYNC_MAX_CONNECTIONS", "100"))
+_async_clients: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
 
-    # --- Pass 1: Google Shopping engine ---
-    try:
-        data = _serpapi_get({
-            "engine": "google_shopping",
-            "q": query,
-            "num": str(num),
-        })
-    except Exception as e:
-        data = {}
-        if debug: out.append({"retailer":"serpapi","error":f"shopping engine error: {e}"})
+def _get_async_client():
+    import httpx
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(SERPAPI_READ_TIMEOUT, connect=SERPAPI_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=SERPAPI_ASYNC_MAX_CONNECTIONS,
+                                max_keepalive_connections=SERPAPI_POOL_SIZE),
+        )
+        _async_clients[loop] = client
+    return client
+
+async def _aserpapi_get(params: dict):
+    import httpx
+    params = _with_defaults(params)
+    _retry_budget.deposit()
+    for attempt in itertools.count():
+        try:
+            r = await _get_async_client().get(SERPAPI_URL, params=params)
+        except httpx.TransportError:
+            delay = _retry_delay(attempt)
+            if delay is None:
+                raise
+        else:
+            if r.status_code not in _RETRY_STATUS:
+                r.raise_for_status()
+                return r.json()
+            delay = _retry_delay(attempt, _retry_after(r.headers))
+            if delay is None:
+                r.raise_for_status()
+        await asyncio.sleep(delay)
+
+def _shopping_params(query: str, num: int) -> dict:
+    return {
+        "engine": "google_shopping",
+        "q": query,
+        "num": str(num),
+    }
 
+def _filter_shopping(data: dict, retailers: list[str], num: int) -> list:
     candidates = []
     for key in ("shopping_results", "product_results", "organic_results"):
         items = data.get(key) or []
@@ -75,52 +198,247 @@ def google_shopping_search(query: str, retailers: list[str], num: int = 24, debu
             candidates.extend(items)
 
     # Map + filter by domain
+    want = set(retailers)
+    out = []
     for it in candidates:
         link  = it.get("link") or it.get("product_link") or it.get("source") or ""
-        title = it.get("title") or it.get("product_title")
-        price = it.get("price") or it.get("extracted_price")
         if not link:
             continue
-        host = urlparse(link).hostname or ""
-        if _host_ok(host, retailers):
-            out.append(_map_item(link, title, price))
-        if len(out) >= num:
-            break
+        item = _mapped(link, it.get("title") or it.get("product_title"),
+                       it.get("price") or it.get("extracted_price"), want)
+        if item is not None:
+            out.append(item)
+            if len(out) >= num:
+                break
+    return out
 
-    if out:
-        return out
+def _shopping_pass(query: str, retailers: list[str], num: int):
+    """Pass 1: Google Shopping engine. Returns (mapped items, raw response)."""
+    t0 = time.monotonic()
+    data = _serpapi_get(_shopping_params(query, num))
+    out = _filter_shopping(data, retailers, num)
+    _pass1_stats.observe(_miss_key(query, retailers), time.monotonic() - t0, hit=bool(out))
+    return out, data
 
-    # --- Pass 2 (fallback): Google Web engine with site: filters ---
+async def _ashopping_pass(query: str, retailers: list[str], num: int):
+    t0 = time.monotonic()
+    data = await _aserpapi_get(_shopping_params(query, num))
+    out = _filter_shopping(data, retailers, num)
+    _pass1_stats.observe(_miss_key(query, retailers), time.monotonic() - t0, hit=bool(out))
+    return out, data
+
+def _web_query(query: str, retailers: list[str]) -> str:
     # Build "site:walmart.com OR site:target.com ..." query
     site_parts = []
     for r in retailers:
-        for dom in _ALLOWED.get(r, []):
+        for dom in get_registry().domains(r):
             site_parts.append(f"site:{dom}")
     sites_query = " OR ".join(site_parts) if site_parts else ""
-    web_q = f"{query} {sites_query}".strip()
+    return f"{query} {sites_query}".strip()
 
-    try:
-        web = _serpapi_get({
-            "engine": "google",
-            "q": web_q,
-            "num": str(num * 2),  # ask for more since we filter client-side
-            "safe": "active",
-        })
-    except Exception as e:
-        if debug:
-            return [{"retailer":"serpapi","error":f"web engine error: {e}"}]
-        return []
+def _web_params(query: str, retailers: list[str], num: int) -> dict:
+    return {
+        "engine": "google",
+        "q": _web_query(query, retailers),
+        "num": str(num * 2),  # ask for more since we filter client-side
+        "safe": "active",
+    }
 
+def _filter_web(web: dict, retailers: list[str], num: int) -> list:
+    want = set(retailers)
+    out = []
     for it in web.get("organic_results", []):
         link = it.get("link")
-        title = it.get("title")
         if not link:
             continue
-        host = urlparse(link).hostname or ""
-        if _host_ok(host, retailers):
-            out.append(_map_item(link, title, None))
-        if len(out) >= num:
-            break
+        item = _mapped(link, it.get("title"), None, want)
+        if item is not None:
+            out.append(item)
+            if len(out) >= num:
+                break
+    return out
+
+def _web_pass(query: str, retailers: list[str], num: int):
+    """Pass 2 (fallback): Google Web engine with site: filters. Returns (mapped items, raw response)."""
+    web = _serpapi_get(_web_params(query, retailers, num))
+    return _filter_web(web, retailers, num), web
+
+async def _aweb_pass(query: str, retailers: list[str], num: int):
+    web = await _aserpapi_get(_web_params(query, retailers, num))
+    return _filter_web(web, retailers, num), web
+
+# --- hedged execution -----------------------------------------------------------
+# Opt-in: start Pass 2 speculatively when Pass 1 is slower than its recent
+# percentile latency, or right away for queries that usually miss Pass 1.
+SERPAPI_HEDGE = os.getenv("SERPAPI_HEDGE", "0") in ("1", "true", "yes")
+SERPAPI_HEDGE_PERCENTILE = float(os.getenv("SERPAPI_HEDGE_PERCENTILE", "90"))
+SERPAPI_HEDGE_DELAY = float(os.getenv("SERPAPI_HEDGE_DELAY", "3"))  # seconds, until enough samples exist
+SERPAPI_HEDGE_MIN_SAMPLES = int(os.getenv("SERPAPI_HEDGE_MIN_SAMPLES", "20"))
+SERPAPI_HEDGE_MISS_RATE = float(os.getenv("SERPAPI_HEDGE_MISS_RATE", "0.5"))
+SERPAPI_HEDGE_RATIO = float(os.getenv("SERPAPI_HEDGE_RATIO", "0.1"))  # hedges per search, caps quota use
+SERPAPI_HEDGE_MIN_PER_SEC = float(os.getenv("SERPAPI_HEDGE_MIN_PER_SEC", "0.05"))
+
+class _PassStats:
+    """Recent Pass 1 latencies plus a bounded per-query miss history."""
+
+    def __init__(self, window: int = 256, max_queries: int = 4096):
+        self._latencies: deque = deque(maxlen=window)
+        self._misses: "OrderedDict[str, tuple[int, int]]" = OrderedDict()
+        self._max_queries = max_queries
+        self._lock = threading.Lock()
+
+    def observe(self, key: str, latency: float, hit: bool) -> None:
+        with self._lock:
+            self._latencies.append(latency)
+            misses, total = self._misses.pop(key, (0, 0))
+            self._misses[key] = (misses + (not hit), total + 1)
+            while len(self._misses) > self._max_queries:
+                self._misses.popitem(last=False)
+
+    def hedge_delay(self) -> float:
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < SERPAPI_HEDGE_MIN_SAMPLES:
+            return SERPAPI_HEDGE_DELAY
+        idx = min(len(samples) - 1, int(len(samples) * SERPAPI_HEDGE_PERCENTILE / 100))
+        return samples[idx]
+
+    def likely_miss(self, key: str) -> bool:
+        with self._lock:
+            misses, total = self._misses.get(key, (0, 0))
+        return total >= 2 and misses / total >= SERPAPI_HEDGE_MISS_RATE
+
+_pass1_stats = _PassStats()
+_hedge_budget = TokenBudget(SERPAPI_HEDGE_RATIO, SERPAPI_HEDGE_MIN_PER_SEC)
+_hedge_pool = None
+_hedge_pool_lock = threading.Lock()
+
+def _miss_key(query: str, retailers: list[str]) -> str:
+    return normalize_query(query).lower() + "|" + ",".join(sorted(retailers))
+
+def _get_hedge_pool() -> ThreadPoolExecutor:
+    global _hedge_pool
+    if _hedge_pool is None:
+        with _hedge_pool_lock:
+            if _hedge_pool is None:
+                _hedge_pool = ThreadPoolExecutor(max_workers=SERPAPI_POOL_SIZE, thread_name_prefix="serpapi")
+    return _hedge_pool
+
+def _search_hedged(query: str, retailers: list[str], num: int):
+    """Race the passes; the first non-empty filtered result set wins, the loser is ignored."""
+    pool = _get_hedge_pool()
+    f1 = pool.submit(_shopping_pass, query, retailers, num)
+    f2 = None
+    _hedge_budget.deposit()
+    if _pass1_stats.likely_miss(_miss_key(query, retailers)) and _hedge_budget.withdraw():
+        f2 = pool.submit(_web_pass, query, retailers, num)
+
+    pending = {f for f in (f1, f2) if f is not None}
+    hedge_at = time.monotonic() + _pass1_stats.hedge_delay()
+    hedging = f2 is None
+    failed = False
+    while pending:
+        timeout = max(0.0, hedge_at - time.monotonic()) if hedging else None
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        for f in done:
+            try:
+                out, _ = f.result()
+            except Exception:
+                failed = True
+                out = []
+            if out:
+                for other in pending:
+                    other.cancel()
+                return out, ("shopping" if f is f1 else "web")
+        if f2 is None and (f1 in done or _hedge_budget.withdraw()):
+            # plain fallback once Pass 1 came back empty, speculative otherwise
+            f2 = pool.submit(_web_pass, query, retailers, num)
+            pending.add(f2)
+        hedging = False  # either launched, or out of budget: just wait now
+    return [], ("error" if failed else "empty")
+
+async def _asearch_hedged(query: str, retailers: list[str], num: int):
+    """asyncio version of _search_hedged; the losing pass is cancelled."""
+    t1 = asyncio.ensure_future(_ashopping_pass(query, retailers, num))
+    t2 = None
+    _hedge_budget.deposit()
+    if _pass1_stats.likely_miss(_miss_key(query, retailers)) and _hedge_budget.withdraw():
+        t2 = asyncio.ensure_future(_aweb_pass(query, retailers, num))
+
+    pending = {t for t in (t1, t2) if t is not None}
+    hedge_at = time.monotonic() + _pass1_stats.hedge_delay()
+    hedging = t2 is None
+    failed = False
+    try:
+        while pending:
+            timeout = max(0.0, hedge_at - time.monotonic()) if hedging else None
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                try:
+                    out, _ = t.result()
+                except Exception:
+                    failed = True
+                    out = []
+                if out:
+                    return out, ("shopping" if t is t1 else "web")
+            if t2 is None and (t1 in done or _hedge_budget.withdraw()):
+                t2 = asyncio.ensure_future(_aweb_pass(query, retailers, num))
+                pending.add(t2)
+            hedging = False
+        return [], ("error" if failed else "empty")
+    finally:
+        for t in pending:
+            t.cancel()
+
+async def _asearch(query: str, retailers: list[str], num: int):
+    """Async twin of _search (without debug output)."""
+    if SERPAPI_HEDGE:
+        return await _asearch_hedged(query, retailers, num)
+    failed = False
+    try:
+        out, _ = await _ashopping_pass(query, retailers, num)
+    except Exception:
+        failed = True
+        out = []
+    if out:
+        return out, "shopping"
+    try:
+        out, _ = await _aweb_pass(query, retailers, num)
+    except Exception:
+        return [], "error"
+    if out:
+        return out, "web"
+    return [], ("error" if failed else "empty")
+
+def _search(query: str, retailers: list[str], num: int, debug: bool):
+    """
+    Uncached two-pass search. Returns (results, source) where source is
+    "shopping" | "web" | "empty" | "error" and drives the cache TTL.
+    """
+    if SERPAPI_HEDGE and not debug:
+        return _search_hedged(query, retailers, num)
+
+    out = []
+    failed = False
+
+    # --- Pass 1: Google Shopping engine ---
+    try:
+        out, data = _shopping_pass(query, retailers, num)
+    except Exception as e:
+        data = {}
+        failed = True
+        if debug: out.append({"retailer":"serpapi","error":f"shopping engine error: {e}"})
+
+    if out:
+        return out, ("error" if failed else "shopping")
+
+    # --- Pass 2 (fallback): Google Web engine with site: filters ---
+    try:
+        out, web = _web_pass(query, retailers, num)
+    except Exception as e:
+        if debug:
+            return [{"retailer":"serpapi","error":f"web engine error: {e}"}], "error"
+        return [], "error"
 
     if debug and not out:
         # Help you see what we got back
@@ -132,9 +450,80 @@ def google_shopping_search(query: str, retailers: list[str], num: int = 24, debu
                     "product_results": len(data.get("product_results") or []),
                     "organic_results": len(data.get("organic_results") or []),
                 },
-                "web_query": web_q,
+                "web_query": _web_query(query, retailers),
                 "web_count": len(web.get("organic_results", [])) if isinstance(web, dict) else 0,
             }
-        }]
+        }], "empty"
 
-    return out
+    if out:
+        return out, "web"
+    return out, ("error" if failed else "empty")
+
+# --- response cache ----------------------------------------------------------
+# In-process LRU, optionally backed by a shared tier so every worker benefits
+# (SERPAPI_CACHE_* in settings).
+# TTL (seconds) per pass that produced the answer; 0 disables caching for it
+_CACHE_TTL = {
+    "shopping": int(os.getenv("SERPAPI_CACHE_TTL_SHOPPING", "3600")),
+    "web":      int(os.getenv("SERPAPI_CACHE_TTL_WEB", "1800")),
+    "empty":    int(os.getenv("SERPAPI_CACHE_TTL_EMPTY", "300")),  # negative caching
+    "error":    0,
+}
+
+_cache = None
+
+def _get_cache() -> TieredCache:
+    global _cache
+    if _cache is None:
+        from django.conf import settings
+        _cache = TieredCache(
+            maxsize=settings.SERPAPI_CACHE_SIZE,
+            shared=make_shared_backend(settings.SERPAPI_CACHE_BACKEND, "serpapi",
+                                       path=settings.SERPAPI_CACHE_PATH,
+                                       max_entries=settings.SERPAPI_CACHE_MAX_ENTRIES),
+        )
+    return _cache
+
+def _cache_key(query: str, retailers: list[str], num: int) -> str:
+    parts = [normalize_query(query).lower(), sorted({r.strip().lower() for r in retailers}), GL, HL, LOCATION, num]
+    return "serp:" + hashlib.sha1(json.dumps(parts).encode()).hexdigest()
+
+def cache_stats() -> dict:
+    return _get_cache().stats()
+
+def google_shopping_search_meta(query: str, retailers: list[str], num: int = 24, debug: bool = False):
+    """
+    Same as google_shopping_search but returns (results, meta) where
+    meta["cache"] is "hit" | "miss" | "bypass".
+    """
+    if not SERPAPI_KEY:
+        return [{"retailer":"serpapi", "error":"SERPAPI_KEY missing"}], {"cache": "bypass"}
+    if debug:
+        return _search(query, retailers, num, debug=True)[0], {"cache": "bypass"}
+
+    key = _cache_key(query, retailers, num)
+    hit, tier = _get_cache().get(key)
+    if tier is not None:
+        return [dict(it) for it in hit], {"cache": "hit", "tier": tier}
+
+    out, source = _search(query, retailers, num, debug=False)
+    _get_cache().set(key, [dict(it) for it in out], _CACHE_TTL.get(source, 0))
+    return out, {"cache": "miss", "source": source}
+
+def google_shopping_search(query: str, retailers: list[str], num: int = 24, debug: bool = False):
+    return google_shopping_search_meta(query, retailers, num=num, debug=debug)[0]
+
+async def agoogle_shopping_search_meta(query: str, retailers: list[str], num: int = 24):
+    """Async google_shopping_search_meta for the ASGI views; shares the cache and budgets."""
+    if not SERPAPI_KEY:
+        return [{"retailer":"serpapi", "error":"SERPAPI_KEY missing"}], {"cache": "bypass"}
+
+    # the shared tier is SQLite or a network cache: keep those calls off the event loop
+    key = _cache_key(query, retailers, num)
+    hit, tier = await asyncio.to_thread(_get_cache().get, key)
+    if tier is not None:
+        return [dict(it) for it in hit], {"cache": "hit", "tier": tier}
+
+    out, source = await _asearch(query, retailers, num)
+    await asyncio.to_thread(_get_cache().set, key, [dict(it) for it in out], _CACHE_TTL.get(source, 0))
+    return out, {"cache": "miss", "source": source}
@@ -0,0 +1,158 @@
+# api/resilience.py
+"""
+Failure handling for upstream APIs:
+
+- CircuitBreaker: closed / open / half-open, tripped by the error rate
+  (slow calls count as errors) over a sliding window of recent calls.
+- RetryScheduler: runs attempts on a small pool and waits out backoff on a
+  timer thread, so the caller only ever blocks on a Future with its own deadline.
+"""
+from __future__ import annotations
+import heapq, itertools, logging, threading, time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+log = logging.getLogger(__name__)
+
+
+class CircuitOpen(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, window: int = 20, min_calls: int = 5, failure_rate: float = 0.5,
+                 slow_call: float = 8.0, open_seconds: float = 30.0, half_open_probes: int = 2):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call = slow_call
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.state = self.CLOSED
+        self._window: deque = deque(maxlen=window)  # True = failed or slow
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+        self._rejected = 0
+        self._transitions = 0
+        self._lock = threading.Lock()
+        _registry[name] = self
+
+    def _set(self, state: str) -> None:
+        if state == self.state:
+            return
+        log.warning("circuit %s: %s -> %s", self.name, self.state, state)
+        self.state = state
+        self._transitions += 1
+        if state == self.OPEN:
+            self._opened_at = time.monotonic()
+        elif state == self.HALF_OPEN:
+            self._probes = self._probe_successes = 0
+        else:
+            self._window.clear()
+
+    def rejecting(self) -> bool:
+        """True while open and not yet due for a half-open probe (no side effects)."""
+        with self._lock:
+            return self.state == self.OPEN and time.monotonic() - self._opened_at < self.open_seconds
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    self._rejected += 1
+                    return False
+                self._set(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN:
+                if self._probes >= self.half_open_probes:
+                    self._rejected += 1
+                    return False
+                self._probes += 1
+            return True
+
+    def record(self, ok: bool, latency: float = 0.0) -> None:
+        failed = (not ok) or latency > self.slow_call
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                if failed:
+                    self._set(self.OPEN)
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.half_open_probes:
+                        self._set(self.CLOSED)
+                return
+            if self.state == self.OPEN:
+                return  # late result from before the trip
+            self._window.append(failed)
+            if len(self._window) >= self.min_calls and sum(self._window) / len(self._window) >= self.failure_rate:
+                self._set(self.OPEN)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            calls = len(self._window)
+            return {
+                "state": self.state,
+                "failure_rate": round(sum(self._window) / calls, 3) if calls else 0.0,
+                "window_calls": calls,
+                "open_for": round(time.monotonic() - self._opened_at, 1) if self.state != self.CLOSED else 0.0,
+                "rejected": self._rejected,
+                "transitions": self._transitions,
+            }
+
+
+_registry: Dict[str, CircuitBreaker] = {}
+
+def breaker_states() -> Dict[str, Dict]:
+    return {name: b.snapshot() for name, b in _registry.items()}
+
+
+class RetryScheduler:
+    def __init__(self, workers: int = 4, name: str = "retry"):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._name = name
+        self._heap: list = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._timer: Optional[threading.Thread] = None
+
+    def _call_later(self, delay: float, fn: Callable[[], None]) -> None:
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), fn))
+            if self._timer is None:
+                self._timer = threading.Thread(target=self._run_timer, name=f"{self._name}-timer", daemon=True)
+                self._timer.start()
+            self._cond.notify()
+
+    def _run_timer(self) -> None:
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                _, _, fn = heapq.heappop(self._heap)
+            self._pool.submit(fn)
+
+    def run(self, attempt_fn: Callable[[int], object],
+            retry_delay: Callable[[BaseException, int], Optional[float]]) -> Future:
+        """
+        Call attempt_fn(attempt) until it succeeds or retry_delay(exc, attempt)
+        returns None. Returns a Future for the final outcome.
+        """
+        result: Future = Future()
+
+        def go(attempt: int) -> None:
+            try:
+                value = attempt_fn(attempt)
+            except BaseException as e:
+                delay = retry_delay(e, attempt)
+                if delay is None:
+                    result.set_exception(e)
+                else:
+                    self._call_later(delay, lambda: go(attempt + 1))
+            else:
+                result.set_result(value)
+
+        self._pool.submit(go, 0)
+        return result
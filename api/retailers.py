@@ -0,0 +1,105 @@
+# api/retailers.py
+"""
+Retailer domain registry: the one place that decides which retailer a host
+belongs to, for filtering results and for labelling them.
+
+Domains are compiled into a suffix trie over reversed labels
+(com -> walmart), so a host matches a retailer only on a label boundary:
+walmart.com, www.walmart.com and grocery.walmart.com are Walmart;
+notwalmart.com and walmart.com.example.net are not.
+
+Retailers come from a JSON data file (RETAILERS_PATH) plus optional extras
+from the environment, e.g. RETAILERS_EXTRA="heb=heb.com;meijer=meijer.com|meijer.ca".
+"""
+from __future__ import annotations
+import json, os, threading
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+DEFAULT_RETAILERS_PATH = os.path.join(os.path.dirname(__file__), "data", "retailers.json")
+
+_LEAF = None  # key under which a trie node stores its retailer; never collides with a label
+
+
+class DomainRegistry:
+    def __init__(self, retailers: Dict[str, Iterable[str]]):
+        self._domains: Dict[str, List[str]] = {}
+        self._root: dict = {}
+        for name, domains in retailers.items():
+            for d in domains:
+                self.add(name, d)
+        # hosts repeat a lot within and across payloads; the registry is immutable once built
+        self.classify = lru_cache(maxsize=4096)(self._classify)
+
+    def add(self, retailer: str, domain: str) -> None:
+        retailer = retailer.strip().lower()
+        domain = domain.strip().lower().strip(".")
+        if domain.startswith("www."):
+            domain = domain[4:]
+        node = self._root
+        for label in reversed(domain.split(".")):
+            node = node.setdefault(label, {})
+        node[_LEAF] = retailer
+        self._domains.setdefault(retailer, []).append(domain)
+
+    def _classify(self, host: str) -> Optional[str]:
+        """Retailer owning `host` (longest matching domain wins), or None."""
+        node = self._root
+        found = None
+        for label in reversed((host or "").lower().rstrip(".").split(".")):
+            if not label:  # malformed host such as a..walmart.com
+                return None
+            node = node.get(label)
+            if node is None:
+                break
+            found = node.get(_LEAF, found)
+        return found
+
+    def host_ok(self, host: str, retailers: Iterable[str]) -> bool:
+        return self.classify(host) in retailers
+
+    def domains(self, retailer: str) -> List[str]:
+        return self._domains.get(retailer, [])
+
+    def retailers(self) -> List[str]:
+        return list(self._domains)
+
+
+def host_of(url: str) -> str:
+    """Hostname of an absolute URL; a much cheaper urlparse(url).hostname for filtering hot loops."""
+    rest = url.split("//", 1)[1] if "//" in url else url
+    for sep in "/?#":
+        rest = rest.split(sep, 1)[0]
+    host = rest.rpartition("@")[2]
+    if host.startswith("["):
+        return host[1:].split("]", 1)[0].lower()
+    return host.split(":", 1)[0].lower()
+
+
+def _parse_extra(spec: str) -> Dict[str, List[str]]:
+    out: Dict[str, List[str]] = {}
+    for part in (spec or "").split(";"):
+        if "=" in part:
+            name, domains = part.split("=", 1)
+            out.setdefault(name.strip().lower(), []).extend(d for d in domains.split("|") if d.strip())
+    return out
+
+
+def load_registry(path: Optional[str] = None, extra: Optional[str] = None) -> DomainRegistry:
+    with open(path or os.getenv("RETAILERS_PATH") or DEFAULT_RETAILERS_PATH, encoding="utf-8") as fh:
+        retailers = {k: list(v) for k, v in json.load(fh)["retailers"].items()}
+    for name, domains in _parse_extra(os.getenv("RETAILERS_EXTRA", "") if extra is None else extra).items():
+        retailers.setdefault(name, []).extend(domains)
+    return DomainRegistry(retailers)
+
+
+_registry: DomainRegistry | None = None
+_lock = threading.Lock()
+
+def get_registry() -> DomainRegistry:
+    global _registry
+    if _registry is None:
+        with _lock:
+            if _registry is None:
+                _registry = load_registry()
+    return _registry
@@ -1,14 +1,42 @@
 # api/scrapers.py
 from __future__ import annotations
-from typing import List, Dict
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-
-def _make_driver(headless: bool = True):
+import os, time, threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Iterator, Optional, Tuple
+from urllib.parse import urljoin
+
+from .driver_pool import DriverPool, make_pool
+
+# selenium / bs4 are imported inside the functions that need them so that
+# importing this module (every Django start-up) stays cheap
+
+# "lean" pages: eager load (return at DOMContentLoaded; we wait for our own selector anyway),
+# no images, and URL-pattern blocking of fonts, media, ads and trackers via CDP.
+# "full" is Chrome's default behaviour. Retailers can opt out of lean in _SPECS
+# ("lean": False) or via SCRAPE_LEAN_OPTOUT; each profile has its own browser pool
+# and the pools split SCRAPE_POOL_SIZE between them.
+SCRAPE_PROFILE = os.getenv("SCRAPE_PROFILE", "lean").strip().lower()
+if SCRAPE_PROFILE not in ("full", "lean"):
+    raise ValueError(f"unknown SCRAPE_PROFILE {SCRAPE_PROFILE!r} (expected full or lean)")
+SCRAPE_LEAN_OPTOUT = {r.strip().lower() for r in os.getenv("SCRAPE_LEAN_OPTOUT", "").split(",") if r.strip()}
+SCRAPE_BLOCK_EXTRA = [p.strip() for p in os.getenv("SCRAPE_BLOCK_EXTRA", "").split(",") if p.strip()]
+
+_LEAN_BLOCK = [
+    # images (belt and braces with the content-settings pref) and fonts
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.avif", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf",
+    # media
+    "*.mp4", "*.webm", "*.m3u8", "*.mp3",
+    # ads and trackers
+    "*doubleclick.net*", "*googlesyndication.com*", "*googleadservices.com*", "*adservice.google.*",
+    "*google-analytics.com*", "*googletagmanager.com*", "*amazon-adsystem.com*", "*facebook.net*",
+    "*criteo.*", "*scorecardresearch.com*", "*hotjar.com*", "*quantummetric.com*", "*bing.com/bat*",
+    "*pinimg.com*", "*tiktok.com*", "*snapchat.com*",
+]
+
+def _make_driver(headless: bool = True, profile: str = "full", perf_log: bool = False):
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
     opts = Options()
     if headless:
         opts.add_argument("--headless=new")
@@ -17,169 +45,355 @@ def _make_driver(headless: bool = True):
     opts.add_argument("--disable-gpu")
     opts.add_argument("--window-size=1280,1024")
     opts.add_argument("--user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116 Safari/537.36")
+    if profile == "lean":
+        opts.page_load_strategy = "eager"
+        opts.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+    if perf_log:  # Network.* events, used by bench_scrape_profile to count bytes
+        opts.set_capability("goog:loggingPrefs", {"performance": "ALL"})
     return webdriver.Chrome(options=opts)
 
-def _page_soup(driver, css: str, timeout: int = 12):
+# browsers are pooled across requests instead of one Chrome launch per search
+SCRAPE_POOL_SIZE = int(os.getenv("SCRAPE_POOL_SIZE", os.getenv("SCRAPE_MAX_WORKERS", "4")))
+SCRAPE_POOL_MAX_PAGES = int(os.getenv("SCRAPE_POOL_MAX_PAGES", "50"))
+SCRAPE_POOL_CHECKOUT_TIMEOUT = float(os.getenv("SCRAPE_POOL_CHECKOUT_TIMEOUT", "30"))
+
+_driver_pools: Dict[str, DriverPool] = {}
+_driver_pool_lock = threading.Lock()
+
+def _get_driver_pool(profile: str = "full") -> DriverPool:
+    pool = _driver_pools.get(profile)
+    if pool is None:
+        with _driver_pool_lock:
+            pool = _driver_pools.get(profile)
+            if pool is None:
+                pool = _driver_pools[profile] = make_pool(lambda: _make_driver(profile=profile),
+                                                          max_size=_POOL_SIZES[profile], max_pages=SCRAPE_POOL_MAX_PAGES)
+    return pool
+
+def _driver(profile: str = "full"):
+    return _get_driver_pool(profile).borrow(timeout=SCRAPE_POOL_CHECKOUT_TIMEOUT)
+
+def _wait_for(driver, css: str, timeout: int = 12) -> None:
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
     WebDriverWait(driver, timeout).until(EC.presence_of_element_located((By.CSS_SELECTOR, css)))
-    return BeautifulSoup(driver.page_source, "lxml")
 
-# walmart
-def search_walmart(query: str) -> List[Dict]:
-    url = f"https://www.walmart.com/search?q={query}"
-    d = _make_driver()
-    try:
+# --- per-retailer extraction spec -------------------------------------------------
+# card:  CSS for one result; scan: how many cards to look at
+# title / href / price: where each field lives inside a card
+#   sel    selector, or a list tried in order (None = the card element itself)
+#   attr   attribute to read (default: the element's text)
+#   alt    attribute to fall back to when the text is empty
+#   scope  "parent" to search from the card's parent element
+# lean profile (optional): "lean": False to always load the full page;
+#   "block" extra URL patterns to block, "allow" patterns to drop from _LEAN_BLOCK
+_SPECS: Dict[str, Dict] = {
+    "walmart": {
+        "url": "https://www.walmart.com/search?q={q}",
+        "ready": 'div[data-automation-id="products-list"]',
+        "card": 'div[data-automation-id="product"]', "scan": 10,
+        "title": {"sel": "a[aria-label]", "attr": "aria-label"},
+        "href": {"sel": "a[href]", "attr": "href"},
+        "price": {"sel": "[data-automation-id='product-price']"},
+    },
+    "target": {
+        "url": "https://www.target.com/s?searchTerm={q}",
+        "ready": "div[data-test=results-list]",
+        "card": "a[data-test=product-title]", "scan": 10,
+        "title": {"sel": None},
+        "href": {"sel": None, "attr": "href"},
+        "price": {"sel": "[data-test=current-price]", "scope": "parent"},
+        "block": ["*target.scene7.com*"],  # product image CDN (extensionless URLs)
+    },
+    "costco": {
+        "url": "https://www.costco.com/CatalogSearch?dept=All&keyword={q}",
+        "ready": "div.product-list",
+        "card": "div.product-tile-set", "scan": 10,
+        "title": {"sel": "a[href]"},
+        "href": {"sel": "a[href]", "attr": "href"},
+        "price": {"sel": ".price"},
+    },
+    "amazon": {
+        "url": "https://www.amazon.com/s?k={q}",
+        "ready": "div.s-main-slot",
+        "card": "div.s-result-item", "scan": 10,
+        "title": {"sel": "h2 a"},
+        "href": {"sel": "h2 a", "attr": "href"},
+        "price": {"sel": "span.a-price > span.a-offscreen"},
+    },
+    "cvs": {
+        "url": "https://www.cvs.com/search/?filterBy=all&query={q}",
+        "ready": "div[data-testid='product-grid'], main",
+        "card": "a[data-testid='product-card-name'], a[href*='/shop/']", "scan": 12,
+        "title": {"sel": None},
+        "href": {"sel": None, "attr": "href"},
+        "price": {"sel": "[data-testid='product-price'], .css-1i6m1b8, .price__value", "scope": "parent"},
+    },
+    "walgreens": {
+        "url": "https://www.walgreens.com/search/results.jsp?Ntt={q}",
+        "ready": "div#wag-return",
+        "card": "div.product__container", "scan": 12,
+        "title": {"sel": ["a.product__title, a[aria-label][href]", "a[href*='/store/']"], "alt": "aria-label"},
+        "href": {"sel": ["a.product__title, a[aria-label][href]", "a[href*='/store/']"], "attr": "href"},
+        "price": {"sel": ".product__price__final, .product__price, [data-qa='product-price'], .price"},
+    },
+}
+
+# "dom": run the spec inside the page with one execute_script call and get back
+# only the fields; "soup": pull page_source and parse it here (kept for debugging).
+SCRAPE_EXTRACT = os.getenv("SCRAPE_EXTRACT", "dom").strip().lower()
+if SCRAPE_EXTRACT not in ("dom", "soup"):
+    raise ValueError(f"unknown SCRAPE_EXTRACT {SCRAPE_EXTRACT!r} (expected dom or soup)")
+
+_EXTRACT_JS = """
+const spec = arguments[0];
+const pick = (card, f) => {
+  const root = f.scope === "parent" ? (card.parentElement || card) : card;
+  let el = null;
+  if (f.sel == null) el = card;
+  else for (const s of [].concat(f.sel)) { el = root.querySelector(s); if (el) break; }
+  if (!el) return null;
+  let v = f.attr ? el.getAttribute(f.attr) : el.textContent;
+  if (!(v && v.trim()) && f.alt) v = el.getAttribute(f.alt);
+  return v ? v.trim() : null;
+};
+return Array.from(document.querySelectorAll(spec.card)).slice(0, spec.scan).map(card => ({
+  title: pick(card, spec.title), href: pick(card, spec.href), price: pick(card, spec.price)
+}));
+"""
+
+def _extract_dom(driver, spec: Dict) -> List[Dict]:
+    fields = {k: spec[k] for k in ("card", "scan", "title", "href", "price")}
+    return driver.execute_script(_EXTRACT_JS, fields) or []
+
+def _extract_soup(driver, spec: Dict) -> List[Dict]:
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(driver.page_source, "lxml")
+
+    def pick(card, f):
+        root = card.find_parent() if f.get("scope") == "parent" else card
+        el = None
+        if f.get("sel") is None:
+            el = card
+        else:
+            for sel in ([f["sel"]] if isinstance(f["sel"], str) else f["sel"]):
+                el = (root or card).select_one(sel)
+                if el:
+                    break
+        if el is None:
+            return None
+        v = el.get(f["attr"]) if f.get("attr") else el.get_text()  # same as textContent
+        if not (v and v.strip()) and f.get("alt"):
+            v = el.get(f["alt"])
+        return v.strip() if v else None
+
+    return [{"title": pick(c, spec["title"]), "href": pick(c, spec["href"]), "price": pick(c, spec["price"])}
+            for c in soup.select(spec["card"])[:spec["scan"]]]
+
+def _wanted_profile(retailer: str) -> str:
+    if SCRAPE_PROFILE != "lean" or retailer in SCRAPE_LEAN_OPTOUT or not _SPECS[retailer].get("lean", True):
+        return "full"
+    return "lean"
+
+def _pool_sizes(total: int) -> Dict[str, int]:
+    # SCRAPE_POOL_SIZE caps Chrome instances for the whole process, so when both
+    # profiles are in use it is split between them by how many retailers each serves
+    counts: Dict[str, int] = {}
+    for r in _SPECS:
+        p = _wanted_profile(r)
+        counts[p] = counts.get(p, 0) + 1
+    if len(counts) > total:  # too small to split: everything loads full pages
+        return {"full": total}
+    sizes = {p: max(1, total * n // len(_SPECS)) for p, n in counts.items()}
+    sizes[max(counts, key=counts.get)] += total - sum(sizes.values())
+    return sizes
+
+_POOL_SIZES = _pool_sizes(SCRAPE_POOL_SIZE)
+
+def _profile_for(retailer: str) -> str:
+    p = _wanted_profile(retailer)
+    return p if p in _POOL_SIZES else "full"
+
+def _blocked_urls(retailer: str) -> List[str]:
+    spec = _SPECS[retailer]
+    allow = set(spec.get("allow", ()))
+    return [p for p in _LEAN_BLOCK + SCRAPE_BLOCK_EXTRA + spec.get("block", []) if p not in allow]
+
+def _apply_profile(driver, retailer: str, profile: str) -> None:
+    # pooled lean browsers serve every retailer, so the block list is set per search
+    if profile == "lean":
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": _blocked_urls(retailer)})
+
+def _scrape(retailer: str, query: str, limit: int = 10) -> List[Dict]:
+    spec = _SPECS[retailer]
+    url = spec["url"].format(q=query)
+    profile = _profile_for(retailer)
+    with _driver(profile) as d:
+        _apply_profile(d, retailer, profile)
         d.get(url)
-        soup = _page_soup(d, 'div[data-automation-id="products-list"]')
-        items = []
-        for card in soup.select('div[data-automation-id="product"]')[:10]:
-            a = card.select_one("a[aria-label]")
-            link = card.select_one("a[href]")
-            title = a.get("aria-label") if a else None
-            href = f"https://www.walmart.com{link['href']}" if link and link.get("href","").startswith("/") else (link["href"] if link else None)
-            price_el = card.select_one("[data-automation-id='product-price']")
-            price = price_el.get_text(strip=True) if price_el else None
-            if title and href:
-                items.append({"retailer":"walmart","title":title,"price":price,"url":href})
-        return items
-    finally:
-        d.quit()
-
-# target
+        _wait_for(d, spec["ready"])
+        raw = _extract_soup(d, spec) if SCRAPE_EXTRACT == "soup" else _extract_dom(d, spec)
+    items = []
+    for r in raw:
+        title = " ".join((r.get("title") or "").split())
+        href = r.get("href")
+        if title and href:
+            price = " ".join((r.get("price") or "").split()) or None
+            items.append({"retailer": retailer, "title": title, "price": price, "url": urljoin(url, href)})
+    return items[:limit]
+
+def search_walmart(query: str) -> List[Dict]:
+    return _scrape("walmart", query)
+
 def search_target(query: str) -> List[Dict]:
-    url = f"https://www.target.com/s?searchTerm={query}"
-    d = _make_driver()
-    try:
-        d.get(url)
-        soup = _page_soup(d, "div[data-test=results-list]")
-        items = []
-        for a in soup.select("a[data-test=product-title]")[:10]:
-            title = a.get_text(strip=True)
-            href = "https://www.target.com" + a.get("href","")
-            price_node = a.find_parent().select_one("[data-test=current-price]")
-            price = price_node.get_text(strip=True) if price_node else None
-            items.append({"retailer":"target","title":title,"price":price,"url":href})
-        return items
-    finally:
-        d.quit()
-
-# costco
+    return _scrape("target", query)
+
 def search_costco(query: str) -> List[Dict]:
-    url = f"https://www.costco.com/CatalogSearch?dept=All&keyword={query}"
-    d = _make_driver()
-    try:
-        d.get(url)
-        soup = _page_soup(d, "div.product-list")
-        items = []
-        for card in soup.select("div.product-tile-set")[:10]:
-            a = card.select_one("a[href]")
-            title = a.get_text(strip=True) if a else None
-            href = ("https://www.costco.com" + a["href"]) if a and a["href"].startswith("/") else (a["href"] if a else None)
-            price_el = card.select_one(".price")
-            price = price_el.get_text(strip=True) if price_el else None
-            if title and href:
-                items.append({"retailer":"costco","title":title,"price":price,"url":href})
-        return items
-    finally:
-        d.quit()
-
-# amazon
+    return _scrape("costco", query)
+
 def search_amazon(query: str) -> List[Dict]:
-    url = f"https://www.amazon.com/s?k={query}"
-    d = _make_driver()
-    try:
-        d.get(url)
-        soup = _page_soup(d, "div.s-main-slot")
-        items = []
-        for card in soup.select("div.s-result-item")[:10]:
-            t = card.select_one("h2 a")
-            if not t:
-                continue
-            title = t.get_text(strip=True)
-            href = "https://www.amazon.com" + t["href"]
-            price = None
-            money = card.select_one("span.a-price > span.a-offscreen")
-            if money: price = money.get_text(strip=True)
-            items.append({"retailer":"amazon","title":title,"price":price,"url":href})
-        return items
-    finally:
-        d.quit()
-
-# cvs
+    return _scrape("amazon", query)
+
 def search_cvs(query: str) -> List[Dict]:
-    url = f"https://www.cvs.com/search/?filterBy=all&query={query}"
-    d = _make_driver()
-    try:
-        d.get(url)
-        soup = _page_soup(d, "div[data-testid='product-grid'], main")
-        items: List[Dict] = []
-        for card in soup.select("a[data-testid='product-card-name'], a[href*='/shop/']")[:12]:
-            title = card.get_text(strip=True)
-            href = card.get("href", "")
-            if not href:
-                continue
-            if href.startswith("/"):
-                href = "https://www.cvs.com" + href
-            price_el = card.find_parent().select_one("[data-testid='product-price'], .css-1i6m1b8, .price__value")
-            price = price_el.get_text(strip=True) if price_el else None
-            if title and href:
-                items.append({"retailer":"cvs","title":title,"price":price,"url":href})
-        return items[:10]
-    finally:
-        d.quit()
-
-# walgreen
+    return _scrape("cvs", query)
+
 def search_walgreens(query: str) -> List[Dict]:
-    url = f"https://www.walgreens.com/search/results.jsp?Ntt={query}"
-    d = _make_driver()
-    try:
-        d.get(url)
-        soup = _page_soup(d, "div#wag-return")
-        items: List[Dict] = []
-        for card in soup.select("div.product__container")[:12]:
-            a = card.select_one("a.product__title, a[aria-label][href]")
-            if not a:
-                a = card.select_one("a[href*='/store/']")
-            if not a:
-                continue
-            title = a.get_text(strip=True) or a.get("aria-label", "").strip()
-            href = a.get("href", "")
-            if href.startswith("/"):
-                href = "https://www.walgreens.com" + href
-            price_el = card.select_one(".product__price__final, .product__price, [data-qa='product-price'], .price")
-            price = price_el.get_text(strip=True) if price_el else None
-            if title and href:
-                items.append({"retailer":"walgreens","title":title,"price":price,"url":href})
-        return items[:10]
-    finally:
-        d.quit()
+    return _scrape("walgreens", query)
 
 
 PRIORITY = ["cvs", "walmart", "target", "costco", "amazon", "walgreens"]
 
-def multi_search(query: str, retailers: List[str]) -> List[Dict]:
+_SCRAPERS = {
+    "cvs":       search_cvs,
+    "walmart":   search_walmart,
+    "target":    search_target,
+    "costco":    search_costco,
+    "amazon":    search_amazon,
+    "walgreens": search_walgreens,
+}
+
+# fan-out knobs: pool size bounds how many Chrome instances run at once
+SCRAPE_PARALLEL = os.getenv("SCRAPE_PARALLEL", "1") not in ("0", "false", "no")
+SCRAPE_MAX_WORKERS = int(os.getenv("SCRAPE_MAX_WORKERS", "4"))
+SCRAPE_RETAILER_TIMEOUT = float(os.getenv("SCRAPE_RETAILER_TIMEOUT", "20"))  # seconds, per retailer once started
+SCRAPE_DEADLINE = float(os.getenv("SCRAPE_DEADLINE", "30"))                  # seconds, whole fan-out
+# timed-out scrapers still hold a thread (and a browser) until they return; past this
+# many, new retailers get an error entry instead of queueing behind them
+SCRAPE_MAX_ABANDONED = int(os.getenv("SCRAPE_MAX_ABANDONED", str(SCRAPE_MAX_WORKERS)))
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+_abandoned = 0
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # sized so live scrapes always find a thread while abandoned ones are within the cap
+                _pool = ThreadPoolExecutor(max_workers=SCRAPE_MAX_WORKERS + SCRAPE_MAX_ABANDONED,
+                                           thread_name_prefix="scrape")
+    return _pool
+
+def _abandon(fut) -> None:
+    global _abandoned
+    if fut.cancel():  # never started: nothing to wait for
+        return
+    with _pool_lock:
+        _abandoned += 1
+    fut.add_done_callback(_released)
+
+def _released(_fut) -> None:
+    global _abandoned
+    with _pool_lock:
+        _abandoned -= 1
+
+def _wanted(retailers: List[str]) -> List[str]:
+    wanted = [r.strip().lower() for r in retailers if r.strip()]
+    return sorted(set(wanted), key=lambda r: (PRIORITY.index(r) if r in PRIORITY else 999, r))
+
+def iter_multi_search(query: str, retailers: List[str],
+                      timeout: Optional[float] = None,
+                      deadline: Optional[float] = None) -> Iterator[Tuple[str, List[Dict]]]:
+    """
+    Run scrapers concurrently and yield (retailer, items) in completion order.
+    A retailer that runs past `timeout` or the overall `deadline` yields a
+    single error entry instead; its worker is abandoned, not killed. While
+    SCRAPE_MAX_ABANDONED workers are still stuck, retailers are not started.
+    """
+    timeout = SCRAPE_RETAILER_TIMEOUT if timeout is None else timeout
+    deadline = SCRAPE_DEADLINE if deadline is None else deadline
+    stop_at = time.monotonic() + deadline
+    started: Dict[str, float] = {}
+
+    def run(r: str) -> List[Dict]:
+        started[r] = time.monotonic()
+        return _SCRAPERS[r](query)
+
+    futs = {}
+    for r in _wanted(retailers):
+        if r not in _SCRAPERS:
+            yield r, [{"retailer": r, "error": "unsupported retailer"}]
+            continue
+        if _abandoned >= SCRAPE_MAX_ABANDONED:
+            yield r, [{"retailer": r, "error": "scrapers busy: too many timed-out searches still running"}]
+            continue
+        futs[_get_pool().submit(run, r)] = r
+
+    pending = set(futs)
+    while pending:
+        now = time.monotonic()
+        expiries = [stop_at] + [started[futs[f]] + timeout for f in pending if futs[f] in started]
+        # poll at least twice a second: workers record their start time asynchronously
+        done, pending = wait(pending, timeout=max(0.0, min(min(expiries) - now, 0.5)),
+                             return_when=FIRST_COMPLETED)
+        for f in done:
+            r = futs[f]
+            try:
+                yield r, f.result()
+            except Exception as e:
+                yield r, [{"retailer": r, "error": str(e)}]
+
+        now = time.monotonic()
+        for f in list(pending):
+            r = futs[f]
+            if now >= stop_at:
+                reason = f"deadline exceeded after {deadline:g}s"
+            elif r in started and now - started[r] >= timeout:
+                reason = f"timed out after {timeout:g}s"
+            else:
+                continue
+            _abandon(f)
+            pending.discard(f)
+            yield r, [{"retailer": r, "error": reason}]
+
+def multi_search(query: str, retailers: List[str], parallel: Optional[bool] = None,
+                 timeout: Optional[float] = None, deadline: Optional[float] = None) -> List[Dict]:
     """
     Run scrapers for requested retailers, honoring PRIORITY order.
+    In parallel mode (default, see SCRAPE_PARALLEL) retailers are scraped
+    concurrently; whatever finished before the deadline is returned and
+    late retailers get an error entry.
     """
-    wanted = [r.strip().lower() for r in retailers if r.strip()]
-    wanted = sorted(set(wanted), key=lambda r: (PRIORITY.index(r) if r in PRIORITY else 999, r))
+    wanted = _wanted(retailers)
+    parallel = SCRAPE_PARALLEL if parallel is None else parallel
+
+    if parallel:
+        by_retailer = dict(iter_multi_search(query, wanted, timeout=timeout, deadline=deadline))
+    else:
+        by_retailer = {}
+        for r in wanted:
+            try:
+                if r in _SCRAPERS:
+                    by_retailer[r] = _SCRAPERS[r](query)
+                else:
+                    by_retailer[r] = [{"retailer": r, "error": "unsupported retailer"}]
+            except Exception as e:
+                by_retailer[r] = [{"retailer": r, "error": str(e)}]
 
     out: List[Dict] = []
     for r in wanted:
-        try:
-            if r == "cvs":
-                out += search_cvs(query)
-            elif r == "walmart":
-                out += search_walmart(query)
-            elif r == "target":
-                out += search_target(query)
-            elif r == "costco":
-                out += search_costco(query)
-            elif r == "amazon":
-                out += search_amazon(query)
-            elif r == "walgreens":
-                out += search_walgreens(query)
-            else:
-                out.append({"retailer": r, "error": "unsupported retailer"})
-        except Exception as e:
-            out.append({"retailer": r, "error": str(e)})
+        out += by_retailer.get(r, [])
     return out[:40]
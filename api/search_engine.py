@@ -0,0 +1,250 @@
+# api/search_engine.py
+"""
+Product search front door. Dispatches to SerpAPI, the Selenium scrapers, or
+races both (SEARCH_BACKEND = serpapi | scrape | both).
+"""
+from __future__ import annotations
+import os, queue, threading, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from .providers_serpapi import google_shopping_search_meta, agoogle_shopping_search_meta
+from .scrapers import iter_multi_search, multi_search
+from .utils import normalize_query
+
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "serpapi").strip().lower()  # serpapi | scrape | both
+SEARCH_NUM = int(os.getenv("SEARCH_NUM", "24"))
+# in "both" mode: answer once SEARCH_NUM results are in or this many seconds passed
+SEARCH_RACE_DEADLINE = float(os.getenv("SEARCH_RACE_DEADLINE", "8"))
+# batch endpoint: unique queries in flight at once, and max items per request
+SEARCH_BATCH_CONCURRENCY = int(os.getenv("SEARCH_BATCH_CONCURRENCY", "8"))
+SEARCH_BATCH_MAX_ITEMS = int(os.getenv("SEARCH_BATCH_MAX_ITEMS", "1000"))
+
+BACKENDS = ("serpapi", "scrape", "both")
+
+def _backend(name: Optional[str]) -> str:
+    backend = (name or SEARCH_BACKEND).strip().lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown search backend: {backend!r} (expected one of {', '.join(BACKENDS)})")
+    return backend
+
+_backend(SEARCH_BACKEND)  # fail at start-up on a typo rather than quietly using serpapi
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="search")
+    return _pool
+
+def _url_key(url: str) -> str:
+    p = urlparse(url or "")
+    host = (p.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    return host + p.path.rstrip("/").lower()
+
+def merge_results(batches: List[List[Dict]], retailers: List[str], num: int) -> List[Dict]:
+    """
+    Merge result lists per retailer (requested order first), dropping
+    duplicate URLs and error entries for retailers that did return items.
+    """
+    by_retailer: Dict[str, List[Dict]] = {}
+    errors: Dict[str, Dict] = {}
+    seen = set()
+    for batch in batches:
+        for it in batch:
+            r = it.get("retailer") or ""
+            if "error" in it or "debug" in it:
+                errors.setdefault(r, it)
+                continue
+            key = _url_key(it.get("url") or "")
+            if key in seen:
+                continue
+            seen.add(key)
+            by_retailer.setdefault(r, []).append(it)
+
+    order = [r for r in retailers if r in by_retailer]
+    order += [r for r in by_retailer if r not in order]
+    out: List[Dict] = []
+    for r in order:
+        out += by_retailer[r]
+    out = out[:num]
+    out += [e for r, e in errors.items() if r not in by_retailer]
+    return out
+
+def _stream(query: str, retailers: List[str], num: int, deadline: float, meta: dict) -> Iterator[Tuple[str, List[Dict]]]:
+    """
+    Start both backends concurrently and yield (source, items) as batches
+    arrive, until both finish or the deadline passes. Closing the generator
+    early leaves the backends running in the background; their output is dropped.
+    Backends never touch `meta`: their own meta travels with each batch and is
+    copied in here, so a backend that loses the race cannot change it later.
+    Each event is (source, items or None, source meta, last batch from source).
+    """
+    events: "queue.Queue[tuple]" = queue.Queue()
+    meta.update({"backend": "both", "cache": "miss", "sources": {}})
+
+    def run_serpapi():
+        try:
+            results, m = google_shopping_search_meta(query, retailers, num=num)
+            events.put(("serpapi", results, {"cache": m["cache"]}, True))
+        except Exception as e:
+            events.put(("serpapi", [{"retailer": "serpapi", "error": str(e)}], {}, True))
+
+    def run_scrape():
+        try:
+            for _, items in iter_multi_search(query, retailers, deadline=deadline):
+                events.put(("scrape", items, {}, False))
+        except Exception as e:
+            events.put(("scrape", [{"retailer": "scrape", "error": str(e)}], {}, False))
+        events.put(("scrape", None, {}, True))
+
+    pool = _get_pool()
+    pool.submit(run_serpapi)
+    pool.submit(run_scrape)
+
+    stop_at = time.monotonic() + deadline
+    running = {"serpapi", "scrape"}
+    try:
+        while running:
+            remaining = stop_at - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                source, items, source_meta, last = events.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if last:  # before the yield: the caller may stop on this batch
+                running.discard(source)
+            if items is None:
+                continue
+            meta.update(source_meta)
+            meta["sources"][source] = meta["sources"].get(source, 0) + len(items)
+            yield source, items
+    finally:
+        meta["pending"] = sorted(running)  # backends cut off by the count or deadline
+
+def _race(query: str, retailers: List[str], num: int, deadline: float) -> Tuple[List[Dict], dict]:
+    meta: dict = {}
+    batches: List[List[Dict]] = []
+    events = _stream(query, retailers, num, deadline, meta)
+    for _, items in events:
+        batches.append(items)
+        if len(merge_results(batches, retailers, num)) >= num:
+            break
+    events.close()
+    return merge_results(batches, retailers, num), meta
+
+def search(query: str, retailers: List[str], num: Optional[int] = None,
+           backend: Optional[str] = None, deadline: Optional[float] = None) -> Tuple[List[Dict], dict]:
+    """
+    Returns (results, meta). meta["cache"] reports the SerpAPI cache outcome
+    ("bypass" when SerpAPI was not consulted).
+    """
+    num = num or SEARCH_NUM
+    backend = _backend(backend)
+    if backend == "scrape":
+        return multi_search(query, retailers)[:num], {"backend": "scrape", "cache": "bypass"}
+    if backend == "both":
+        return _race(query, retailers, num, SEARCH_RACE_DEADLINE if deadline is None else deadline)
+    results, meta = google_shopping_search_meta(query, retailers, num=num)
+    return results, {"backend": "serpapi", **meta}
+
+async def asearch(query: str, retailers: List[str], num: Optional[int] = None,
+                  backend: Optional[str] = None) -> Tuple[List[Dict], dict]:
+    """
+    Async search() for the ASGI views. SerpAPI is awaited natively; the
+    Selenium paths are thread-bound anyway and run off the event loop.
+    """
+    from asgiref.sync import sync_to_async
+    num = num or SEARCH_NUM
+    backend = _backend(backend)
+    if backend in ("scrape", "both"):
+        return await sync_to_async(search, thread_sensitive=False)(query, retailers, num=num, backend=backend)
+    results, meta = await agoogle_shopping_search_meta(query, retailers, num=num)
+    return results, {"backend": "serpapi", **meta}
+
+def iter_search(query: str, retailers: List[str], meta: dict, num: Optional[int] = None,
+                backend: Optional[str] = None, deadline: Optional[float] = None) -> Iterator[Tuple[str, List[Dict]]]:
+    """
+    Streaming variant of search(): yields (retailer, new items) as each
+    retailer's results arrive, deduplicated by URL. Errors come through as
+    single-item lists. `meta` is filled in as the search runs.
+    """
+    num = num or SEARCH_NUM
+    backend = _backend(backend)
+    if backend == "scrape":
+        meta.update({"backend": "scrape", "cache": "bypass"})
+        batches = (items for _, items in iter_multi_search(query, retailers, deadline=deadline))
+    elif backend == "both":
+        batches = _stream(query, retailers, num, SEARCH_RACE_DEADLINE if deadline is None else deadline, meta)
+    else:
+        results, m = google_shopping_search_meta(query, retailers, num=num)
+        meta.update({"backend": "serpapi", **m})
+        batches = iter([results])
+
+    seen = set()
+    sent = 0
+    try:
+        for batch in batches:
+            by_retailer: Dict[str, List[Dict]] = {}
+            for it in batch:
+                r = it.get("retailer") or ""
+                if "error" in it or "debug" in it:
+                    yield r, [it]
+                    continue
+                key = _url_key(it.get("url") or "")
+                if key in seen or sent >= num:
+                    continue
+                seen.add(key)
+                sent += 1
+                by_retailer.setdefault(r, []).append(it)
+            for r, items in by_retailer.items():
+                yield r, items
+            if sent >= num:
+                break
+    finally:
+        close = getattr(batches, "close", None)
+        if close:
+            close()
+
+def iter_batch(items: List[Tuple[str, List[str]]],
+               concurrency: Optional[int] = None) -> Iterator[Tuple[List[int], str, List[Dict], dict]]:
+    """
+    Run many (query, retailers) searches. Items that normalize to the same
+    query and retailer set share one upstream search. Yields
+    (input indices, normalized query, results, meta) in completion order.
+    """
+    groups: Dict[tuple, List[int]] = {}
+    queries: Dict[tuple, str] = {}
+    for i, (q, rs) in enumerate(items):
+        clean = normalize_query(q or "")
+        key = (clean.lower(), tuple(sorted(set(rs))))
+        groups.setdefault(key, []).append(i)
+        queries.setdefault(key, clean)
+
+    for key in [k for k in groups if not k[0]]:
+        yield groups.pop(key), "", [{"retailer": "search", "error": "empty query"}], {"cache": "bypass"}
+    if not groups:
+        return
+
+    workers = max(1, min(concurrency or SEARCH_BATCH_CONCURRENCY, SEARCH_BATCH_CONCURRENCY, len(groups)))
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="search-batch")
+    try:
+        futs = {pool.submit(search, queries[key], list(key[1])): key for key in groups}
+        for f in as_completed(futs):
+            key = futs[f]
+            try:
+                results, meta = f.result()
+            except Exception as e:
+                results, meta = [{"retailer": "search", "error": str(e)}], {"cache": "bypass"}
+            yield groups[key], queries[key], results, meta
+    finally:
+        # client went away mid-stream: drop the queued searches
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -15,3 +15,25 @@ class SymptomAIResultSerializer(serializers.Serializer):
     categories = serializers.ListField(child=serializers.CharField(), required=False)
     safety_flags = serializers.ListField(child=serializers.CharField(), required=False)
 
+
+class SearchBatchItemSerializer(serializers.Serializer):
+    query = serializers.CharField(max_length=500, allow_blank=True)
+    retailers = serializers.ListField(child=serializers.CharField(max_length=50), required=False)
+
+class SearchBatchSerializer(serializers.Serializer):
+    items = SearchBatchItemSerializer(many=True, allow_empty=False)
+    concurrency = serializers.IntegerField(min_value=1, required=False)
+
+    def validate_items(self, value):
+        from .search_engine import SEARCH_BATCH_MAX_ITEMS
+        if len(value) > SEARCH_BATCH_MAX_ITEMS:
+            raise serializers.ValidationError(f"at most {SEARCH_BATCH_MAX_ITEMS} items per batch")
+        return value
+
+
+class ResultOptionsSerializer(serializers.Serializer):
+    """Query params for post-processing search results (?sort=price&max_price=10)."""
+    sort = serializers.ChoiceField(choices=["relevance", "price", "-price", "unit_price"], default="relevance")
+    min_price = serializers.FloatField(min_value=0, required=False)
+    max_price = serializers.FloatField(min_value=0, required=False)
+    dedupe = serializers.BooleanField(default=True)
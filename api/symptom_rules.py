@@ -0,0 +1,161 @@
+# api/symptom_rules.py
+"""
+Symptom -> product keyword rules, shared by the OpenAI fallback and the
+local HF helper. All trigger phrases are compiled once into an Aho-Corasick
+automaton, so matching is a single pass over the text however many rules exist.
+
+Triggers match whole words ("fall" does not fire inside "rainfall"); a
+trailing "*" allows any word ending ("headache*" also matches "headaches").
+Rules live in a JSON data file (SYMPTOM_RULES_PATH) and can be reloaded
+without a restart.
+"""
+from __future__ import annotations
+import json, os, threading, time
+from collections import deque
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(__file__), "data", "symptom_rules.json")
+_RELOAD_CHECK_SECONDS = 5.0
+
+
+class Rule:
+    __slots__ = ("category", "triggers", "keywords")
+
+    def __init__(self, category: str, triggers: Sequence[str], keywords: Sequence[str]):
+        self.category = category
+        self.triggers = list(triggers)
+        self.keywords = list(keywords)
+
+
+class RuleMatcher:
+    def __init__(self, rules: Iterable[Rule]):
+        self.rules: List[Rule] = list(rules)
+        # automaton: per-state transition dict, failure link, and the patterns ending here
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+        self._dict_link: List[int] = [0]   # nearest state on the fail chain with output
+        # per pattern: (length, prefix-only, rule index)
+        self._patterns: List[Tuple[int, bool, int]] = []
+
+        for ri, rule in enumerate(self.rules):
+            for trig in rule.triggers:
+                trig = trig.strip().lower()
+                prefix = trig.endswith("*")
+                trig = trig.rstrip("*").strip()
+                if trig:
+                    self._add(trig, (len(trig), prefix, ri))
+        self._build()
+
+    def _add(self, word: str, pattern: Tuple[int, bool, int]) -> None:
+        state = 0
+        for ch in word:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._dict_link.append(0)
+            state = nxt
+        self._out[state].append(len(self._patterns))
+        self._patterns.append(pattern)
+
+    def _build(self) -> None:
+        q = deque(self._goto[0].values())
+        while q:
+            state = q.popleft()
+            for ch, nxt in self._goto[state].items():
+                q.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._dict_link[nxt] = target if self._out[target] else self._dict_link[target]
+
+    def match(self, text: str) -> List[int]:
+        """Indices of rules with at least one trigger in `text`, in rule order."""
+        text = (text or "").lower()
+        n = len(text)
+        goto, fail, out, link, patterns = self._goto, self._fail, self._out, self._dict_link, self._patterns
+        hit = set()
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            s = state if out[state] else link[state]
+            while s:
+                for pid in out[s]:
+                    length, prefix, ri = patterns[pid]
+                    if ri in hit:
+                        continue
+                    start = i - length + 1
+                    if start > 0 and text[start - 1].isalnum():
+                        continue
+                    if not prefix and i + 1 < n and text[i + 1].isalnum():
+                        continue
+                    hit.add(ri)
+                s = link[s]
+        return sorted(hit)
+
+    def keywords(self, text: str) -> Tuple[List[str], List[str]]:
+        """(categories, keywords) for the matched rules, de-duplicated, in rule order."""
+        cats: List[str] = []
+        kws: List[str] = []
+        for ri in self.match(text):
+            rule = self.rules[ri]
+            cats.append(rule.category)
+            kws += rule.keywords
+        return list(dict.fromkeys(cats)), list(dict.fromkeys(kws))
+
+
+def load_rules(path: str) -> List[Rule]:
+    with open(path, encoding="utf-8") as fh:
+        data = json.load(fh)
+    return [Rule(r["category"], r.get("triggers", []), r.get("keywords", [])) for r in data["rules"]]
+
+
+def _rules_path() -> str:
+    try:
+        from django.conf import settings
+        return getattr(settings, "SYMPTOM_RULES_PATH", "") or DEFAULT_RULES_PATH
+    except Exception:
+        return DEFAULT_RULES_PATH
+
+
+_lock = threading.Lock()
+_matcher: RuleMatcher | None = None
+_loaded_mtime = 0.0
+_checked_at = 0.0
+
+def reload_rules(path: str | None = None) -> RuleMatcher:
+    """Recompile from the data file (or `path`) and swap the shared matcher in."""
+    global _matcher, _loaded_mtime, _checked_at
+    path = path or _rules_path()
+    matcher = RuleMatcher(load_rules(path))
+    with _lock:
+        _matcher = matcher
+        _loaded_mtime = os.path.getmtime(path)
+        _checked_at = time.monotonic()
+    return matcher
+
+def get_matcher() -> RuleMatcher:
+    """Shared matcher; picks up edits to the data file within a few seconds."""
+    global _checked_at
+    if _matcher is None:
+        return reload_rules()
+    now = time.monotonic()
+    if now - _checked_at > _RELOAD_CHECK_SECONDS:
+        _checked_at = now
+        try:
+            if os.path.getmtime(_rules_path()) != _loaded_mtime:
+                return reload_rules()
+        except OSError:
+            pass  # keep serving the rules we have
+    return _matcher
+
+def match_symptoms(text: str) -> Tuple[List[str], List[str]]:
+    return get_matcher().keywords(text)
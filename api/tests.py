@@ -1,3 +1,1584 @@
-from django.test import TestCase
+import importlib.util
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
 
-# Create your tests here.
+from django.conf import settings
+from django.test import SimpleTestCase
+
+HEAVY_MODULES = ("transformers", "torch", "openai", "google.cloud.vision", "selenium")
+
+_IMPORT_PROBE = """
+import json, os, sys, time
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+t0 = time.perf_counter()
+import django
+django.setup()
+import api.urls
+print(json.dumps({"seconds": time.perf_counter() - t0,
+                  "loaded": [m for m in %r if m in sys.modules]}))
+"""
+
+
+class ImportBudgetTests(SimpleTestCase):
+    """Start-up must not pay for models or SDK clients; they load on first use."""
+
+    def _probe(self):
+        import json
+        out = subprocess.run([sys.executable, "-c", _IMPORT_PROBE % (HEAVY_MODULES,)],
+                             cwd=str(settings.BASE_DIR), capture_output=True, text=True, check=True)
+        return json.loads(out.stdout.strip().splitlines()[-1])
+
+    def test_no_heavy_imports_at_startup(self):
+        self.assertEqual(self._probe()["loaded"], [])
+
+    def test_import_time_within_budget(self):
+        self.assertLess(self._probe()["seconds"], settings.IMPORT_BUDGET_SECONDS)
+
+
+PARITY_CORPUS = [
+    "Advil Ibuprofen Tablets 200 mg pain reliever / fever reducer",
+    "Tylenol Extra Strength caplets made by Johnson & Johnson in New Jersey",
+    "CeraVe Acne Foaming Cream Cleanser with benzoyl peroxide",
+    "Natrol Melatonin 5mg fast dissolve sleep aid, strawberry",
+    "Claritin 24 hour non-drowsy allergy relief, Bayer HealthCare",
+    "Pepto-Bismol for upset stomach, heartburn and diarrhea",
+    "Nizoral anti-dandruff shampoo with ketoconazole 1%",
+    "I have had a headache since Monday and ibuprofen is not helping",
+    "Walgreens brand aspirin 81 mg low dose, 120 count",
+    "Neutrogena Oil-Free Acne Wash, salicylic acid 2% from Target",
+]
+
+
+@unittest.skipUnless(importlib.util.find_spec("optimum") and importlib.util.find_spec("transformers"),
+                     "optimum[onnxruntime] not installed")
+class OnnxParityTests(SimpleTestCase):
+    """The int8 ONNX pipelines must give the same answers as torch on PARITY_CORPUS."""
+
+    MIN_AGREEMENT = 0.9
+
+    def _both(self, task, model, **kwargs):
+        from api.hf_backend import build_pipeline
+        return (build_pipeline(task, model, backend="torch", **kwargs),
+                build_pipeline(task, model, backend="onnx", **kwargs))
+
+    def test_ner_entities_agree(self):
+        from api.hf_nlp import NER_MODEL
+        torch_ner, onnx_ner = self._both("token-classification", NER_MODEL, aggregation_strategy="simple")
+        same = 0
+        for text in PARITY_CORPUS:
+            ents = lambda pipe: {(e["entity_group"], e["word"]) for e in pipe(text)}
+            same += ents(torch_ner) == ents(onnx_ner)
+        self.assertGreaterEqual(same / len(PARITY_CORPUS), self.MIN_AGREEMENT)
+
+    def test_classification_labels_agree(self):
+        torch_cls, onnx_cls = self._both("text-classification", settings.HF_MODEL)
+        same = sum(torch_cls(t)[0]["label"] == onnx_cls(t)[0]["label"] for t in PARITY_CORPUS)
+        self.assertGreaterEqual(same / len(PARITY_CORPUS), self.MIN_AGREEMENT)
+
+
+class TieredCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def _sqlite(self, **kwargs):
+        from api.cache import SQLiteCache
+        return SQLiteCache(os.path.join(self.tmp.name, "c.sqlite3"), table="t", **kwargs)
+
+    def test_lru_evicts_least_recently_used(self):
+        from api.cache import MISSING, LRUCache
+        lru = LRUCache(maxsize=2)
+        far = time.time() + 60
+        lru.set("a", 1, far)
+        lru.set("b", 2, far)
+        lru.get("a")            # b is now the oldest
+        lru.set("c", 3, far)
+        self.assertIs(lru.get("b")[0], MISSING)
+        self.assertEqual([lru.get(k)[0] for k in "ac"], [1, 3])
+
+    def test_entries_expire(self):
+        from api.cache import MISSING, LRUCache
+        lru, db = LRUCache(), self._sqlite()
+        for backend in (lru, db):
+            backend.set("k", "v", time.time() - 1)
+            self.assertIs(backend.get("k")[0], MISSING)
+        from api.cache import TieredCache
+        cache = TieredCache(shared=db)
+        cache.set("k", "v", ttl=0)  # nothing cached without a ttl
+        self.assertEqual(cache.get("k"), (None, None))
+
+    def test_sqlite_round_trip(self):
+        db = self._sqlite()
+        value = {"results": [{"title": "Advil", "price": "$9.99"}], "n": 2}
+        db.set("k", value, time.time() + 60)
+        # a second handle stands in for another worker process
+        self.assertEqual(self._sqlite().get("k")[0], value)
+        db.delete("k")
+        from api.cache import MISSING
+        self.assertIs(db.get("k")[0], MISSING)
+
+    def test_sqlite_prune_keeps_most_recently_touched(self):
+        from api.cache import MISSING
+        db = self._sqlite(max_entries=2)
+        far = time.time() + 60
+        for k in "abc":
+            db.set(k, k, far)
+            time.sleep(0.01)
+        db.prune()
+        self.assertIs(db.get("a")[0], MISSING)
+        self.assertEqual(db.get("c")[0], "c")
+
+    def test_shared_hit_is_promoted_to_memory(self):
+        from api.cache import TieredCache
+        db = self._sqlite()
+        TieredCache(shared=db).set("k", [1, 2], ttl=60)
+        cache = TieredCache(shared=db)  # cold process
+        self.assertEqual(cache.get("k"), ([1, 2], "shared"))
+        self.assertEqual(cache.get("k"), ([1, 2], "memory"))
+        stats = cache.stats()
+        self.assertEqual((stats["hits_shared"], stats["hits_memory"], stats["memory_size"]), (1, 1, 1))
+
+    def test_broken_shared_tier_is_a_miss(self):
+        from api.cache import TieredCache
+
+        class Broken:
+            def get(self, key):
+                raise OSError("disk gone")
+
+            def set(self, key, value, expires):
+                raise OSError("disk gone")
+
+        cache = TieredCache(shared=Broken())
+        cache.set("k", 1, ttl=60)
+        self.assertEqual(cache.get("k"), (1, "memory"))
+        self.assertEqual(cache.get("other"), (None, None))
+
+    def test_broken_shared_tier_does_not_fail_delete(self):
+        from api.cache import TieredCache
+
+        class Broken:
+            def delete(self, key):
+                raise OSError("disk gone")
+
+        cache = TieredCache(shared=Broken())
+        cache.memory.set("k", 1, time.time() + 60)
+        cache.delete("k")
+        self.assertEqual(cache.get("k"), (None, None))
+
+    def test_django_backend_clears_only_its_prefix(self):
+        from django.core.cache import caches
+        from api.cache import MISSING, DjangoCache
+        caches["default"].clear()
+        self.addCleanup(caches["default"].clear)
+        search, ocr = DjangoCache(prefix="search:"), DjangoCache(prefix="ocr:")
+        far = time.time() + 60
+        search.set("k", "s", far)
+        ocr.set("k", "o", far)
+        caches["default"].set("session:x", 1)
+        search.clear()
+        self.assertIs(search.get("k")[0], MISSING)
+        self.assertEqual(ocr.get("k")[0], "o")
+        self.assertEqual(caches["default"].get("session:x"), 1)
+        search.set("k", "s2", far)  # written under the new generation
+        self.assertEqual(search.get("k")[0], "s2")
+        search.clear()
+        self.assertIs(search.get("k")[0], MISSING)
+
+
+class AsyncSingleFlightTests(SimpleTestCase):
+    def test_followers_share_the_leaders_result(self):
+        import asyncio
+        from api.coalesce import AsyncSingleFlight
+        flight, calls = AsyncSingleFlight(), []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        async def main():
+            return await asyncio.gather(*(flight.do("k", fetch) for _ in range(3)))
+
+        self.assertEqual(asyncio.run(main()), [("answer", False), ("answer", True), ("answer", True)])
+        self.assertEqual(len(calls), 1)
+
+    def test_cancelled_leader_hands_the_call_to_a_follower(self):
+        import asyncio
+        from api.coalesce import AsyncSingleFlight
+        flight, calls = AsyncSingleFlight(), []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "answer"
+
+        async def main():
+            leader = asyncio.ensure_future(flight.do("k", fetch))
+            await asyncio.sleep(0)
+            followers = [asyncio.ensure_future(flight.do("k", fetch)) for _ in range(2)]
+            await asyncio.sleep(0.01)
+            leader.cancel()  # client disconnect
+            with self.assertRaises(asyncio.CancelledError):
+                await leader
+            return await asyncio.gather(*followers)
+
+        results = asyncio.run(main())
+        self.assertEqual(sorted(shared for _, shared in results), [False, True])
+        self.assertEqual({value for value, _ in results}, {"answer"})
+        self.assertEqual(len(calls), 2)
+
+    def test_cancelled_follower_does_not_disturb_the_leader(self):
+        import asyncio
+        from api.coalesce import AsyncSingleFlight
+        flight = AsyncSingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.03)
+            return "answer"
+
+        async def main():
+            leader = asyncio.ensure_future(flight.do("k", fetch))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(flight.do("k", fetch))
+            await asyncio.sleep(0.01)
+            follower.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await follower
+            return await leader
+
+        self.assertEqual(asyncio.run(main()), ("answer", False))
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def _breaker(self, **kwargs):
+        from api.resilience import CircuitBreaker
+        opts = dict(window=4, min_calls=4, failure_rate=0.5, slow_call=1.0, open_seconds=0.05, half_open_probes=2)
+        opts.update(kwargs)
+        return CircuitBreaker("test", **opts)
+
+    def test_trips_on_failure_rate_once_min_calls_seen(self):
+        b = self._breaker()
+        for ok in (False, True, False):
+            b.record(ok)
+        self.assertEqual(b.state, b.CLOSED)  # only 3 of min_calls=4
+        b.record(True)
+        self.assertEqual(b.state, b.OPEN)    # 2/4 failed
+        self.assertTrue(b.rejecting())
+        self.assertFalse(b.allow())
+        self.assertEqual(b.snapshot()["rejected"], 1)
+
+    def test_slow_calls_count_as_failures(self):
+        b = self._breaker()
+        for _ in range(4):
+            b.record(True, latency=2.0)
+        self.assertEqual(b.state, b.OPEN)
+
+    def test_half_open_probes_close_the_circuit(self):
+        b = self._breaker()
+        for _ in range(4):
+            b.record(False)
+        time.sleep(0.06)
+        self.assertFalse(b.rejecting())
+        self.assertTrue(b.allow())
+        self.assertEqual(b.state, b.HALF_OPEN)
+        self.assertTrue(b.allow())
+        self.assertFalse(b.allow())          # only half_open_probes calls get through
+        b.record(True)
+        b.record(True)
+        self.assertEqual(b.state, b.CLOSED)
+        self.assertEqual(b.snapshot()["window_calls"], 0)
+
+    def test_failed_probe_reopens(self):
+        b = self._breaker()
+        for _ in range(4):
+            b.record(False)
+        time.sleep(0.06)
+        self.assertTrue(b.allow())
+        b.record(False)
+        self.assertEqual(b.state, b.OPEN)
+        self.assertTrue(b.rejecting())
+
+
+class RetrySchedulerTests(SimpleTestCase):
+    def test_retries_until_success(self):
+        from api.resilience import RetryScheduler
+        attempts = []
+
+        def attempt(n):
+            attempts.append(n)
+            if n < 2:
+                raise ConnectionError("flaky")
+            return "ok"
+
+        fut = RetryScheduler(workers=1).run(attempt, lambda e, n: 0.01)
+        self.assertEqual(fut.result(timeout=2), "ok")
+        self.assertEqual(attempts, [0, 1, 2])
+
+    def test_gives_up_when_retry_delay_says_so(self):
+        from api.resilience import RetryScheduler
+        fut = RetryScheduler(workers=1).run(lambda n: 1 / 0, lambda e, n: 0.01 if n < 1 else None)
+        with self.assertRaises(ZeroDivisionError):
+            fut.result(timeout=2)
+
+    def test_backoff_waits_on_the_timer_not_a_worker(self):
+        from api.resilience import RetryScheduler
+        sched = RetryScheduler(workers=1)
+        slow = sched.run(lambda n: 1 / 0 if n == 0 else "late", lambda e, n: 0.3)
+        # the only worker is free while `slow` waits out its backoff
+        self.assertEqual(sched.run(lambda n: "quick", lambda e, n: None).result(timeout=0.2), "quick")
+        self.assertEqual(slow.result(timeout=2), "late")
+
+
+class SymptomRulesTests(SimpleTestCase):
+    """Pins the fallback matcher's output on the shipped data/symptom_rules.json."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from api.symptom_rules import DEFAULT_RULES_PATH, RuleMatcher, load_rules
+        cls.matcher = RuleMatcher(load_rules(DEFAULT_RULES_PATH))
+
+    def categories(self, text):
+        return self.matcher.keywords(text)[0]
+
+    def test_representative_queries(self):
+        cases = [
+            ("I can't sleep at night", ["sleep"]),
+            ("insomnia and melatonin gummies", ["sleep"]),
+            ("bad stomachache after dinner", ["stomachache"]),
+            ("headaches every morning", ["pain relief"]),
+            ("my lower back is sore", ["pain relief"]),
+            ("a zit on my chin and oily skin", ["acne"]),
+            ("hair fall and an itchy scalp", ["hair care"]),
+            ("nothing relevant here", []),
+            ("", []),
+        ]
+        for text, expected in cases:
+            with self.subTest(text=text):
+                self.assertEqual(self.categories(text), expected)
+
+    def test_whole_words_only(self):
+        self.assertEqual(self.categories("heavy rainfall"), [])           # "fall" inside a word
+        self.assertEqual(self.categories("a trip to the backyard"), [])   # "back" needs a word end
+        self.assertEqual(self.categories("painful knees"), ["pain relief"])  # "pain*" allows endings
+
+    def test_overlapping_triggers_report_every_rule_once(self):
+        cats, kws = self.matcher.keywords("Sleepless with stomach pain, acne and hair loss; sleep sleep")
+        self.assertEqual(cats, ["sleep", "stomachache", "pain relief", "acne", "hair care"])  # rule order
+        self.assertEqual(len(kws), len(set(kws)))
+        self.assertIn("melatonin", kws)
+        self.assertIn("ibuprofen", kws)
+
+    def test_prefix_and_suffix_triggers_share_states(self):
+        from api.symptom_rules import Rule, RuleMatcher
+        m = RuleMatcher([Rule("a", ["ache*"], ["x"]), Rule("b", ["headache"], ["y"]), Rule("c", ["he"], ["z"])])
+        self.assertEqual(m.match("headache"), [1])      # "ache" is inside a word here
+        self.assertEqual(m.match("he has aches"), [0, 2])
+
+
+class OnnxInstallTests(SimpleTestCase):
+    """_install() moves a finished export into place without optimum being involved."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, True)
+        self.out = os.path.join(self.root, "model")
+        self.tmp = self._export_dir(".export-1", "new")
+
+    def _export_dir(self, name, marker, complete=True):
+        from api.hf_backend import QUANTIZED_FILE
+        path = os.path.join(self.root, name)
+        os.makedirs(path)
+        if complete:
+            with open(os.path.join(path, QUANTIZED_FILE), "w") as fh:
+                fh.write(marker)
+        return path
+
+    def _installed(self):
+        from api.hf_backend import QUANTIZED_FILE
+        with open(os.path.join(self.out, QUANTIZED_FILE)) as fh:
+            return fh.read()
+
+    def test_moves_into_place(self):
+        from api.hf_backend import _install
+        _install(self.tmp, self.out)
+        self.assertEqual(self._installed(), "new")
+
+    def test_keeps_a_complete_export_from_another_worker(self):
+        from api.hf_backend import _install
+        self._export_dir("model", "theirs")
+        with open(os.path.join(self.out, "extra"), "w"):
+            pass  # non-empty, so rename fails
+        _install(self.tmp, self.out)
+        self.assertEqual(self._installed(), "theirs")
+
+    def test_replaces_a_stale_partial_export(self):
+        from api.hf_backend import _install
+        self._export_dir("model", "", complete=False)
+        with open(os.path.join(self.out, "model.onnx"), "w"):
+            pass  # crashed before quantizing
+        _install(self.tmp, self.out)
+        self.assertEqual(self._installed(), "new")
+
+
+class UploadLimitTests(SimpleTestCase):
+    def _images(self, n):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        return [SimpleUploadedFile(f"{i}.jpg", b"\xff\xd8\xff" + b"0" * 64, content_type="image/jpeg")
+                for i in range(n)]
+
+    def test_single_image_views_keep_the_per_image_body_limit(self):
+        from api.image_intake import BatchUploadHandler, ImageTooLarge, LimitedUploadHandler
+        over = settings.UPLOAD_MAX_BYTES + 128 * 1024
+        with self.assertRaises(ImageTooLarge):
+            LimitedUploadHandler().handle_raw_input(None, {}, over, b"x")
+        BatchUploadHandler().handle_raw_input(None, {}, over, b"x")  # fine for a batch
+
+    def test_second_image_on_single_upload_is_a_400(self):
+        resp = self.client.post("/api/upload/", {"image": self._images(2)})
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.json()["detail"], "Send one image per upload; use /api/upload/batch/ for several.")
+
+    def test_batch_rejects_more_than_upload_max_files(self):
+        resp = self.client.post("/api/upload/batch/", {"images": self._images(settings.UPLOAD_MAX_FILES + 1)})
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn(f"At most {settings.UPLOAD_MAX_FILES} images", resp.json()["detail"])
+
+    def test_limits_only_apply_to_upload_views(self):
+        from django.test import RequestFactory
+        self.assertNotIn("api.image_intake.LimitedUploadHandler", settings.FILE_UPLOAD_HANDLERS)
+        # a plain Django view (admin, etc.) parses several files without a DRF exception
+        request = RequestFactory().post("/admin/whatever/", {"f": self._images(2)})
+        self.assertEqual(len(request.FILES.getlist("f")), 2)
+        resp = self.client.post("/api/jobs/", {"image": self._images(2)})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_oversized_image_is_a_413(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        with self.settings(UPLOAD_MAX_BYTES=1024):
+            big = SimpleUploadedFile("big.jpg", b"0" * 4096, content_type="image/jpeg")
+            resp = self.client.post("/api/upload/", {"image": big})
+        self.assertEqual(resp.status_code, 413)
+
+
+class ImageWriterSpoolTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, True)
+
+    def _upload(self, body):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        return SimpleUploadedFile("p.jpg", body, content_type="image/jpeg")
+
+    def test_spool_limit_uses_the_in_memory_count(self):
+        from api.persistence import ImageWriter
+        w = ImageWriter(self.dir, workers=0, max_spooled=2)
+        self.assertEqual([w.submit(self._upload(b)) for b in (b"a", b"b", b"a", b"c")], [True, True, False, False])
+        s = w.stats()
+        self.assertEqual((s["on_disk"], s["spooled"], s["duplicates"], s["dropped"]), (2, 2, 1, 1))
+        self.assertEqual(len(os.listdir(self.dir)), 2)  # no .part leftovers
+
+    def test_sweep_recounts_and_tolerates_files_removed_by_another_process(self):
+        from api.persistence import ImageWriter
+        w = ImageWriter(self.dir, workers=0)
+        w.submit(self._upload(b"a"))
+        w.submit(self._upload(b"b"))
+        os.unlink(os.path.join(self.dir, os.listdir(self.dir)[0]))  # another worker stored it
+        w._sweep()
+        self.assertEqual(w.stats()["on_disk"], 1)
+        self.assertEqual(ImageWriter(self.dir, workers=0).stats()["on_disk"], 1)  # restart picks it up
+
+
+    def test_failed_writes_are_retried_under_steady_traffic(self):
+        from unittest import mock
+        from api.persistence import ImageWriter
+        written, failed = [], []
+
+        def write(self_, names):
+            if not failed:
+                failed.extend(names)
+                raise OSError("storage down")
+            written.extend(names)
+
+        with mock.patch.object(ImageWriter, "_write", write):
+            w = ImageWriter(self.dir, workers=1, retry_seconds=0.1)
+            w.submit(self._upload(b"first"))
+            deadline = time.monotonic() + 3
+            i = 0
+            while not (failed and failed[0] in written) and time.monotonic() < deadline:
+                w.submit(self._upload(b"busy %d" % i))  # the queue never goes idle for 0.1s
+                i += 1
+                time.sleep(0.01)
+            w.retry_seconds = 3600  # park the daemon threads before the spool dir goes away
+            time.sleep(0.15)
+        self.assertTrue(failed)
+        self.assertIn(failed[0], written)
+
+
+class JobRunnerTests(SimpleTestCase):
+    """Stages are stubbed; timeouts are shrunk so each case runs in well under a second."""
+
+    TIMEOUTS = dict(JOBS_OCR_TIMEOUT=0.2, JOBS_NER_TIMEOUT=0.2, JOBS_SEARCH_TIMEOUT=0.2, JOBS_STAGE_GRACE=0.1)
+
+    def setUp(self):
+        from unittest import mock
+        self.ocr_delay = self.ner_delay = 0
+        self.search_batches = [("walmart", [{"retailer": "walmart", "title": "Advil", "url": "https://w/1"}])]
+        self.search_delay = 0      # after the first batch
+        self.hang = threading.Event()
+        self.addCleanup(self.hang.set)
+
+        def ocr(file):
+            self.assertEqual(file.read(), b"img")
+            self._sleep(self.ocr_delay)
+            return "advil 200mg"
+
+        def ner(text):
+            self._sleep(self.ner_delay)
+            return ["advil"]
+
+        def iter_search(query, retailers, meta, deadline=None):
+            meta["cache"] = "miss"
+            for i, batch in enumerate(self.search_batches):
+                if i:
+                    self._sleep(self.search_delay)
+                yield batch
+            self._sleep(self.search_delay)
+
+        for target, stub in (("api.ocr.extract_text_from_image", ocr), ("api.hf_nlp.keywords_from_text", ner),
+                             ("api.search_engine.iter_search", iter_search),
+                             ("api.persistence.persist_upload", lambda f: None)):
+            patcher = mock.patch(target, stub)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        override = self.settings(**self.TIMEOUTS)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def _sleep(self, seconds):
+        self.hang.wait(seconds)
+
+    def _runner(self, **kwargs):
+        from api.jobs import JobRunner
+        return JobRunner(**{"workers": 1, "queue_size": 4, **kwargs})
+
+    def _upload(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        return SimpleUploadedFile("p.jpg", b"img", content_type="image/jpeg")
+
+    def _finish(self, runner, job_id, timeout=3.0):
+        stop = time.monotonic() + timeout
+        while time.monotonic() < stop:
+            job = runner.get(job_id)
+            if job["status"] in ("done", "failed"):
+                return job
+            time.sleep(0.01)
+        self.fail(f"job still {job['status']}")
+
+    def test_happy_path(self):
+        runner = self._runner()
+        job = self._finish(runner, runner.submit(self._upload(), ["walmart"])["id"])
+        self.assertEqual(job["status"], "done")
+        self.assertEqual({s["status"] for s in job["stages"].values()}, {"done"})
+        self.assertEqual((job["result"]["query"], len(job["result"]["results"])), ("advil", 1))
+
+    def test_each_stage_timeout_fails_the_job(self):
+        for stage, attr in (("ocr", "ocr_delay"), ("keywords", "ner_delay"), ("search", "search_delay")):
+            with self.subTest(stage=stage):
+                setattr(self, attr, 1.0)
+                if stage == "search":
+                    self.search_batches = []  # nothing arrived before the timeout
+                runner = self._runner()
+                job = self._finish(runner, runner.submit(self._upload(), ["walmart"])["id"])
+                setattr(self, attr, 0)
+                self.assertEqual(job["status"], "failed")
+                self.assertEqual(job["stages"][stage]["status"], "timeout")
+                self.assertIn(f"{stage} timed out", job["error"])
+                self.assertEqual(runner.stats()["abandoned_stages"], 1)
+
+    def test_search_timeout_keeps_partial_results(self):
+        self.search_delay = 1.0  # first retailer answers, the next one hangs past the deadline
+        runner = self._runner()
+        job = self._finish(runner, runner.submit(self._upload(), ["walmart", "target"])["id"])
+        self.assertEqual(job["status"], "done")
+        self.assertEqual(job["stages"]["search"]["status"], "partial")
+        self.assertEqual(len(job["result"]["results"]), 1)
+        self.assertIsNone(job["error"])
+
+    def test_abandoned_stages_are_bounded_and_released(self):
+        self.ocr_delay = 0.4
+        runner = self._runner(max_abandoned=1)
+        self._finish(runner, runner.submit(self._upload(), ["walmart"])["id"])
+        from api.jobs import QueueFull
+        with self.assertRaises(QueueFull):
+            runner.submit(self._upload(), ["walmart"])
+        time.sleep(0.4)  # the stuck OCR call returns
+        self.assertEqual(runner.stats()["abandoned_stages"], 0)
+        runner.submit(self._upload(), ["walmart"])
+
+    def test_results_are_postprocessed_with_the_job_options(self):
+        self.search_batches = [
+            ("walmart", [{"retailer": "walmart", "title": "Advil 200mg 100 ct", "price": "$9.99", "url": "https://w/1"}]),
+            ("target", [{"retailer": "target", "title": "Advil 200mg 100 ct", "price": "$8.49", "url": "https://t/1"},
+                        {"retailer": "target", "title": "Motrin IB 200mg", "price": "$5.99", "url": "https://t/2"}]),
+        ]
+        runner = self._runner()
+        job = self._finish(runner, runner.submit(self._upload(), ["walmart", "target"], {"sort": "price"})["id"])
+        results = job["result"]["results"]
+        self.assertEqual([d["best_price_cents"] for d in results], [599, 849])
+        self.assertEqual(len(results[1]["offers"]), 2)
+
+    def test_async_upload_passes_result_options_to_the_job(self):
+        from unittest import mock
+        runner = mock.Mock()
+        runner.submit.return_value = {"id": "abc", "status": "queued"}
+        with mock.patch("api.views.get_runner", return_value=runner):
+            resp = self.client.post("/api/upload/?async=1&sort=price&max_price=9", {"image": self._upload()})
+        self.assertEqual(resp.status_code, 202)
+        options = runner.submit.call_args.args[2]
+        self.assertEqual((options["sort"], options["max_price"], options["dedupe"]), ("price", 9.0, True))
+
+    def test_queue_full_is_a_429_with_retry_after(self):
+        from unittest import mock
+        from api.jobs import QueueFull
+        runner = mock.Mock()
+        runner.submit.side_effect = QueueFull(retry_after=7)
+        with mock.patch("api.views.get_runner", return_value=runner):
+            resp = self.client.post("/api/jobs/", {"image": self._upload()})
+        self.assertEqual(resp.status_code, 429)
+        self.assertEqual(resp["Retry-After"], "7")
+
+    def test_queue_full_from_a_real_runner(self):
+        from api.jobs import QueueFull
+        self.ocr_delay = 1.0
+        runner = self._runner(queue_size=1, max_abandoned=5)
+        runner.submit(self._upload(), ["walmart"])   # taken by the worker
+        time.sleep(0.05)
+        runner.submit(self._upload(), ["walmart"])   # fills the queue
+        with self.assertRaises(QueueFull) as cm:
+            runner.submit(self._upload(), ["walmart"])
+        self.assertGreaterEqual(cm.exception.retry_after, 1)
+
+    def test_finished_jobs_expire_after_ttl(self):
+        runner = self._runner(ttl=0.3)
+        job_id = runner.submit(self._upload(), ["walmart"])["id"]
+        self._finish(runner, job_id)
+        time.sleep(0.35)
+        self.assertIsNone(runner.get(job_id))
+
+    def test_get_reads_jobs_published_by_another_process(self):
+        from api.cache import SQLiteCache
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, True)
+        path = os.path.join(tmp, "jobs.sqlite3")
+        runner = self._runner(shared=SQLiteCache(path, table="jobs"))
+        job_id = runner.submit(self._upload(), ["walmart"])["id"]
+        self._finish(runner, job_id)
+        other = self._runner(shared=SQLiteCache(path, table="jobs"))  # never saw the job itself
+        job = other.get(job_id)
+        self.assertEqual((job["status"], job["result"]["query"]), ("done", "advil"))
+        self.assertIsNone(other.get("nope"))
+
+
+class ParsePriceTests(SimpleTestCase):
+    CASES = [
+        # raw, (price_cents, quantity, unit_price_cents, unit)
+        ("$7.99", (799, 1, 799, None)),
+        ("2 for $10", (1000, 2, 500, "ea")),
+        ("2/$5", (500, 2, 250, "ea")),
+        ("$10 for 2", (1000, 2, 500, "ea")),
+        ("$4.97/ea", (497, 1, 497, "ea")),
+        ("$3.50/oz", (350, 1, 350, "oz")),
+        ("$1,299.00", (129900, 1, 129900, None)),
+        ("99¢", (99, 1, 99, None)),
+        ("50 cents", (50, 1, 50, None)),
+        ("Was $8.99 Now $6.99", (699, 1, 699, None)),
+        ("Reg. $5.49 Sale $3.99", (399, 1, 399, None)),
+        ("Reg. $5.49", (549, 1, 549, None)),
+        ("$5.99 - $8.99", (599, 1, 599, None)),   # ranges: the low end
+        ("From $5.99", (599, 1, 599, None)),
+        ("USD 12.5", (1250, 1, 1250, None)),
+        ("7.99", (799, 1, 799, None)),
+        (12.5, (1250, 1, 1250, None)),
+        ("See price in cart", (None, 1, None, None)),
+        (None, (None, 1, None, None)),
+    ]
+
+    def test_table(self):
+        from api.postprocess import parse_price
+        for raw, expected in self.CASES:
+            with self.subTest(raw=raw):
+                self.assertEqual(parse_price(raw), expected)
+
+
+class PostprocessTests(SimpleTestCase):
+    def _item(self, retailer, title, price, n):
+        return {"retailer": retailer, "title": title, "price": price, "url": f"https://{retailer}.com/p/{n}"}
+
+    def test_equal_strength_titles_merge(self):
+        from api.postprocess import postprocess
+        out = postprocess([
+            self._item("walmart", "Advil Ibuprofen Tablets 200mg, 100 Count", "$9.99", 1),
+            self._item("target", "Advil Ibuprofen 200 mg Tablets - 100ct", "$8.49", 2),
+            self._item("cvs", "advil ibuprofen tablets 200mg 100 count pain reliever", "$10.49", 3),
+        ])
+        self.assertEqual(len(out), 1)
+        self.assertEqual(out[0]["retailer"], "walmart")  # best-ranked listing leads
+        self.assertEqual([o["retailer"] for o in out[0]["offers"]], ["target", "walmart", "cvs"])
+
+    def test_different_sizes_and_strengths_stay_apart(self):
+        from api.postprocess import postprocess
+        out = postprocess([
+            self._item("walmart", "Advil Ibuprofen Tablets 200mg, 100 Count", "$9.99", 1),
+            self._item("target", "Advil Ibuprofen Tablets 200mg, 200 Count", "$14.99", 2),
+            self._item("cvs", "Advil Ibuprofen Tablets 400mg, 100 Count", "$12.99", 3),
+        ])
+        self.assertEqual(len(out), 3)
+        self.assertTrue(all("offers" not in d for d in out))
+
+    def test_near_duplicates_are_found_beyond_exact_word_sets(self):
+        import random
+        from api.postprocess import _groups, Record
+        rnd = random.Random(3)
+        vocab = [f"{a}{b}{c}" for a in "bcdfg" for b in "aeiou" for c in "klmnprst"]
+        items = []
+        for i in range(300):
+            words = rnd.sample(vocab, 9)
+            other = list(words)
+            other[rnd.randrange(9)] = rnd.choice([w for w in vocab if w not in words])  # Jaccard 0.8
+            items += [{"title": " ".join(words)}, {"title": " ".join(other)}]
+        groups = _groups([Record(i, it) for i, it in enumerate(items)])
+        self.assertEqual(sorted(len(g) for g in groups), [2] * 300)
+
+    def test_filter_and_sort_use_the_cheapest_offer(self):
+        from api.postprocess import postprocess
+        items = [
+            self._item("walmart", "Advil Ibuprofen Tablets 200mg, 100 Count", "$9.99", 1),
+            self._item("target", "Advil Ibuprofen 200 mg Tablets - 100ct", "$8.49", 2),
+            self._item("walmart", "Tylenol Extra Strength Caplets 500mg, 24 ct", "$8.99", 3),
+            self._item("cvs", "Aleve Naproxen Sodium 220mg, 50 ct", "See price in cart", 4),
+        ]
+        out = postprocess(items, max_price=9)
+        self.assertEqual([(d["url"], d["best_price_cents"]) for d in out],
+                         [("https://walmart.com/p/1", 849), ("https://walmart.com/p/3", 899)])
+        self.assertEqual(out[0]["price_cents"], 999)  # the listing's own price is unchanged
+
+        asc = [d["best_price_cents"] for d in postprocess(items, sort="price")]
+        desc = [d["best_price_cents"] for d in postprocess(items, sort="-price")]
+        self.assertEqual(asc, [849, 899, None])
+        self.assertEqual(desc, [899, 849, None])
+        self.assertEqual(len(postprocess(items, min_price=0)), 2)  # unpriced items can't pass a price filter
+
+    def test_without_dedupe_every_listing_stays(self):
+        from api.postprocess import postprocess
+        items = [self._item(r, "Advil Ibuprofen Tablets 200mg, 100 Count", "$9.99", i)
+                 for i, r in enumerate(("walmart", "target"))]
+        items.append({"retailer": "cvs", "error": "timeout"})
+        out = postprocess(items, dedupe=False)
+        self.assertEqual([d["retailer"] for d in out], ["walmart", "target", "cvs"])
+        self.assertEqual(out[-1], {"retailer": "cvs", "error": "timeout"})
+
+
+class DomainRegistryTests(SimpleTestCase):
+    def setUp(self):
+        from api.retailers import DomainRegistry
+        self.reg = DomainRegistry({
+            "walmart": ["walmart.com"], "walgreens": ["www.walgreens.com"], "amazon": ["amazon.com"],
+            "amazon_pharmacy": ["pharmacy.amazon.com"],
+        })
+
+    def test_domain_and_subdomains_match(self):
+        for host in ("walmart.com", "www.walmart.com", "grocery.walmart.com", "WWW.Walmart.COM", "walmart.com."):
+            with self.subTest(host=host):
+                self.assertEqual(self.reg.classify(host), "walmart")
+        self.assertEqual(self.reg.classify("walgreens.com"), "walgreens")  # www. stripped on add
+
+    def test_lookalikes_do_not_match(self):
+        for host in ("walmart.com.example.net", "notwalgreens.com", "walmart.co", "com", "", None,
+                     "a..walmart.com", "..walmart.com", ".walmart.com", "walmart..com"):
+            with self.subTest(host=host):
+                self.assertIsNone(self.reg.classify(host))
+
+    def test_longest_suffix_wins(self):
+        self.assertEqual(self.reg.classify("pharmacy.amazon.com"), "amazon_pharmacy")
+        self.assertEqual(self.reg.classify("rx.pharmacy.amazon.com"), "amazon_pharmacy")
+        self.assertEqual(self.reg.classify("www.amazon.com"), "amazon")
+
+    def test_malformed_link_does_not_break_the_filter(self):
+        from api.providers_serpapi import _filter_web
+        web = {"organic_results": [{"link": "https://a..walmart.com/ip/1", "title": "bad"},
+                                   {"link": "https://www.walmart.com/ip/2", "title": "good"}]}
+        self.assertEqual([it["title"] for it in _filter_web(web, ["walmart"], 5)], ["good"])
+
+    def test_host_ok_and_listing(self):
+        self.assertTrue(self.reg.host_ok("www.walmart.com", {"walmart", "target"}))
+        self.assertFalse(self.reg.host_ok("walmart.com.example.net", {"walmart"}))
+        self.assertEqual(self.reg.domains("walgreens"), ["walgreens.com"])
+        self.assertEqual(self.reg.domains("nope"), [])
+
+    def test_host_of(self):
+        from api.retailers import host_of
+        cases = {
+            "https://www.Walmart.com/ip/123?x=1#y": "www.walmart.com",
+            "https://user:pw@cvs.com:8443/shop": "cvs.com",
+            "http://[::1]:8000/": "::1",
+            "target.com/p/1": "target.com",
+            "https://walgreens.com?q=1": "walgreens.com",
+        }
+        for url, host in cases.items():
+            with self.subTest(url=url):
+                self.assertEqual(host_of(url), host)
+
+    def test_extra_retailers_from_the_environment(self):
+        from api.retailers import _parse_extra, load_registry
+        self.assertEqual(_parse_extra("heb=heb.com; Meijer=meijer.com|meijer.ca;junk;cvs=cvs.ca"),
+                         {"heb": ["heb.com"], "meijer": ["meijer.com", "meijer.ca"], "cvs": ["cvs.ca"]})
+        self.assertEqual(_parse_extra(""), {})
+        reg = load_registry(extra="meijer=meijer.com|meijer.ca;cvs=cvs.ca")
+        self.assertEqual(reg.classify("www.meijer.ca"), "meijer")
+        self.assertEqual(reg.classify("cvs.ca"), "cvs")
+        self.assertEqual(reg.classify("cvs.com"), "cvs")  # shipped domains are kept
+
+
+# one results page per scraper spec: cards with untidy whitespace, relative links,
+# and a card without a link that must be skipped
+SCRAPER_PAGES = {
+    "walmart": """<div data-automation-id="products-list">
+        <div data-automation-id="product"><a aria-label="Advil  Ibuprofen 200mg" href="/ip/advil/1">x</a>
+          <div data-automation-id="product-price">current price $9.99</div></div>
+        <div data-automation-id="product"><span>sponsored</span></div></div>""",
+    "target": """<div data-test="results-list"><div>
+        <a data-test="product-title" href="/p/advil/-/A-1">Advil
+          Ibuprofen 200mg</a><span data-test="current-price">$8.49</span></div></div>""",
+    "costco": """<div class="product-list"><div class="product-tile-set">
+        <a href="https://www.costco.com/kirkland-ibuprofen.product.1.html"> Kirkland Ibuprofen </a>
+        <div class="price">$12.99</div></div></div>""",
+    "amazon": """<div class="s-main-slot"><div class="s-result-item"></div>
+        <div class="s-result-item"><h2><a href="/Advil/dp/B001">Advil Tablets</a></h2>
+          <span class="a-price"><span class="a-offscreen">$10.97</span><span>$10.97</span></span></div></div>""",
+    "cvs": """<main><div data-testid="product-grid"><div>
+        <a data-testid="product-card-name" href="/shop/advil-1">Advil Ibuprofen</a>
+        <div data-testid="product-price">$11.49</div></div></div></main>""",
+    "walgreens": """<div id="wag-return"><div class="product__container">
+        <a aria-label="Advil Liqui-Gels" href="/store/c/advil/ID=1"></a>
+        <span class="product__price">$9.49</span></div></div>""",
+}
+
+SCRAPER_EXPECTED = {
+    "walmart": ("Advil Ibuprofen 200mg", "https://www.walmart.com/ip/advil/1", "current price $9.99"),
+    "target": ("Advil Ibuprofen 200mg", "https://www.target.com/p/advil/-/A-1", "$8.49"),
+    "costco": ("Kirkland Ibuprofen", "https://www.costco.com/kirkland-ibuprofen.product.1.html", "$12.99"),
+    "amazon": ("Advil Tablets", "https://www.amazon.com/Advil/dp/B001", "$10.97"),
+    "cvs": ("Advil Ibuprofen", "https://www.cvs.com/shop/advil-1", "$11.49"),
+    "walgreens": ("Advil Liqui-Gels", "https://www.walgreens.com/store/c/advil/ID=1", "$9.49"),
+}
+
+
+class ScraperSpecTests(SimpleTestCase):
+    """Each spec against a fixture page through the soup extractor (the in-page JS mirrors it)."""
+
+    def _scrape(self, retailer):
+        import contextlib
+        from unittest import mock
+        from api import scrapers
+
+        class Driver:
+            page_source = "<html><body>%s</body></html>" % SCRAPER_PAGES[retailer]
+
+            def get(self, url):
+                self.url = url
+
+        with mock.patch.object(scrapers, "SCRAPE_EXTRACT", "soup"), \
+                mock.patch.object(scrapers, "_driver", lambda profile="full": contextlib.nullcontext(Driver())), \
+                mock.patch.object(scrapers, "_apply_profile", lambda *a: None), \
+                mock.patch.object(scrapers, "_wait_for", lambda *a, **k: None):
+            return scrapers._scrape(retailer, "advil")
+
+    def test_every_spec_has_a_fixture(self):
+        from api.scrapers import _SPECS
+        self.assertEqual(set(SCRAPER_PAGES), set(_SPECS))
+
+    def test_fields_and_links(self):
+        for retailer, (title, url, price) in SCRAPER_EXPECTED.items():
+            with self.subTest(retailer=retailer):
+                self.assertEqual(self._scrape(retailer),
+                                 [{"retailer": retailer, "title": title, "price": price, "url": url}])
+
+    def test_unknown_extract_mode_is_rejected(self):
+        env = dict(os.environ, SCRAPE_EXTRACT="xpath")
+        out = subprocess.run([sys.executable, "-c", "import api.scrapers"], cwd=str(settings.BASE_DIR),
+                             env=env, capture_output=True, text=True)
+        self.assertNotEqual(out.returncode, 0)
+        self.assertIn("unknown SCRAPE_EXTRACT 'xpath'", out.stderr)
+
+
+class DriverPoolSizeTests(SimpleTestCase):
+    def _sizes(self, total, optout=(), profile="lean"):
+        from unittest import mock
+        from api import scrapers
+        with mock.patch.object(scrapers, "SCRAPE_LEAN_OPTOUT", set(optout)), \
+                mock.patch.object(scrapers, "SCRAPE_PROFILE", profile):
+            return scrapers._pool_sizes(total)
+
+    def test_single_profile_gets_the_whole_budget(self):
+        self.assertEqual(self._sizes(4), {"lean": 4})
+        self.assertEqual(self._sizes(4, profile="full"), {"full": 4})
+
+    def test_budget_is_split_when_retailers_opt_out(self):
+        for total in (2, 3, 4, 7):
+            for optout in (["amazon"], ["amazon", "cvs", "target"], ["amazon", "cvs", "target", "walmart", "costco"]):
+                with self.subTest(total=total, optout=optout):
+                    sizes = self._sizes(total, optout)
+                    self.assertEqual(sum(sizes.values()), total)
+                    self.assertEqual(set(sizes), {"full", "lean"})
+                    self.assertTrue(all(n >= 1 for n in sizes.values()))
+        self.assertEqual(self._sizes(4, ["amazon"]), {"lean": 3, "full": 1})
+
+    def test_one_browser_runs_everything_full(self):
+        self.assertEqual(self._sizes(1, ["amazon"]), {"full": 1})
+
+
+class NerBatchTests(SimpleTestCase):
+    @staticmethod
+    def _fake_ner(calls):
+        def ner(texts, batch_size):
+            calls.append((list(texts), batch_size))
+            return [[{"entity_group": "ORG", "word": t.upper(), "score": 1.0}] for t in texts]
+        return ner
+
+    def test_results_follow_submission_order(self):
+        from unittest import mock
+        from api import hf_nlp
+        texts = ["advil liqui-gels 200mg", "tums", "claritin 24 hour allergy", "aleve"]
+        calls = []
+        with mock.patch.object(hf_nlp, "_get_ner", lambda: self._fake_ner(calls)), \
+                self.settings(HF_NER_SUB_BATCH=2):
+            out = hf_nlp._ner_batch(texts)
+        self.assertEqual([e[0]["word"] for e in out], [t.upper() for t in texts])
+        # sorted by length so each padded pass of 2 holds neighbours
+        self.assertEqual(calls, [(["tums", "aleve", "advil liqui-gels 200mg", "claritin 24 hour allergy"], 2)])
+
+    def test_concurrent_callers_get_their_own_result(self):
+        from unittest import mock
+        from api import hf_nlp
+        from api.coalesce import MicroBatcher
+        calls = []
+        texts = [("x" * (20 - i)) + str(i) for i in range(12)]  # submission order is longest first
+        with mock.patch.object(hf_nlp, "_get_ner", lambda: self._fake_ner(calls)):
+            batcher = MicroBatcher(hf_nlp._ner_batch, max_batch=16, max_wait=0.2)
+            futures = [batcher.submit(t) for t in texts]
+            out = [f.result(timeout=5) for f in futures]
+        self.assertEqual([e[0]["word"] for e in out], [t.upper() for t in texts])
+        self.assertEqual(len(calls), 1)
+
+    def test_lone_item_does_not_wait_for_the_window(self):
+        from api.coalesce import MicroBatcher
+        batcher = MicroBatcher(lambda items: items, max_batch=16, max_wait=2.0, wait_alone=False)
+        t0 = time.monotonic()
+        self.assertEqual(batcher.submit("a").result(timeout=5), "a")
+        self.assertLess(time.monotonic() - t0, 1.0)
+
+
+class MultiSearchTests(SimpleTestCase):
+    """Scrapers are stubbed; slow ones block on an event that cleanup sets."""
+
+    def setUp(self):
+        from unittest import mock
+        from api import scrapers
+        self.scrapers = scrapers
+        self.release = threading.Event()
+        self.addCleanup(self._drain)
+        self.calls = []
+        fake = {r: self._scraper(r) for r in scrapers.PRIORITY}
+        patcher = mock.patch.object(scrapers, "_SCRAPERS", fake)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.slow = {}
+
+    def _drain(self):
+        self.release.set()
+        deadline = time.monotonic() + 5
+        while self.scrapers._abandoned and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _scraper(self, retailer):
+        def scrape(query):
+            self.calls.append(retailer)
+            delay = self.slow.get(retailer, 0)
+            if delay is None:
+                self.release.wait(5)
+            elif delay == "boom":
+                raise RuntimeError("page changed")
+            else:
+                time.sleep(delay)
+            return [{"retailer": retailer, "title": f"{query} at {retailer}"}]
+        return scrape
+
+    def test_slow_retailer_times_out_alone(self):
+        self.slow = {"target": None}
+        got = dict(self.scrapers.iter_multi_search("advil", ["walmart", "target"], timeout=0.2, deadline=5))
+        self.assertEqual(got["walmart"][0]["title"], "advil at walmart")
+        self.assertEqual(got["target"], [{"retailer": "target", "error": "timed out after 0.2s"}])
+
+    def test_overall_deadline(self):
+        self.slow = {"walmart": None, "amazon": None}
+        t0 = time.monotonic()
+        got = dict(self.scrapers.iter_multi_search("advil", ["walmart", "amazon", "cvs"], timeout=5, deadline=0.3))
+        self.assertLess(time.monotonic() - t0, 2)
+        self.assertEqual(got["walmart"], [{"retailer": "walmart", "error": "deadline exceeded after 0.3s"}])
+        self.assertEqual(got["amazon"][0]["error"], "deadline exceeded after 0.3s")
+        self.assertEqual(got["cvs"][0]["title"], "advil at cvs")
+
+    def test_merge_follows_priority_not_completion(self):
+        # cvs (first in PRIORITY) finishes last
+        self.slow = {"cvs": 0.2, "walmart": 0.1, "target": 0}
+        out = self.scrapers.multi_search("advil", ["target", "walmart", "cvs"], parallel=True, timeout=5, deadline=5)
+        self.assertEqual([it["retailer"] for it in out], ["cvs", "walmart", "target"])
+
+    def test_unsupported_retailer(self):
+        out = self.scrapers.multi_search("advil", ["kroger", "cvs"], parallel=True)
+        self.assertEqual(out, [{"retailer": "cvs", "title": "advil at cvs"},
+                               {"retailer": "kroger", "error": "unsupported retailer"}])
+
+    def test_serial_path(self):
+        from unittest import mock
+        self.slow = {"walmart": "boom"}
+        with mock.patch.object(self.scrapers, "SCRAPE_PARALLEL", False):
+            out = self.scrapers.multi_search("advil", ["target", "walmart", "cvs", "kroger"])
+        self.assertEqual(self.calls, ["cvs", "walmart", "target"])
+        self.assertEqual(out, [{"retailer": "cvs", "title": "advil at cvs"},
+                               {"retailer": "walmart", "error": "page changed"},
+                               {"retailer": "target", "title": "advil at target"},
+                               {"retailer": "kroger", "error": "unsupported retailer"}])
+
+    def test_abandoned_workers_are_capped(self):
+        from unittest import mock
+        self.slow = {"target": None}
+        with mock.patch.object(self.scrapers, "SCRAPE_MAX_ABANDONED", 1):
+            dict(self.scrapers.iter_multi_search("advil", ["target"], timeout=0.1, deadline=5))
+            self.assertEqual(self.scrapers._abandoned, 1)
+            busy = dict(self.scrapers.iter_multi_search("advil", ["cvs"], timeout=0.1, deadline=5))
+            self.assertIn("too many timed-out searches", busy["cvs"][0]["error"])
+            self._drain()
+            self.assertEqual(self.scrapers._abandoned, 0)
+            ok = dict(self.scrapers.iter_multi_search("advil", ["cvs"], timeout=1, deadline=5))
+            self.assertEqual(ok["cvs"][0]["title"], "advil at cvs")
+
+
+class DriverPoolTests(SimpleTestCase):
+    class FakeDriver:
+        def __init__(self):
+            self.healthy = True
+            self.reset_fails = False
+            self.quit_called = False
+            self.current_url = "https://www.walmart.com/search?q=advil"
+            self.cdp = []
+
+        def execute_script(self, script):
+            if "return 1" in script:
+                if not self.healthy:
+                    raise RuntimeError("chrome not reachable")
+                return 1
+
+        def delete_all_cookies(self):
+            if self.reset_fails:
+                raise RuntimeError("session deleted")
+
+        def execute_cdp_cmd(self, cmd, params):
+            self.cdp.append((cmd, params))
+
+        def get(self, url):
+            self.current_url = url
+
+        def quit(self):
+            self.quit_called = True
+
+    def _pool(self, **kwargs):
+        from api.driver_pool import DriverPool
+        self.made = []
+
+        def factory():
+            self.made.append(self.FakeDriver())
+            return self.made[-1]
+        return DriverPool(factory, **kwargs)
+
+    def test_checkin_resets_and_reuses(self):
+        pool = self._pool(max_size=2)
+        with pool.borrow() as d:
+            pass
+        self.assertEqual(d.current_url, "about:blank")
+        self.assertEqual(d.cdp, [("Storage.clearDataForOrigin",
+                                  {"origin": "https://www.walmart.com", "storageTypes": "all"})])
+        with pool.borrow() as d2:
+            self.assertIs(d2, d)
+        self.assertEqual(pool.stats(), {"live": 1, "idle": 1, "max_size": 2, "max_pages": 50})
+
+    def test_recycled_after_max_pages(self):
+        pool = self._pool(max_pages=2)
+        for _ in range(3):
+            with pool.borrow():
+                pass
+        self.assertEqual(len(self.made), 2)
+        self.assertTrue(self.made[0].quit_called)
+        self.assertFalse(self.made[1].quit_called)
+
+    def test_unhealthy_idle_driver_is_replaced(self):
+        pool = self._pool()
+        with pool.borrow() as d:
+            pass
+        d.healthy = False
+        with pool.borrow() as d2:
+            self.assertIsNot(d2, d)
+        self.assertTrue(d.quit_called)
+        self.assertEqual(pool.stats()["live"], 1)
+
+    def test_reset_failure_discards(self):
+        pool = self._pool()
+        with pool.borrow() as d:
+            d.reset_fails = True
+        self.assertTrue(d.quit_called)
+        self.assertEqual(pool.stats()["idle"], 0)
+        with pool.borrow() as d2:
+            self.assertIsNot(d2, d)
+
+    def test_exhausted_pool_times_out_and_recovers(self):
+        from api.driver_pool import PoolExhausted
+        pool = self._pool(max_size=1)
+        slot = pool.checkout()
+        t0 = time.monotonic()
+        with self.assertRaises(PoolExhausted):
+            pool.checkout(timeout=0.1)
+        self.assertGreaterEqual(time.monotonic() - t0, 0.1)
+        pool.checkin(slot)
+        pool.checkin(pool.checkout(timeout=0.1))  # the permit came back
+        pool.close()
+        self.assertTrue(self.made[0].quit_called)
+        with self.assertRaises(PoolExhausted):
+            pool.checkout()
+
+
+class SerpapiRetryTests(SimpleTestCase):
+    """The session is mocked; sleeps are recorded instead of taken."""
+
+    def setUp(self):
+        from unittest import mock
+        from api import providers_serpapi as sp
+        self.sp = sp
+        self.sleeps = []
+        self.calls = 0
+        self.responses = []
+        for target, value in (("_get_session", lambda: self), ("_retry_budget", sp.TokenBudget(0.1, 0.2)),
+                              ("SERPAPI_RETRIES", 2), ("SERPAPI_BACKOFF_BASE", 0.5), ("SERPAPI_BACKOFF_CAP", 8.0)):
+            p = mock.patch.object(sp, target, value)
+            p.start()
+            self.addCleanup(p.stop)
+        p = mock.patch.object(sp.time, "sleep", self.sleeps.append)
+        p.start()
+        self.addCleanup(p.stop)
+
+    @staticmethod
+    def _response(status, body=b"{}", headers=None):
+        import io, requests
+        r = requests.Response()
+        r.status_code, r._content, r.url = status, body, "https://serpapi.com/search.json"
+        r.raw = io.BytesIO()
+        r.headers.update(headers or {})
+        return r
+
+    def get(self, url, params=None, timeout=None):  # stands in for the session
+        self.calls += 1
+        return self.responses.pop(0)
+
+    def test_429_waits_for_retry_after(self):
+        self.responses = [self._response(429, headers={"Retry-After": "2"}), self._response(200, b'{"ok": 1}')]
+        self.assertEqual(self.sp._serpapi_get({"q": "advil"}), {"ok": 1})
+        self.assertEqual(self.sleeps, [2.0])
+
+    def test_5xx_is_retried_with_jittered_backoff(self):
+        self.responses = [self._response(503), self._response(502), self._response(200, b'{"ok": 2}')]
+        self.assertEqual(self.sp._serpapi_get({"q": "advil"}), {"ok": 2})
+        self.assertEqual(self.calls, 3)
+        self.assertTrue(0 <= self.sleeps[0] <= 0.5 and 0 <= self.sleeps[1] <= 1.0, self.sleeps)
+
+    def test_gives_up_after_max_retries(self):
+        import requests
+        self.responses = [self._response(500) for _ in range(3)]
+        with self.assertRaises(requests.HTTPError):
+            self.sp._serpapi_get({"q": "advil"})
+        self.assertEqual((self.calls, len(self.sleeps)), (3, 2))
+
+    def test_empty_budget_means_no_retry(self):
+        import requests
+        from unittest import mock
+        self.responses = [self._response(503), self._response(200)]
+        with mock.patch.object(self.sp, "_retry_budget", self.sp.TokenBudget(0, 0, cap=0)):
+            with self.assertRaises(requests.HTTPError):
+                self.sp._serpapi_get({"q": "advil"})
+        self.assertEqual((self.calls, self.sleeps), (1, []))
+
+    def test_retry_after_beyond_the_cap_is_not_waited_for(self):
+        import requests
+        self.responses = [self._response(429, headers={"Retry-After": "60"}), self._response(200)]
+        with self.assertRaises(requests.HTTPError):
+            self.sp._serpapi_get({"q": "advil"})
+        self.assertEqual((self.calls, self.sleeps), (1, []))
+
+    def test_client_errors_are_not_retried(self):
+        import requests
+        self.responses = [self._response(401)]
+        with self.assertRaises(requests.HTTPError):
+            self.sp._serpapi_get({"q": "advil"})
+        self.assertEqual(self.sleeps, [])
+
+    def test_retry_after_parsing(self):
+        from email.utils import formatdate
+        self.assertEqual(self.sp._retry_after({"Retry-After": "3"}), 3.0)
+        self.assertEqual(self.sp._retry_after({"Retry-After": "-1"}), 0.0)
+        self.assertIsNone(self.sp._retry_after({}))
+        self.assertIsNone(self.sp._retry_after({"Retry-After": "soon"}))
+        later = self.sp._retry_after({"Retry-After": formatdate(time.time() + 30, usegmt=True)})
+        self.assertTrue(25 <= later <= 31, later)
+
+    def test_budget_refills_from_traffic(self):
+        budget = self.sp.TokenBudget(ratio=0.5, min_per_sec=0, cap=1)
+        self.assertTrue(budget.withdraw())
+        self.assertFalse(budget.withdraw())
+        budget.deposit()
+        self.assertFalse(budget.withdraw())
+        budget.deposit()
+        self.assertTrue(budget.withdraw())
+
+
+class HedgedSearchTests(SimpleTestCase):
+    """Both passes are stubbed: each sleeps for its configured time and returns its items."""
+
+    ITEM = {"retailer": "walmart", "title": "Advil", "price": "9.99", "url": "https://www.walmart.com/ip/1"}
+
+    def setUp(self):
+        from unittest import mock
+        from api import providers_serpapi as sp
+        self.sp = sp
+        self.started = {}
+        self.plan = {"shopping": (0, [self.ITEM]), "web": (0, [dict(self.ITEM, title="Advil (web)")])}
+        for target, value in (("_shopping_pass", self._pass("shopping")), ("_web_pass", self._pass("web")),
+                              ("_ashopping_pass", self._apass("shopping")), ("_aweb_pass", self._apass("web")),
+                              ("_pass1_stats", sp._PassStats()), ("_hedge_budget", sp.TokenBudget(1, 0)),
+                              ("SERPAPI_HEDGE_DELAY", 5.0)):
+            p = mock.patch.object(sp, target, value)
+            p.start()
+            self.addCleanup(p.stop)
+        self.t0 = time.monotonic()
+
+    def _begin(self, name):
+        self.started[name] = time.monotonic() - self.t0
+        delay, out = self.plan[name]
+        return delay, out
+
+    def _pass(self, name):
+        def run(query, retailers, num):
+            delay, out = self._begin(name)
+            time.sleep(delay)
+            if isinstance(out, Exception):
+                raise out
+            return out, {}
+        return run
+
+    def _apass(self, name):
+        async def run(query, retailers, num):
+            import asyncio
+            delay, out = self._begin(name)
+            await asyncio.sleep(delay)
+            if isinstance(out, Exception):
+                raise out
+            return out, {}
+        return run
+
+    def _both(self):
+        """Runs the sync and the async version; both must agree."""
+        import asyncio
+        results = []
+        for run in (lambda: self.sp._search_hedged("advil", ["walmart"], 5),
+                    lambda: asyncio.run(self.sp._asearch_hedged("advil", ["walmart"], 5))):
+            self.started = {}
+            self.t0 = time.monotonic()
+            results.append((run(), dict(self.started)))
+        self.assertEqual(results[0][0], results[1][0])
+        return results
+
+    def test_fast_first_pass_never_hedges(self):
+        from unittest import mock
+        with mock.patch.object(self.sp, "SERPAPI_HEDGE_DELAY", 0.5):
+            for (out, source), started in self._both():
+                self.assertEqual((out, source), ([self.ITEM], "shopping"))
+                self.assertNotIn("web", started)
+
+    def test_slow_first_pass_is_hedged_after_the_delay(self):
+        from unittest import mock
+        self.plan["shopping"] = (0.5, [self.ITEM])
+        with mock.patch.object(self.sp, "SERPAPI_HEDGE_DELAY", 0.05):
+            for (out, source), started in self._both():
+                self.assertEqual(source, "web")
+                self.assertGreaterEqual(started["web"], 0.04)
+                self.assertLess(started["web"], 0.4)
+
+    def test_delay_comes_from_recent_latencies_once_there_are_enough(self):
+        from unittest import mock
+        stats = self.sp._PassStats()
+        with mock.patch.object(self.sp, "SERPAPI_HEDGE_MIN_SAMPLES", 20), \
+                mock.patch.object(self.sp, "SERPAPI_HEDGE_PERCENTILE", 90):
+            for i in range(19):
+                stats.observe("q", 0.01 * (i + 1), hit=True)
+            self.assertEqual(stats.hedge_delay(), 5.0)  # too few samples: the configured delay
+            stats.observe("q", 0.2, hit=True)
+            self.assertAlmostEqual(stats.hedge_delay(), 0.19)  # p90 of 0.01 .. 0.20
+
+    def test_queries_that_usually_miss_start_both_passes(self):
+        key = self.sp._miss_key("advil", ["walmart"])
+        self.sp._pass1_stats.observe(key, 0.1, hit=False)
+        self.sp._pass1_stats.observe(key, 0.1, hit=False)
+        self.plan["shopping"] = (0.3, [])
+        for (out, source), started in self._both():
+            self.assertEqual(source, "web")
+            self.assertLess(started["web"], 0.1)  # not after the 5s hedge delay
+
+    def test_hedge_budget_caps_speculative_calls(self):
+        from unittest import mock
+        self.plan["shopping"] = (0.2, [self.ITEM])
+        with mock.patch.object(self.sp, "_hedge_budget", self.sp.TokenBudget(0, 0, cap=0)), \
+                mock.patch.object(self.sp, "SERPAPI_HEDGE_DELAY", 0.01):
+            for (out, source), started in self._both():
+                self.assertEqual(source, "shopping")
+                self.assertNotIn("web", started)
+
+    def test_empty_first_pass_falls_back_even_without_budget(self):
+        from unittest import mock
+        self.plan["shopping"] = (0, [])
+        with mock.patch.object(self.sp, "_hedge_budget", self.sp.TokenBudget(0, 0, cap=0)):
+            for (out, source), started in self._both():
+                self.assertEqual((out[0]["title"], source), ("Advil (web)", "web"))
+
+    def test_nothing_found_is_empty_or_error(self):
+        self.plan = {"shopping": (0, []), "web": (0, [])}
+        self.assertEqual(self._both()[0][0], ([], "empty"))
+        self.plan["shopping"] = (0, RuntimeError("quota"))
+        self.assertEqual(self._both()[0][0], ([], "error"))
+
+
+class MergeAndRaceTests(SimpleTestCase):
+    @staticmethod
+    def _item(retailer, path, title=None):
+        return {"retailer": retailer, "title": title or path, "price": "$1.00", "url": f"https://www.{retailer}.com{path}"}
+
+    def test_merge_dedupes_urls(self):
+        from api.search_engine import merge_results
+        a = self._item("walmart", "/ip/1", "serpapi")
+        dupes = [dict(a, url="https://walmart.com/IP/1/", title="scrape"), dict(a, url="http://www.walmart.com/ip/1?x=1")]
+        out = merge_results([[a], dupes], ["walmart"], 10)
+        self.assertEqual([it["title"] for it in out], ["serpapi"])
+
+    def test_merge_orders_by_requested_retailer(self):
+        from api.search_engine import merge_results
+        batches = [[self._item("amazon", "/a"), self._item("target", "/t1")],
+                   [self._item("cvs", "/c"), self._item("target", "/t2")]]
+        out = merge_results(batches, ["cvs", "target"], 10)
+        self.assertEqual([it["url"].split(".com")[1] for it in out], ["/c", "/t1", "/t2", "/a"])
+
+    def test_merge_keeps_errors_only_for_empty_retailers(self):
+        from api.search_engine import merge_results
+        batches = [[{"retailer": "target", "error": "timed out"}, {"retailer": "cvs", "error": "timed out"}],
+                   [self._item("target", "/t")], [{"retailer": "target", "error": "later failure"}]]
+        out = merge_results(batches, ["target", "cvs"], 10)
+        self.assertEqual(out, [self._item("target", "/t"), {"retailer": "cvs", "error": "timed out"}])
+
+    def test_merge_cuts_at_num_but_keeps_errors(self):
+        from api.search_engine import merge_results
+        batches = [[self._item("walmart", f"/{i}") for i in range(5)], [{"retailer": "cvs", "error": "boom"}]]
+        out = merge_results(batches, ["walmart", "cvs"], 3)
+        self.assertEqual(len(out), 4)
+        self.assertEqual(out[-1], {"retailer": "cvs", "error": "boom"})
+
+    def _race(self, serp_delay, scrape_delay, num, deadline):
+        from unittest import mock
+        from api import search_engine
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def serpapi(query, retailers, num):
+            release.wait(serp_delay)
+            return [self._item("walmart", f"/s{i}") for i in range(3)], {"cache": "miss"}
+
+        def scrape(query, retailers, deadline=None):
+            release.wait(scrape_delay)
+            yield "target", [self._item("target", "/x1"), self._item("target", "/x2")]
+
+        with mock.patch.object(search_engine, "google_shopping_search_meta", serpapi), \
+                mock.patch.object(search_engine, "iter_multi_search", scrape):
+            t0 = time.monotonic()
+            results, meta = search_engine.search("advil", ["walmart", "target"], num=num,
+                                                 backend="both", deadline=deadline)
+            return results, meta, time.monotonic() - t0
+
+    def test_race_stops_once_num_results_are_in(self):
+        results, meta, took = self._race(serp_delay=0, scrape_delay=5, num=3, deadline=5)
+        self.assertLess(took, 1)
+        self.assertEqual(len(results), 3)
+        self.assertEqual(meta["pending"], ["scrape"])
+        self.assertEqual(meta["sources"], {"serpapi": 3})
+
+    def test_race_returns_what_arrived_by_the_deadline(self):
+        results, meta, took = self._race(serp_delay=5, scrape_delay=0, num=10, deadline=0.3)
+        self.assertLess(took, 1.5)
+        self.assertEqual([it["retailer"] for it in results], ["target", "target"])
+        self.assertEqual(meta["pending"], ["serpapi"])
+        self.assertEqual(meta["cache"], "miss")  # the loser never reported
+
+    def test_race_merges_both_when_they_finish(self):
+        results, meta, _ = self._race(serp_delay=0, scrape_delay=0.05, num=10, deadline=5)
+        self.assertEqual([it["retailer"] for it in results], ["walmart"] * 3 + ["target"] * 2)
+        self.assertEqual(meta["pending"], [])
+
+
+class SearchBatchViewTests(SimpleTestCase):
+    def test_duplicates_share_one_search_and_every_index_gets_a_line(self):
+        from unittest import mock
+        calls = []
+
+        def fake_search(query, retailers):
+            calls.append((query, tuple(retailers)))
+            return [{"retailer": retailers[0], "title": query, "url": f"https://{retailers[0]}.com/{query}"}], \
+                {"cache": "miss"}
+
+        items = [
+            {"query": "Advil 200mg", "retailers": ["walmart", "target"]},
+            {"query": "  advil, 200mg!", "retailers": ["target", "walmart"]},  # same search
+            {"query": "tylenol", "retailers": ["cvs"]},
+            {"query": "ADVIL 200MG", "retailers": ["walmart", "target"]},     # same search again
+            {"query": "?!", "retailers": ["cvs"]},                             # nothing left to search
+        ]
+        with mock.patch("api.search_engine.search", fake_search):
+            resp = self.client.post("/api/search/batch/", {"items": items}, content_type="application/json")
+            lines = [json.loads(l) for l in b"".join(resp.streaming_content).decode().splitlines()]
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(sorted(calls), [("Advil 200mg", ("target", "walmart")), ("tylenol", ("cvs",))])
+        by_index = {l["index"]: l for l in lines}
+        self.assertEqual(sorted(by_index), [0, 1, 2, 3, 4])
+        self.assertEqual(len(lines), 5)
+        for i in (0, 1, 3):
+            self.assertEqual(by_index[i]["results"][0]["title"], "Advil 200mg")
+            self.assertEqual(by_index[i]["retailers"], items[i]["retailers"])  # each line keeps its own input
+        self.assertEqual(by_index[2]["results"][0]["title"], "tylenol")
+        self.assertEqual(by_index[4]["results"], [{"retailer": "search", "error": "empty query"}])
+
+
+class OpenAICacheTests(SimpleTestCase):
+    def setUp(self):
+        from unittest import mock
+        from api import openai_helper
+        from api.cache import TieredCache
+        self.oh = openai_helper
+        p = mock.patch.object(openai_helper, "_cache", TieredCache(maxsize=16))
+        p.start()
+        self.addCleanup(p.stop)
+
+    def test_key_follows_model_and_prompt(self):
+        from unittest import mock
+        base = self.oh._cache_key("Headache and fever")
+        self.assertEqual(self.oh._cache_key("  headache, and FEVER "), base)  # canonical query
+        with self.settings(OPENAI_MODEL="gpt-4o"):
+            self.assertNotEqual(self.oh._cache_key("Headache and fever"), base)
+        with mock.patch.object(self.oh, "SYSTEM", self.oh.SYSTEM + "Be brief.\n"):
+            self.assertNotEqual(self.oh._cache_key("Headache and fever"), base)
+        with mock.patch.object(self.oh, "BATCH_SYSTEM", self.oh.BATCH_SYSTEM + "Be brief.\n"):
+            self.assertNotEqual(self.oh._cache_key("Headache and fever"), base)
+
+    def test_fallback_answers_are_not_cached(self):
+        from unittest import mock
+        answers = [self.oh._fallback_for("headache", TimeoutError()),
+                   {"cleaned_symptoms": ["headache"], "candidate_keywords": ["ibuprofen"],
+                    "categories": ["pain"], "safety_flags": []}]
+        calls = []
+
+        def analyze(query, retries, backoff):
+            calls.append(query)
+            return answers[len(calls) - 1]
+
+        self.assertFalse(self.oh._cacheable(answers[0]))
+        with self.settings(OPENAI_API_KEY="sk-test", OPENAI_BATCH_WINDOW_MS=0), \
+                mock.patch.object(self.oh, "_analyze", analyze):
+            first = self.oh.analyze_symptoms_to_keywords("headache")
+            self.assertIn("fallback_used", first["safety_flags"])
+            self.assertEqual(self.oh.cache_stats()["sets"], 0)
+            second = self.oh.analyze_symptoms_to_keywords("headache")  # asks again: nothing was stored
+            third = self.oh.analyze_symptoms_to_keywords("Headache!")   # served from the cache
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(second, third)
+        self.assertEqual(third["candidate_keywords"], ["ibuprofen"])
+        third["candidate_keywords"].append("mutated")  # callers get copies
+        self.assertEqual(self.oh._get_cache().get(self.oh._cache_key("headache"))[0]["candidate_keywords"], ["ibuprofen"])
+
+
+class OcrCacheTests(SimpleTestCase):
+    """Vision is stubbed: each text_detection call is recorded and answers with a fixed text."""
+
+    def setUp(self):
+        from types import SimpleNamespace
+        from unittest import mock
+        from api import ocr
+        from api.cache import TieredCache
+        self.ocr = ocr
+        self.detections = []
+
+        class Client:
+            def text_detection(client, image):
+                self.detections.append(image.content)
+                return SimpleNamespace(error=SimpleNamespace(message=""),
+                                       text_annotations=[SimpleNamespace(description=" Advil 200mg \n")])
+
+        vision = SimpleNamespace(Image=lambda content: SimpleNamespace(content=content))
+        for target, value in (("_vision", lambda: vision), ("_get_client", lambda: Client()),
+                              ("_cache", TieredCache(maxsize=16))):
+            p = mock.patch.object(ocr, target, value)
+            p.start()
+            self.addCleanup(p.stop)
+
+    @staticmethod
+    def _photo(fmt="PNG", size=(64, 48), quality=90):
+        import io
+        from PIL import Image
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        im = Image.new("L", (64, 48))
+        im.putdata([(x * 4 + y * 2) % 256 for y in range(48) for x in range(64)])  # a gradient with structure
+        buf = io.BytesIO()
+        im.resize(size).save(buf, format=fmt, **({"quality": quality} if fmt == "JPEG" else {}))
+        return SimpleUploadedFile(f"p.{fmt.lower()}", buf.getvalue(), content_type=f"image/{fmt.lower()}")
+
+    def test_same_bytes_are_read_once(self):
+        with self.settings(OCR_CACHE_PHASH=False, OCR_INTAKE=False):
+            self.assertEqual(self.ocr.extract_text_from_image(self._photo()), "Advil 200mg")
+            self.assertEqual(self.ocr.extract_text_from_image(self._photo()), "Advil 200mg")  # same bytes, new upload
+            self.assertEqual(len(self.detections), 1)
+            self.ocr.extract_text_from_image(self._photo(size=(32, 24)))  # different bytes
+            self.assertEqual(len(self.detections), 2)
+
+    def test_reencoded_copy_hits_the_perceptual_hash(self):
+        with self.settings(OCR_CACHE_PHASH=True, OCR_INTAKE=False):
+            self.ocr.extract_text_from_image(self._photo())
+            copy = self._photo("JPEG", size=(128, 96), quality=70)  # resized and re-encoded
+            self.assertEqual(self.ocr.extract_text_from_image(copy), "Advil 200mg")
+            self.assertEqual(len(self.detections), 1)
+            # the copy's own SHA-256 key was filled in, so next time it is an exact hit
+            from api.utils import file_sha256
+            self.assertEqual(self.ocr._get_cache().get("ocr:" + file_sha256(copy)), ("Advil 200mg", "memory"))
+
+    def test_perceptual_hash_is_off_by_default(self):
+        with self.settings(OCR_CACHE_PHASH=False, OCR_INTAKE=False):
+            self.ocr.extract_text_from_image(self._photo())
+            self.ocr.extract_text_from_image(self._photo("JPEG", size=(128, 96), quality=70))
+        self.assertEqual(len(self.detections), 2)
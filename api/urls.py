@@ -1,12 +1,33 @@
+from django.conf import settings
 from django.urls import path
-from .views import SearchProductsAPIView, UploadImageAPIView
-from .views import SymptomSearchAPIView
+from django.views.decorators.csrf import csrf_exempt
+from .views import SearchProductsAPIView, UploadImageAPIView, SearchBatchAPIView
+from .views import SearchStreamAPIView, UploadImageStreamAPIView, UploadImageBatchAPIView
+from .views import SymptomSearchAPIView, HealthAPIView, JobCreateAPIView, JobDetailAPIView
 from .views import SymptomAIResultSerializer
 
 urlpatterns = [
     path('upload/', UploadImageAPIView.as_view(), name='upload-image'),
+    path("upload/stream/", UploadImageStreamAPIView.as_view(), name="upload-image-stream"),
+    path("upload/batch/", UploadImageBatchAPIView.as_view(), name="upload-image-batch"),
     path("ask/", SymptomSearchAPIView.as_view(), name="symptom-ask"),
     path("search/", SearchProductsAPIView.as_view(), name="search-products"),
+    path("search/batch/", SearchBatchAPIView.as_view(), name="search-batch"),
+    path("search/stream/", SearchStreamAPIView.as_view(), name="search-products-stream"),
+    path("jobs/", JobCreateAPIView.as_view(), name="job-create"),
+    path("jobs/<str:job_id>/", JobDetailAPIView.as_view(), name="job-detail"),
+    path("health/", HealthAPIView.as_view(), name="health"),
     # path("ask_local/", SymptomSearchHFAPIView.as_view(), name="symptom-ask-hf"),
 
 ]
+
+# ASGI deployments: serve the hot endpoints from native async views
+if getattr(settings, "ASYNC_VIEWS", False):
+    from .async_views import AsyncSearchProductsView, AsyncUploadImageView, AsyncSymptomSearchView
+
+    _replaced = {"upload-image", "symptom-ask", "search-products"}
+    urlpatterns = [p for p in urlpatterns if p.name not in _replaced] + [
+        path('upload/', csrf_exempt(AsyncUploadImageView.as_view()), name='upload-image'),
+        path("ask/", csrf_exempt(AsyncSymptomSearchView.as_view()), name="symptom-ask"),
+        path("search/", AsyncSearchProductsView.as_view(), name="search-products"),
+    ]
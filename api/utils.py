@@ -1,9 +1,59 @@
-import re
+import hashlib, re
 
 def normalize_query(q: str) -> str:
     q = re.sub(r"[^A-Za-z0-9\s]+", " ", q)
     q = re.sub(r"\s{2,}", " ", q).strip()
     return q
 
+# filler words that don't change what a symptom query asks for; negations stay
+_STOP_WORDS = frozenset("""
+a an the i im ive me my mine we our you your it its is am are was were be been
+have has had having do does did and or but so of to for in on at with about from by
+what which who whom this that these those should could would can will just really very
+please help need want looking look find some any get got lately recently
+""".split())
+
+def canonical_query(q: str) -> str:
+    """Cache-key form of a free-text query: case, punctuation, whitespace and stop-words folded."""
+    q = (q or "").lower().replace("'", "").replace("\u2019", "")
+    words = re.sub(r"[^a-z0-9\s]+", " ", q).split()
+    return " ".join(w for w in words if w not in _STOP_WORDS)
+
 def query_for_url(q: str) -> str:
-    return q.replace(" ", "+")
\ No newline at end of file
+    return q.replace(" ", "+")
+
+def file_sha256(file) -> str:
+    """SHA-256 of an uploaded file, read chunk by chunk; the file is rewound afterwards."""
+    h = hashlib.sha256()
+    file.seek(0)
+    for chunk in file.chunks():
+        h.update(chunk)
+    file.seek(0)
+    return h.hexdigest()
+
+def image_dhash(file, size: int = 8):
+    """
+    Perceptual difference hash (size*size bits, hex) that survives re-encoding,
+    resizing and small exposure changes. None when Pillow is missing or the
+    file isn't a readable image. The file is rewound afterwards.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    try:
+        file.seek(0)
+        with Image.open(file) as im:
+            im.draft("L", (size * 8, size * 8))  # JPEG: decode at a fraction of full size
+            small = im.convert("L").resize((size + 1, size), Image.BILINEAR)
+    except Exception:
+        return None
+    finally:
+        file.seek(0)
+    px = list(small.getdata())
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            i = row * (size + 1) + col
+            bits = (bits << 1) | (px[i] > px[i + 1])
+    return f"{bits:0{size * size // 4}x}"
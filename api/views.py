@@ -1,25 +1,35 @@
-import os
+import json, time
 from dotenv import load_dotenv
 
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.renderers import JSONRenderer
 
 from api.openai_helper import analyze_symptoms_to_keywords
-from api.serializers import SymptomAIResultSerializer, SymptomQuerySerializer
-from .ocr import extract_text_from_image
+from api import ocr, openai_helper, providers_serpapi
+from .resilience import breaker_states
+from api.serializers import SymptomAIResultSerializer, SymptomQuerySerializer, SearchBatchSerializer
+from api.serializers import ResultOptionsSerializer
+from .postprocess import postprocess
+from .image_intake import use_upload_limits
+from .ocr import extract_text_from_image, extract_texts_from_images
+from .persistence import persist_upload, persistence_stats
+from .jobs import QueueFull, get_runner
 
-from .hf_nlp import keywords_from_text
+from .hf_nlp import keywords_from_text, keywords_from_texts
 
-from .providers_serpapi import google_shopping_search
+from .search_engine import SEARCH_NUM, search, iter_batch, iter_search, merge_results
+from .sse import sse_event, EventStreamRenderer, event_stream_response
 
 # helpers to clean user query
 from .utils import normalize_query
 load_dotenv()
 
-SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "serpapi")  # serpapi | scrape | both
-
 class SearchProductsAPIView(APIView):
     """
     GET /api/search/?query=ibuprofen&retailers=walmart,target,cvs
@@ -32,22 +42,118 @@ class SearchProductsAPIView(APIView):
 
         clean = normalize_query(raw)  # "ibuprofen 200mg"
         retailers = [r.strip().lower() for r in request.GET.get("retailers", "walmart,target").split(",") if r.strip()]
+        opts = ResultOptionsSerializer(data=request.GET)
+        opts.is_valid(raise_exception=True)
 
-        # Use SerpAPI (stable). If you want Selenium later, add behind a flag.
-        results = google_shopping_search(clean, retailers)
+        # SEARCH_BACKEND picks SerpAPI (stable), the scrapers, or races both
+        results, meta = search(clean, retailers)
+        results = postprocess(results, **opts.validated_data)  # parsed prices, duplicates collapsed
 
         return Response({
             "keywords": [],           # always [] for GET text search
             "query": clean,           # human-readable text (no "##" junk)
             "retailers": retailers,
-            "results": results
+            "results": results,
+            "cache": meta["cache"],   # hit | miss | bypass
         }, status=200)
 
 
-class UploadImageAPIView(APIView):
+class SearchBatchAPIView(APIView):
+    """
+    POST /api/search/batch/
+    Body: {"items": [{"query": "ibuprofen", "retailers": ["walmart","target"]}, ...], "concurrency": 8}
+    Streams NDJSON, one line per item in completion order, tagged with its input index.
+    Duplicate queries are searched once.
+    """
+    def post(self, request, *args, **kwargs):
+        ser = SearchBatchSerializer(data=request.data)
+        ser.is_valid(raise_exception=True)
+
+        items = []
+        for it in ser.validated_data["items"]:
+            retailers = [r.strip().lower() for r in (it.get("retailers") or ["walmart", "target"]) if r.strip()]
+            items.append((it["query"], retailers))
+
+        def lines():
+            for indices, query, results, meta in iter_batch(items, ser.validated_data.get("concurrency")):
+                for i in indices:
+                    yield json.dumps({
+                        "index": i,
+                        "query": query,
+                        "retailers": items[i][1],
+                        "results": results,
+                        "cache": meta.get("cache"),
+                    }) + "\n"
+
+        return StreamingHttpResponse(lines(), content_type="application/x-ndjson")
+
+
+def _sse_results(query: str, retailers: list, started: float):
+    """One `results` event per retailer as it lands, then a `done` summary."""
+    meta = {}
+    count = 0
+    try:
+        for retailer, items in iter_search(query, retailers, meta):
+            count += sum(1 for it in items if "error" not in it)
+            yield sse_event("results", {"retailer": retailer, "results": items})
+    except Exception as e:
+        yield sse_event("error", {"detail": str(e)})
+    yield sse_event("done", {
+        "count": count,
+        "backend": meta.get("backend"),
+        "cache": meta.get("cache"),
+        "elapsed_ms": int((time.monotonic() - started) * 1000),
+    })
+
+
+class SearchStreamAPIView(APIView):
+    """
+    GET /api/search/stream/?query=ibuprofen&retailers=walmart,target,cvs
+    Server-Sent Events: `query`, then `results` per retailer as they arrive, then `done`.
+    """
+    renderer_classes = (EventStreamRenderer, JSONRenderer)
+
+    def get(self, request):
+        started = time.monotonic()
+        raw = (request.GET.get("query") or "").strip()
+        if not raw:
+            return Response({"detail": "query is required"}, status=400)
+
+        clean = normalize_query(raw)
+        retailers = [r.strip().lower() for r in request.GET.get("retailers", "walmart,target").split(",") if r.strip()]
+
+        def events():
+            yield sse_event("query", {"query": clean, "retailers": retailers, "keywords": []})
+            yield from _sse_results(clean, retailers, started)
+
+        return event_stream_response(events())
+
+
+def _submit_job(request, f, retailers, options):
+    try:
+        job = get_runner().submit(f, retailers, options)
+    except QueueFull as e:
+        return Response({"detail": "Too many jobs queued; retry later."}, status=429,
+                        headers={"Retry-After": str(e.retry_after)})
+    url = request.build_absolute_uri(reverse("job-detail", args=[job["id"]]))
+    return Response({"job_id": job["id"], "status": job["status"], "url": url}, status=202,
+                    headers={"Location": url})
+
+
+class UploadLimitsMixin:
+    """Streams the upload through the size / file-count limits in api.image_intake."""
+    batch_upload = False
+
+    def initialize_request(self, request, *args, **kwargs):
+        use_upload_limits(request, batch=self.batch_upload)
+        return super().initialize_request(request, *args, **kwargs)
+
+
+class UploadImageAPIView(UploadLimitsMixin, APIView):
     """
     POST /api/upload/  (form-data: image=<file>)
     Image → OCR → (optional NER to extract product words) → SerpAPI
+    With ?async=1 this behaves like POST /api/jobs/.
     """
     parser_classes = (MultiPartParser, FormParser)
 
@@ -55,24 +161,146 @@ class UploadImageAPIView(APIView):
         f = request.FILES.get("image")
         if not f:
             return Response({"detail": "Provide image in form-data with key 'image'."}, status=400)
+        opts = ResultOptionsSerializer(data=request.GET)
+        opts.is_valid(raise_exception=True)
+        if request.GET.get("async") in ("1", "true"):
+            retailers = [r.strip().lower() for r in request.GET.get("retailers", "walmart,target,cvs").split(",") if r.strip()]
+            return _submit_job(request, f, retailers, opts.validated_data)
 
         ocr_text = extract_text_from_image(f) or ""
+        persist_upload(f)  # spooled; stored to S3 + DB in the background
         kws = keywords_from_text(ocr_text)  # merge subwords in hf_nlp to avoid "##"
         # Prefer keywords if we got any; else fall back to normalized OCR text
         query_text = normalize_query(" ".join(kws) if kws else ocr_text) or "ibuprofen"
 
         retailers = [r.strip().lower() for r in request.GET.get("retailers", "walmart,target,cvs").split(",") if r.strip()]
-        results = google_shopping_search(query_text, retailers)
+        results, meta = search(query_text, retailers)
+        results = postprocess(results, **opts.validated_data)
 
         return Response({
             "ocr_text": ocr_text,
             "keywords": kws,
             "query": query_text,      # plain text for readability
             "retailers": retailers,
-            "results": results
+            "results": results,
+            "cache": meta["cache"],
         }, status=200)
 
 
+class JobCreateAPIView(UploadLimitsMixin, APIView):
+    """
+    POST /api/jobs/?retailers=walmart,target&sort=price  (form-data: image=<file>)
+    Queues image → OCR → keywords → search and returns 202 with the job id
+    right away; 429 with Retry-After when the queue is full.
+    """
+    parser_classes = (MultiPartParser, FormParser)
+
+    def post(self, request, *args, **kwargs):
+        f = request.FILES.get("image")
+        if not f:
+            return Response({"detail": "Provide image in form-data with key 'image'."}, status=400)
+        opts = ResultOptionsSerializer(data=request.GET)
+        opts.is_valid(raise_exception=True)
+        retailers = [r.strip().lower() for r in request.GET.get("retailers", "walmart,target,cvs").split(",") if r.strip()]
+        return _submit_job(request, f, retailers, opts.validated_data)
+
+
+class JobDetailAPIView(APIView):
+    """
+    GET /api/jobs/<id>/
+    status: queued | running | done | failed; per-stage status and timings;
+    result fills in as stages finish (search results per retailer as they land).
+    """
+    def get(self, request, job_id):
+        job = get_runner().get(job_id)
+        if job is None:
+            return Response({"detail": "Unknown or expired job."}, status=404)
+        return Response(job, status=200)
+
+
+class UploadImageBatchAPIView(UploadLimitsMixin, APIView):
+    """
+    POST /api/upload/batch/  (form-data: images=<file>, images=<file>, ...)
+    Several photos at once: OCR through Vision batch calls, one NER batch,
+    one search per distinct query. Returns per-image results plus everything merged.
+    """
+    parser_classes = (MultiPartParser, FormParser)
+    batch_upload = True  # only this endpoint takes UPLOAD_MAX_FILES images
+
+    def post(self, request, *args, **kwargs):
+        files = request.FILES.getlist("images") or request.FILES.getlist("image")
+        if not files:
+            return Response({"detail": "Provide one or more images in form-data with key 'images'."}, status=400)
+        opts = ResultOptionsSerializer(data=request.GET)
+        opts.is_valid(raise_exception=True)
+        retailers = [r.strip().lower() for r in request.GET.get("retailers", "walmart,target,cvs").split(",") if r.strip()]
+
+        ocr_results = extract_texts_from_images(files)
+        for f in files:
+            persist_upload(f)
+        texts = [text or "" for text, _ in ocr_results]
+        kws = keywords_from_texts(texts)
+
+        images = []
+        for i, f in enumerate(files):
+            query_text = normalize_query(" ".join(dict.fromkeys(kws[i])) if kws[i] else texts[i])
+            images.append({"index": i, "name": f.name, "ocr_text": texts[i], "keywords": kws[i], "query": query_text})
+            if ocr_results[i][1]:
+                images[i]["error"] = ocr_results[i][1]
+
+        # images that boil down to the same query share one search; unreadable ones don't search
+        todo = [i for i, img in enumerate(images) if img["query"]]
+        batches = []
+        for indices, query, results, meta in iter_batch([(images[i]["query"], retailers) for i in todo]):
+            batches.append(results)
+            results = postprocess(results, **opts.validated_data)
+            for j in indices:
+                images[todo[j]].update(results=results, cache=meta.get("cache"))
+
+        return Response({
+            "images": images,
+            "keywords": list(dict.fromkeys(k for ks in kws for k in ks)),
+            "queries": list(dict.fromkeys(images[i]["query"] for i in todo)),
+            "retailers": retailers,
+            # the same product found through different images shows up once, with all its offers
+            "results": postprocess(merge_results(batches, retailers, SEARCH_NUM * max(1, len(batches))),
+                                   **opts.validated_data),
+        }, status=200)
+
+
+class UploadImageStreamAPIView(UploadLimitsMixin, APIView):
+    """
+    POST /api/upload/stream/  (form-data: image=<file>)
+    Server-Sent Events: `ocr`, `keywords`, `query`, `results` per retailer, `done`.
+    """
+    parser_classes = (MultiPartParser, FormParser)
+    renderer_classes = (EventStreamRenderer, JSONRenderer)
+
+    def post(self, request, *args, **kwargs):
+        started = time.monotonic()
+        f = request.FILES.get("image")
+        if not f:
+            return Response({"detail": "Provide image in form-data with key 'image'."}, status=400)
+        retailers = [r.strip().lower() for r in request.GET.get("retailers", "walmart,target,cvs").split(",") if r.strip()]
+
+        # the upload stays open until the response is closed, so OCR can run inside the stream
+        def events():
+            try:
+                ocr_text = extract_text_from_image(f) or ""
+                yield sse_event("ocr", {"ocr_text": ocr_text})
+                persist_upload(f)
+                kws = keywords_from_text(ocr_text)
+                yield sse_event("keywords", {"keywords": kws})
+            except Exception as e:
+                yield sse_event("error", {"detail": str(e)})
+                return
+            query_text = normalize_query(" ".join(kws) if kws else ocr_text) or "ibuprofen"
+            yield sse_event("query", {"query": query_text, "retailers": retailers, "keywords": kws})
+            yield from _sse_results(query_text, retailers, started)
+
+        return event_stream_response(events())
+
+
 class SymptomSearchAPIView(APIView):
     """
     POST /api/ask/
@@ -91,3 +319,22 @@ class SymptomSearchAPIView(APIView):
             "Not medical advice. For persistent or severe symptoms, consult a licensed healthcare professional."
         )
         return Response({"data": data, "disclaimer": disclaimer}, status=status.HTTP_200_OK)
+
+
+class HealthAPIView(APIView):
+    """
+    GET /api/health/
+    Circuit breaker states and cache hit rates, for dashboards and alerts
+    (alert when breakers.openai.state != "closed").
+    """
+    def get(self, request):
+        return Response({
+            "breakers": breaker_states(),
+            "caches": {
+                "serpapi": providers_serpapi.cache_stats(),
+                "openai": openai_helper.cache_stats(),
+                "ocr": ocr.cache_stats(),
+            },
+            "persistence": persistence_stats(),
+            "jobs": get_runner().stats(),
+        }, status=status.HTTP_200_OK)
@@ -0,0 +1,71 @@
+# api/warmup.py
+"""
+Loads the heavy, lazily-imported dependencies ahead of the first request.
+Used by `manage.py warmup_models` and, with WARMUP_ON_START, by a
+background thread when the app starts.
+"""
+import logging, threading, time
+from typing import Callable, Dict, Iterable, Optional
+
+log = logging.getLogger(__name__)
+
+
+def _ner():
+    from .hf_nlp import _get_ner
+    _get_ner()("warm up")
+
+def _cls():
+    from .hf_nlp import _get_cls
+    _get_cls()("warm up")
+
+def _sentiment():
+    from .hugging_face_helper import _get_nlp
+    _get_nlp()("warm up")
+
+def _openai():
+    from .openai_helper import _get_client
+    _get_client()
+
+def _vision():
+    from .ocr import _get_client
+    _get_client()
+
+def _rules():
+    from .symptom_rules import get_matcher
+    get_matcher()
+
+WARMERS: Dict[str, Callable[[], None]] = {
+    "rules": _rules,
+    "openai": _openai,
+    "vision": _vision,
+    "ner": _ner,
+    "cls": _cls,
+    "sentiment": _sentiment,
+}
+DEFAULT = ("rules", "openai", "vision", "ner")  # what the live endpoints use
+
+
+def warmup(names: Optional[Iterable[str]] = None) -> Dict[str, object]:
+    """Run the given warmers (default: DEFAULT); returns seconds or the error per name."""
+    report: Dict[str, object] = {}
+    for name in names or DEFAULT:
+        fn = WARMERS.get(name)
+        if fn is None:
+            report[name] = "unknown"
+            continue
+        t0 = time.perf_counter()
+        try:
+            fn()
+            report[name] = round(time.perf_counter() - t0, 3)
+        except Exception as e:
+            log.warning("warm-up of %s failed: %s", name, e)
+            report[name] = f"error: {e}"
+    return report
+
+
+def start_background_warmup(names: Optional[Iterable[str]] = None) -> threading.Thread:
+    names = list(names or DEFAULT)
+    t = threading.Thread(target=lambda: log.info("warm-up done: %s", warmup(names)),
+                         name="warmup", daemon=True)
+    t.start()
+    return t
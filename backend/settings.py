@@ -73,6 +73,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "backend.wsgi.application"
 
+# Serve search/upload/ask from the native async views (needs an ASGI server)
+ASYNC_VIEWS = config("ASYNC_VIEWS", default=False, cast=bool)
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -148,6 +151,91 @@ AWS_S3_REGION_NAME = 'us-east-2'
 OPENAI_API_KEY = config("OPENAI_API_KEY", default="")
 OPENAI_MODEL = config("OPENAI_MODEL", default="gpt-4o-mini")
 OPENAI_TIMEOUT = config("OPENAI_TIMEOUT", default=20, cast=int) 
+# cache for analyze_symptoms_to_keywords: none | sqlite | django
+OPENAI_CACHE_BACKEND = config("OPENAI_CACHE_BACKEND", default="sqlite")
+OPENAI_CACHE_PATH = config("OPENAI_CACHE_PATH", default=str(BASE_DIR / "cache" / "openai.sqlite3"))
+OPENAI_CACHE_TTL = config("OPENAI_CACHE_TTL", default=7 * 24 * 3600, cast=int)
+OPENAI_CACHE_SIZE = config("OPENAI_CACHE_SIZE", default=1024, cast=int)            # in-process LRU entries
+OPENAI_CACHE_MAX_ENTRIES = config("OPENAI_CACHE_MAX_ENTRIES", default=50000, cast=int)
+# micro-batch distinct queries arriving within this window into one completion (0 = off)
+OPENAI_BATCH_WINDOW_MS = config("OPENAI_BATCH_WINDOW_MS", default=0, cast=int)
+OPENAI_BATCH_MAX = config("OPENAI_BATCH_MAX", default=8, cast=int)
+# per-request budget (seconds) incl. retries; past it the keyword fallback is returned
+OPENAI_DEADLINE = config("OPENAI_DEADLINE", default=10, cast=float)
+OPENAI_MAX_CONCURRENCY = config("OPENAI_MAX_CONCURRENCY", default=16, cast=int)
+# circuit breaker: opens when >= FAILURE_RATE of the last WINDOW calls failed or were slower than SLOW_CALL
+OPENAI_BREAKER_WINDOW = config("OPENAI_BREAKER_WINDOW", default=20, cast=int)
+OPENAI_BREAKER_MIN_CALLS = config("OPENAI_BREAKER_MIN_CALLS", default=5, cast=int)
+OPENAI_BREAKER_FAILURE_RATE = config("OPENAI_BREAKER_FAILURE_RATE", default=0.5, cast=float)
+OPENAI_BREAKER_SLOW_CALL = config("OPENAI_BREAKER_SLOW_CALL", default=8.0, cast=float)
+OPENAI_BREAKER_OPEN_SECONDS = config("OPENAI_BREAKER_OPEN_SECONDS", default=30.0, cast=float)
+OPENAI_BREAKER_HALF_OPEN_PROBES = config("OPENAI_BREAKER_HALF_OPEN_PROBES", default=2, cast=int)
+
+## Image intake: size limit enforced while the upload streams in, then downscale/recompress before OCR
+UPLOAD_MAX_BYTES = config("UPLOAD_MAX_BYTES", default=15 * 1024 * 1024, cast=int)  # per image
+UPLOAD_MAX_FILES = config("UPLOAD_MAX_FILES", default=10, cast=int)                # per request (upload/batch/)
+FILE_UPLOAD_HANDLERS = [
+    # the upload views put api.image_intake.LimitedUploadHandler in front of these
+    "django.core.files.uploadhandler.MemoryFileUploadHandler",
+    "django.core.files.uploadhandler.TemporaryFileUploadHandler",
+]
+OCR_INTAKE = config("OCR_INTAKE", default=True, cast=bool)
+OCR_MAX_SIDE = config("OCR_MAX_SIDE", default=2048, cast=int)        # px, longest side sent to Vision
+OCR_GRAYSCALE = config("OCR_GRAYSCALE", default=False, cast=bool)     # smaller uploads; only if OCR quality holds for your images
+OCR_JPEG_QUALITY = config("OCR_JPEG_QUALITY", default=85, cast=int)
+OCR_BATCH_SIZE = config("OCR_BATCH_SIZE", default=8, cast=int)       # images per batch_annotate_images call (max 16)
+
+## Upload persistence: spooled locally, written to STORAGES["default"] + DB by background threads
+PERSIST_UPLOADS = config("PERSIST_UPLOADS", default=True, cast=bool)
+PERSIST_SPOOL_DIR = config("PERSIST_SPOOL_DIR", default=str(BASE_DIR / "spool"))
+PERSIST_WORKERS = config("PERSIST_WORKERS", default=2, cast=int)
+PERSIST_QUEUE_SIZE = config("PERSIST_QUEUE_SIZE", default=256, cast=int)
+PERSIST_BATCH = config("PERSIST_BATCH", default=20, cast=int)              # rows per bulk insert
+PERSIST_SPOOL_MAX_FILES = config("PERSIST_SPOOL_MAX_FILES", default=5000, cast=int)
+
+## Upload jobs (POST /api/jobs/): in-process workers, state shared through the cache backend
+JOBS_WORKERS = config("JOBS_WORKERS", default=4, cast=int)
+JOBS_QUEUE_SIZE = config("JOBS_QUEUE_SIZE", default=32, cast=int)          # 429 beyond this
+JOBS_TTL = config("JOBS_TTL", default=3600, cast=int)                      # how long finished jobs can be polled
+JOBS_BACKEND = config("JOBS_BACKEND", default="sqlite")                    # sqlite | django (must be shared across workers)
+JOBS_PATH = config("JOBS_PATH", default=str(BASE_DIR / "cache" / "jobs.sqlite3"))
+JOBS_OCR_TIMEOUT = config("JOBS_OCR_TIMEOUT", default=20, cast=float)
+JOBS_NER_TIMEOUT = config("JOBS_NER_TIMEOUT", default=10, cast=float)
+JOBS_SEARCH_TIMEOUT = config("JOBS_SEARCH_TIMEOUT", default=30, cast=float)  # search deadline
+JOBS_STAGE_GRACE = config("JOBS_STAGE_GRACE", default=5, cast=float)          # stage timeout = deadline + this
+JOBS_MAX_ABANDONED = config("JOBS_MAX_ABANDONED", default=JOBS_WORKERS, cast=int)  # timed-out stage threads before 429
+
+## SerpAPI response cache: none | sqlite | django
+SERPAPI_CACHE_BACKEND = config("SERPAPI_CACHE_BACKEND", default="")
+SERPAPI_CACHE_PATH = config("SERPAPI_CACHE_PATH", default=str(BASE_DIR / "cache" / "serpapi.sqlite3"))
+SERPAPI_CACHE_SIZE = config("SERPAPI_CACHE_SIZE", default=512, cast=int)            # in-process LRU entries
+SERPAPI_CACHE_MAX_ENTRIES = config("SERPAPI_CACHE_MAX_ENTRIES", default=20000, cast=int)
+
+## OCR result cache (content-addressed: SHA-256 of the image bytes)
+OCR_CACHE_BACKEND = config("OCR_CACHE_BACKEND", default="sqlite")
+OCR_CACHE_PATH = config("OCR_CACHE_PATH", default=str(BASE_DIR / "cache" / "ocr.sqlite3"))
+OCR_CACHE_TTL = config("OCR_CACHE_TTL", default=30 * 24 * 3600, cast=int)
+OCR_CACHE_SIZE = config("OCR_CACHE_SIZE", default=512, cast=int)                  # in-process LRU entries
+OCR_CACHE_MAX_ENTRIES = config("OCR_CACHE_MAX_ENTRIES", default=100000, cast=int)
+OCR_CACHE_PHASH = config("OCR_CACHE_PHASH", default=False, cast=bool)  # also match near-identical photos (Pillow)
+
+## Symptom -> keyword rules (JSON; edits are picked up without a restart)
+SYMPTOM_RULES_PATH = config("SYMPTOM_RULES_PATH", default=str(BASE_DIR / "api" / "data" / "symptom_rules.json"))
 
 ## Hugging Face
-HF_MODEL = config("HF_MODEL", default="distilbert-base-uncased-finetuned-sst-2-english")
\ No newline at end of file
+HF_MODEL = config("HF_MODEL", default="distilbert-base-uncased-finetuned-sst-2-english")
+# torch = PyTorch fp32; onnx = ONNX Runtime with dynamic int8 quantization (needs optimum[onnxruntime])
+HF_BACKEND = config("HF_BACKEND", default="torch")
+HF_ONNX_DIR = config("HF_ONNX_DIR", default=str(BASE_DIR / "cache" / "onnx"))
+HF_ONNX_QUANT = config("HF_ONNX_QUANT", default="auto")  # auto | avx2 | avx512 | avx512_vnni | arm64
+# NER micro-batching: concurrent keywords_from_text calls within the window share
+# one batch (0 disables; a lone call never waits). Tune with `manage.py bench_ner_batching`.
+HF_NER_BATCH_WINDOW_MS = config("HF_NER_BATCH_WINDOW_MS", default=10, cast=int)
+HF_NER_BATCH_MAX = config("HF_NER_BATCH_MAX", default=16, cast=int)
+HF_NER_SUB_BATCH = config("HF_NER_SUB_BATCH", default=8, cast=int)  # texts per padded forward pass
+
+## Start-up: heavy deps load lazily; optionally warm them in a background thread at boot
+WARMUP_ON_START = config("WARMUP_ON_START", default=False, cast=bool)
+WARMUP_MODELS = config("WARMUP_MODELS", default="rules,openai,vision,ner")
+# import-time budget (seconds) enforced by api.tests.ImportBudgetTests
+IMPORT_BUDGET_SECONDS = config("IMPORT_BUDGET_SECONDS", default=3.0, cast=float)
\ No newline at end of file